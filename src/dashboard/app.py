@@ -1,13 +1,31 @@
 import streamlit as st
 from streamlit_agraph import agraph, Node, Edge, Config
 from elasticsearch import Elasticsearch
-from SPARQLWrapper import SPARQLWrapper, JSON
+from elasticsearch.exceptions import TransportError
+import os
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "semantic_web"))
+from sparql_client import SPARQLClient
+from neighborhood import NeighborhoodService, CONCEPT, ENTITY, TTL as NEIGHBORHOOD_TTL
+from event_search import search_events, FACETS, PAGE_SIZE
+from bm25_index import BM25Index, MANIFEST
+from adjacency import AdjacencyIndex
+from trend_cube import TrendCube, HIERARCHY, GRAINS
+
 # -- Configurations --
 ES_HOST = "http://localhost:9200"
 FUSEKI_HOST = "http://localhost:3030/fda/sparql"
+FUSEKI_UPDATE = "http://localhost:3030/fda/update"
 SKOSMOS_HOST = "http://localhost" # Maps to locahost:80 where skosmos runs
+EVENT_BASE = "http://example.org/resource/event/"
+BM25_INDEX = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                          "data", "processed", "bm25_index")
+ADJACENCY_INDEX = os.path.join(os.path.dirname(BM25_INDEX), "adjacency.npz")
+TREND_CUBE = os.path.join(os.path.dirname(BM25_INDEX), "trend_cube.npz")
+# Graph node colors per neighborhood edge kind
+KIND_COLORS = {CONCEPT: "#33FF57", ENTITY: "#3357FF"} # Green for Concept, Blue for Entity
 
 st.set_page_config(layout="wide", page_title="FDA Quality Graph")
 
@@ -16,9 +34,55 @@ st.set_page_config(layout="wide", page_title="FDA Quality Graph")
 def get_es():
     return Elasticsearch(ES_HOST) # If this fails, check Docker
 
+@st.cache_resource(max_entries=1)
+def get_bm25(mtime):
+    # Memory-mapped, so opening it is cheap. Keyed on the manifest's mtime: a
+    # rebuild or compaction by `bm25_index.py` replaces segments and offsets,
+    # so an index opened before it would read files that no longer exist
+    return BM25Index(BM25_INDEX)
+
+@st.cache_resource(max_entries=1)
+def get_adjacency(mtime):
+    # Keyed on the file's mtime so a rebuilt index is picked up without a
+    # restart; max_entries=1 drops the previous one instead of keeping it
+    return AdjacencyIndex.load(ADJACENCY_INDEX)
+
+@st.cache_resource(max_entries=1)
+def get_trend_cube(mtime):
+    return TrendCube.load(TREND_CUBE)
+
 @st.cache_resource
 def get_sparql():
-    return SPARQLWrapper(FUSEKI_HOST)
+    # Shared across reruns and sessions: pooled connections plus a result cache,
+    # so re-selecting an event does not re-issue its neighborhood query
+    return SPARQLClient(FUSEKI_UPDATE, FUSEKI_HOST)
+
+@st.cache_resource
+def get_neighborhoods():
+    # Entries expire like the page cache below, so a graph refresh is seen
+    return NeighborhoodService(get_sparql(), ttl=NEIGHBORHOOD_TTL)
+
+@st.cache_data(ttl=NEIGHBORHOOD_TTL, max_entries=2000, show_spinner=False)
+def page_neighborhoods(documents):
+    """
+    Neighborhoods of every hit on the result page, fetched together so that
+    switching between reports needs no further round trip.
+    documents is a tuple of (event URI, search document) pairs.
+    """
+    return get_neighborhoods().prefetch([uri for uri, _ in documents], dict(documents))
+
+@st.cache_data(ttl=60, max_entries=500, show_spinner=False)
+def run_search(query, filters, cursor):
+    """
+    One memoized search page per (query, filters, page cursor); filters is a
+    tuple of (field, values) pairs so it can be part of the cache key.
+    Falls back to the embedded BM25 index when Elasticsearch cannot answer.
+    """
+    try:
+        result = search_events(get_es(), query, dict(filters), page_size=PAGE_SIZE, search_after=cursor)
+        return dict(result, backend="elasticsearch")
+    except TransportError:
+        return get_bm25(os.path.getmtime(os.path.join(BM25_INDEX, MANIFEST))).search(query, dict(filters), page_size=PAGE_SIZE, search_after=cursor)
 
 # -- UI --
 st.title("FDA Quality Event Knowledge Graph")
@@ -26,19 +90,67 @@ st.markdown("Unified view of Enforcement Reports, Semantic Graph, and Taxonomy."
 
 # Sidebar Search
 st.sidebar.header("Search")
-query = st.sidebar.text_input("Find events (e.g., 'impurity')", "impurity")
-es = get_es()
+# Text input only reruns on Enter / blur, which debounces keystrokes
+query = st.sidebar.text_input("Find events (e.g., 'impurity')", "impurity").strip()
+
+# Facet selections from the widgets' previous run
+filters = tuple((field, tuple(st.session_state.get(f"facet_{field}", []))) for field in FACETS)
+filters = tuple((field, values) for field, values in filters if values)
 
-if query:
+# Reset pagination whenever the search itself changes
+search_key = (query, filters)
+if st.session_state.get("search_key") != search_key:
+    st.session_state["search_key"] = search_key
+    st.session_state["cursors"] = [None]
+cursors = st.session_state["cursors"]
+
+hits = []
+first = page = None
+try:
+    started = time.perf_counter()
+    first = run_search(query, filters, None)
+    # Cursors are backend specific; start over if the backend changed mid-way
+    if first["backend"] != st.session_state.get("search_backend"):
+        st.session_state["search_backend"] = first["backend"]
+        cursors[:] = [None]
+    page = first if len(cursors) == 1 else run_search(query, filters, tuple(cursors[-1]))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    hits = page["hits"]
+except FileNotFoundError:
+    st.sidebar.error("Elasticsearch not connected and no offline index found.")
+except Exception as e:
+    st.sidebar.error(f"Search failed: {e}")
+
+if first:
+    for field, label in FACETS.items():
+        counts = dict(first["facets"].get(field, []))
+        selected = list(st.session_state.get(f"facet_{field}", []))
+        options = list(counts) + [value for value in selected if value not in counts]
+        st.sidebar.multiselect(label, options, key=f"facet_{field}",
+                               format_func=lambda value, counts=counts: f"{value} ({counts.get(value, 0)})")
+
+    page_number = len(cursors)
+    pages = max(1, -(-first["total"] // PAGE_SIZE))
+    st.sidebar.success(f"Found {first['total']} matching reports (page {page_number} of {pages}).")
+    prev_col, next_col = st.sidebar.columns(2)
+    if prev_col.button("Previous", disabled=page_number == 1):
+        cursors.pop()
+        st.rerun()
+    if next_col.button("Next", disabled=page["next_after"] is None):
+        cursors.append(page["next_after"])
+        st.rerun()
+    if page["backend"] == "bm25":
+        st.sidebar.warning("Elasticsearch unavailable, showing results from the offline index.")
+    st.sidebar.caption(f"{'ES' if page['backend'] == 'elasticsearch' else 'BM25'} took {page['took_ms']} ms, "
+                       f"{page['latency_ms']:.0f} ms round trip ({elapsed_ms:.0f} ms here, memoized pages ~0 ms)")
+
+# Prefetch the graph neighborhoods of the whole result page
+neighborhoods = {}
+if hits:
     try:
-        res = es.search(index="fda_events", body={"query": {"query_string": {"query": query}}}, size=10)
-        hits = res['hits']['hits']
-        st.sidebar.success(f"Found {len(hits)} matching reports.")
+        neighborhoods = page_neighborhoods(tuple((EVENT_BASE + h['_id'], h['_source']) for h in hits))
     except Exception as e:
-        st.sidebar.error("Elasticsearch not connected.")
-        hits = []
-else:
-    hits = []
+        st.sidebar.warning(f"Could not prefetch graph neighborhoods: {e}")
 
 # Selection
 selected_id = None
@@ -71,64 +183,128 @@ if selected_id:
     # 2. Graph View (Semantic)
     with col2:
         st.subheader("Semantic Graph")
-        
-        # SPARQL Query to get neighborhood of this event
         sparql = get_sparql()
-        event_uri = f"http://example.org/resource/event/{selected_id}"
-        
-        # Query: Find direct properties + linked entities
-        q = f"""
-        PREFIX fda: <http://example.org/fda/quality/>
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
-        
-        SELECT ?p ?o ?label ?type WHERE {{
-          <{event_uri}> ?p ?o .
-          OPTIONAL {{ ?o rdfs:label ?label }}
-          OPTIONAL {{ ?o skos:prefLabel ?label }}
-          OPTIONAL {{ ?o fda:entityType ?type }}
-        }}
-        """
-        sparql.setQuery(q)
-        sparql.setReturnFormat(JSON)
-        
-        try:
-            results = sparql.query().convert()
-            
-            # Build Agraph
-            nodes = []
-            edges = []
-            
-            # Add central node
-            nodes.append(Node(id=event_uri, label=selected_id, size=25, color="#FF5733"))
-            
-            added_nodes = {event_uri}
-            
-            for r in results["results"]["bindings"]:
-                p = r["p"]["value"].split("/")[-1].split("#")[-1] # Shorten property
-                o_val = r["o"]["value"]
-                o_label = r.get("label", {}).get("value", o_val.split("/")[-1])
-                o_type = r.get("type", {}).get("value", "Literal")
-                
-                # Determine node color based on type relation
-                color = "#999"
-                if "hasFailureType" in p:
-                    color = "#33FF57" # Green for Concept
-                elif "mentionsEntity" in p:
-                    color = "#3357FF" # Blue for Entity
-                    
-                if o_val not in added_nodes:
-                    nodes.append(Node(id=o_val, label=o_label, size=15, color=color))
-                    added_nodes.add(o_val)
-                    
-                edges.append(Edge(source=event_uri, target=o_val, label=p))
-            
-            config = Config(width=700, height=500, directed=True, nodeHighlightBehavior=True, highlightColor="#F7A7A6")
-            
-            return_value = agraph(nodes=nodes, edges=edges, config=config)
-            
-        except Exception as e:
-            st.error(f"Error querying graph: {e}")
+        event_uri = EVENT_BASE + selected_id
+
+        # Build Agraph
+        nodes = []
+        edges = []
+
+        # Add central node
+        nodes.append(Node(id=event_uri, label=selected_id, size=25, color="#FF5733"))
+
+        added_nodes = {event_uri}
+
+        def add_neighbor(source, o_val, o_label, p, color="#999"):
+            if o_val not in added_nodes:
+                nodes.append(Node(id=o_val, label=o_label, size=15, color=color))
+                added_nodes.add(o_val)
+            edges.append(Edge(source=source, target=o_val, label=p))
+
+        if event_uri in neighborhoods:
+            for p, o_val, o_label, kind in neighborhoods[event_uri]:
+                add_neighbor(event_uri, o_val, o_label, p, KIND_COLORS.get(kind, "#999"))
+        else:
+            try:
+                for p, o_val, o_label, kind in get_neighborhoods().get(event_uri, record):
+                    add_neighbor(event_uri, o_val, o_label, p, KIND_COLORS.get(kind, "#999"))
+            except Exception as e:
+                st.error(f"Error querying graph: {e}")
+
+        # Multi-hop exploration is the only per-click graph query left
+        if st.checkbox("Show other events mentioning the same entities (SPARQL)"):
+            q = f"""
+            PREFIX fda: <http://example.org/fda/quality/>
+
+            SELECT ?entity ?other WHERE {{
+              <{event_uri}> fda:mentionsEntity ?entity .
+              ?other fda:mentionsEntity ?entity .
+              FILTER (?other != <{event_uri}>)
+            }} LIMIT 100
+            """
+            try:
+                results = sparql.query(q, strict=True)
+                for r in results["results"]["bindings"]:
+                    entity = r["entity"]["value"]
+                    if entity not in added_nodes:
+                        add_neighbor(event_uri, entity, entity.split("/")[-1], "mentionsEntity", "#3357FF")
+                    add_neighbor(entity, r["other"]["value"], r["other"]["value"].split("/")[-1],
+                                 "mentionedBy", "#FFA533")
+            except Exception as e:
+                st.error(f"Error querying graph: {e}")
+
+        config = Config(width=700, height=500, directed=True, nodeHighlightBehavior=True, highlightColor="#F7A7A6")
+
+        return_value = agraph(nodes=nodes, edges=edges, config=config)
+
+        stats = sparql.cache_stats()
+        if stats and stats["hits"] + stats["misses"]:
+            st.caption(f"SPARQL cache: {stats['hit_rate']:.0%} hit rate "
+                       f"({stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries)")
+        stats = get_neighborhoods().stats()
+        st.caption(f"Neighborhood cache: {stats['entries']} events, {stats['hit_rate']:.0%} hit rate, "
+                   f"{stats['queries']} batched SPARQL queries")
+
+    # 3. Related Events (adjacency index, no SPARQL)
+    st.subheader("Related Events")
+    try:
+        adjacency = get_adjacency(os.path.getmtime(ADJACENCY_INDEX))
+        started = time.perf_counter()
+        related = adjacency.related_events(event_uri, limit=15)
+        cooccurring = adjacency.cooccurring(event_uri, limit=10)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if related:
+            st.dataframe([{
+                "Event": r["uri"].rsplit("/", 1)[-1],
+                "Firm": r["label"],
+                "Score": round(r["score"], 2),
+                "Shared": ", ".join(f["label"] for f in r["shared"]),
+            } for r in related], use_container_width=True)
+        else:
+            st.write("No other event shares an entity or failure type with this one.")
+        if cooccurring:
+            st.markdown("**Most common alongside this event's entities:** " + ", ".join(
+                f"{c['label']} ({c['events']})" for c in cooccurring))
+        st.caption(f"Adjacency index: {elapsed_ms:.1f} ms")
+    except FileNotFoundError:
+        st.info("Related events need the adjacency index: run `python3 src/semantic_web/adjacency.py`.")
+    except KeyError:
+        st.write("This event is not in the adjacency index yet.")
 
 else:
     st.info("Select an event from the sidebar to visualize.")
+
+# -- Trends (materialized cube, independent of the search) --
+st.header("Trends")
+try:
+    cube = get_trend_cube(os.path.getmtime(TREND_CUBE))
+except FileNotFoundError:
+    cube = None
+    st.info("Trend panels need the trend cube: run `python3 src/semantic_web/trend_cube.py`.")
+
+if cube:
+    # Drill path: [(dimension, value)] from the top of HIERARCHY down
+    drill = st.session_state.setdefault("trend_drill", [])
+    where = dict(drill)
+    breakdown = HIERARCHY[len(drill)] if len(drill) < len(HIERARCHY) else None
+
+    path = " › ".join(["All recalls"] + [value for _, value in drill])
+    grain_col, drill_col, up_col = st.columns([1, 2, 1])
+    grain = grain_col.selectbox("Granularity", list(GRAINS), key="trend_grain")
+    if breakdown:
+        choices = [value for value, _ in cube.top_values(breakdown, where, limit=50)]
+        target = drill_col.selectbox(f"Drill into {breakdown.replace('_', ' ')}", [""] + choices,
+                                     key=f"trend_target_{len(drill)}")
+        if target:
+            drill.append((breakdown, target))
+            st.rerun()
+    if up_col.button("Roll up", disabled=not drill):
+        drill.pop()
+        st.rerun()
+
+    st.markdown(f"**{path}**" + (f", by {breakdown.replace('_', ' ')}" if breakdown else ""))
+    started = time.perf_counter()
+    trend = cube.series(by=breakdown, where=where, grain=grain, limit=8)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    st.line_chart(trend)
+    st.caption(f"{int(trend.to_numpy().sum())} recalls, rolled up from the trend cube in {elapsed_ms:.1f} ms")
@@ -0,0 +1,99 @@
+import random
+import time
+
+from openfda_connector import extract_batch, extract_fields, _classify, FAILURE_TYPES
+from openfda_stub_server import make_records
+
+# Microbenchmark for failure-type classification: the original sequential
+# any() keyword scans versus the compiled probe table, on synthetic reasons.
+
+WORDS = [
+    "tablets", "lot", "distributed", "specification", "dissolution", "label",
+    "ndma", "assay", "stability", "particulate", "matter", "potency", "out",
+    "of", "product", "recall", "presence", "found", "vials", "customer",
+    "impurity", "impurities", "contamination", "sterility", "sterile",
+    "microbial", "cgmp", "gmp", "batch", "failed",
+]
+KEYWORDS = set(WORDS[-10:])
+
+
+def legacy_failure_type(reason):
+    """The original if/elif classifier, kept as the reference implementation."""
+    failure_type = "Other Quality Issue"
+    lower_reason = reason.lower()
+
+    if any(x in lower_reason for x in ["impurity", "impurities", "contamination"]):
+        failure_type = "Impurity/Contamination"
+    elif any(x in lower_reason for x in ["sterility", "sterile", "microbial"]):
+        failure_type = "Sterility Issue"
+    elif any(x in lower_reason for x in ["cgmp", "gmp"]):
+        failure_type = "CGMP Violation"
+    elif "batch" in lower_reason:
+        failure_type = "Batch Record Issue"
+    elif "failed" in lower_reason:
+        failure_type = "Specification Failure"
+    return failure_type
+
+
+def make_reasons(count, seed=0):
+    """Synthetic reasons: mostly keyword-free prose with a few mixed-case keywords."""
+    rng = random.Random(seed)
+    plain = [w for w in WORDS if w not in KEYWORDS]
+    reasons = []
+    for _ in range(count):
+        words = rng.choices(plain, k=rng.randint(6, 30))
+        for _ in range(rng.choice([0, 0, 1, 1, 2])):
+            keyword = rng.choice(WORDS[-10:])
+            words.insert(rng.randrange(len(words) + 1), keyword.upper() if rng.random() < 0.3 else keyword)
+        if rng.random() < 0.05:
+            words.append("cGMPfailedbatch")
+        reasons.append(" ".join(words).capitalize())
+    return reasons
+
+
+def make_templated_reasons(count, distinct=20000, seed=0):
+    """Synthetic reasons drawn from a pool of boilerplate narratives, like the real corpus."""
+    rng = random.Random(seed)
+    pool = make_reasons(distinct, seed=seed + 1)
+    weights = [1.0 / (rank + 1) for rank in range(distinct)]
+    return rng.choices(pool, weights=weights, k=count)
+
+
+def timed(label, fn, count):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:7.2f}s  {count / elapsed / 1e6:6.2f}M reasons/s")
+    return result, elapsed
+
+
+def run(label, reasons, page_size):
+    count = len(reasons)
+    print(f"\n{label}: {count} reasons, {len(set(reasons))} distinct")
+
+    legacy, legacy_s = timed("legacy any() scans", lambda: [legacy_failure_type(r) for r in reasons], count)
+    compiled, compiled_s = timed("compiled probe table", lambda: [FAILURE_TYPES[_classify(r.lower())] for r in reasons], count)
+    assert compiled == legacy, "Compiled classifier disagrees with the legacy rules"
+    print(f"Labels identical; per-reason speedup {legacy_s / compiled_s:.2f}x")
+
+    records = make_records(count)
+    for record, reason in zip(records, reasons):
+        record["reason_for_recall"] = reason
+    pages = [records[i:i + page_size] for i in range(0, len(records), page_size)]
+    _, dict_s = timed("extract_fields (dicts)", lambda: [[extract_fields(r) for r in page] for page in pages], count)
+    batches, batch_s = timed("extract_batch (columnar)", lambda: [extract_batch(page) for page in pages], count)
+    assert [FAILURE_TYPES[c] for b in batches for c in b.columns["failure_type"]] == legacy
+    print(f"Batch extraction speedup {dict_s / batch_s:.2f}x")
+
+
+def main(count=1_000_000, page_size=1000):
+    run("Unique reasons", make_reasons(count), page_size)
+    run("Templated reasons", make_templated_reasons(count), page_size)
+
+    sample = make_records(5000)
+    batch = extract_batch(sample)
+    assert list(batch.to_records()) == [extract_fields(r) for r in sample]
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,26 @@
 import requests
 import json
 import os
+import time
+import hashlib
+import argparse
+import sys
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
 
 # Configuration
-API_URL = "https://api.fda.gov/drug/enforcement.json"
-LIMIT = 200
+API_URL = os.environ.get("OPENFDA_API_URL", "https://api.fda.gov/drug/enforcement.json")
+API_KEY = os.environ.get("OPENFDA_API_KEY")
+LIMIT = 1000  # openFDA maximum page size
+MAX_SKIP = 25000  # openFDA rejects skip beyond this; deeper pages need search_after
+MAX_WORKERS = 4
+RATE_LIMIT = 4.0  # requests/sec (openFDA allows 240 requests/min per key)
+MAX_RETRIES = 5
+BACKOFF = 0.5  # seconds, doubled on every retry
+TIMEOUT = 30
 SEARCH_TERMS = [
     "reason_for_recall:impurity",
     "reason_for_recall:impurities",
@@ -22,47 +38,293 @@ SEARCH_TERMS = [
 # Script is in src/ingestion/, data is in data/raw/
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DATA_DIR = os.path.join(BASE_DIR, "data", "raw")
-OUTPUT_FILE = os.path.join(DATA_DIR, "fda_quality_events.json")
+OUTPUT_FILE = os.path.join(DATA_DIR, "fda_quality_events.jsonl")
+STATE_FILE = os.path.join(DATA_DIR, "ingestion_state.json")
+CHANGESET_FILE = os.path.join(DATA_DIR, "fda_quality_events.changeset.json")
 
-def fetch_data():
+# Incremental runs re-fetch this many days before the watermark so that records
+# updated after they were first reported (e.g. status changes) are picked up.
+LOOKBACK_DAYS = 30
+
+# The raw JSONL reader/writer and the HTTP retry helper are shared with the semantic_web stages
+sys.path.insert(0, os.path.join(BASE_DIR, "src", "semantic_web"))
+from record_io import append_records, iter_records, write_records
+from http_retry import retry_delay
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to keep all workers under the API rate limit.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def create_session(pool_size=MAX_WORKERS):
+    """Creates a keep-alive session whose connection pool fits all workers."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_page(session, params, bucket, api_url=API_URL, retries=MAX_RETRIES, backoff=BACKOFF):
+    """
+    Fetches a single page, retrying transient failures with exponential backoff.
+    Returns (payload, next_url). openFDA answers 404 when nothing matches.
+    """
+    if API_KEY:
+        params = dict(params, api_key=API_KEY)
+
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            response = session.get(api_url, params=params, timeout=TIMEOUT)
+            if response.status_code == 404:
+                return {"meta": {"results": {"total": 0}}, "results": []}, None
+            if response.status_code not in RETRY_STATUS:
+                response.raise_for_status()
+                return response.json(), response.links.get("next", {}).get("url")
+            delay = retry_delay(response, backoff * (2 ** attempt))
+            error = f"HTTP {response.status_code}"
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            delay = backoff * (2 ** attempt)
+            error = e
+
+        if attempt < retries:
+            print(f"Retrying page {params.get('skip', 0)} in {delay:.1f}s ({error})")
+            time.sleep(delay)
+
+    raise requests.exceptions.RetryError(f"Giving up after {retries} retries: {error}")
+
+
+def _search_after(next_url):
+    """Extracts the search_after cursor from an openFDA Link: rel=next URL."""
+    values = parse_qs(urlparse(next_url).query).get("search_after")
+    return values[0] if values else None
+
+
+def fetch_all(search=None, api_url=API_URL, page_size=LIMIT, max_workers=MAX_WORKERS,
+              rate=RATE_LIMIT, max_records=None):
+    """
+    Fetches every matching record.
+
+    Result sets that fit under openFDA's skip ceiling are fetched concurrently as
+    skip/limit pages; larger ones are walked with search_after cursors, which are
+    inherently sequential. Returns (results, stats).
+    """
+    search = search if search is not None else " OR ".join(SEARCH_TERMS)
+    bucket = TokenBucket(rate)
+    started = time.monotonic()
+    pages = 0
+
+    with create_session(max_workers) as session:
+        first, next_url = fetch_page(session, {"search": search, "limit": page_size}, bucket, api_url)
+        pages += 1
+        total = first.get("meta", {}).get("results", {}).get("total", len(first["results"]))
+        if max_records is not None:
+            total = min(total, max_records)
+        results = list(first["results"])
+
+        if total <= MAX_SKIP + page_size:
+            offsets = range(page_size, total, page_size)
+            print(f"Fetching {len(offsets)} more pages with {max_workers} workers...")
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = [
+                    pool.submit(fetch_page, session,
+                                {"search": search, "limit": page_size, "skip": skip},
+                                bucket, api_url)
+                    for skip in offsets
+                ]
+                # Collect in submission order so output order is deterministic
+                for future in futures:
+                    payload, _ = future.result()
+                    results.extend(payload["results"])
+                    pages += 1
+        else:
+            print(f"{total} results exceed skip limit, paging with search_after cursors...")
+            while next_url and len(results) < total:
+                cursor = _search_after(next_url)
+                if not cursor:
+                    break
+                params = {"search": search, "limit": page_size, "search_after": cursor}
+                payload, next_url = fetch_page(session, params, bucket, api_url)
+                if not payload["results"]:
+                    break
+                results.extend(payload["results"])
+                pages += 1
+
+    results = results[:total]
+    elapsed = max(time.monotonic() - started, 1e-9)
+    stats = {
+        "pages": pages,
+        "records": len(results),
+        "seconds": elapsed,
+        "pages_per_sec": pages / elapsed,
+        "records_per_sec": len(results) / elapsed,
+    }
+    print(f"Fetched {stats['records']} records in {stats['pages']} pages "
+          f"({stats['pages_per_sec']:.1f} pages/s, {stats['records_per_sec']:.0f} records/s)")
+    return results, stats
+
+
+def fetch_data(search=None):
     """Fetches data from openFDA API."""
     # Construct query: (term1) OR (term2) ...
     # requests will URL-encode the spaces to + or %20 which is acceptable
-    search_query = " OR ".join(SEARCH_TERMS)
-    
-    params = {
-        "search": search_query,
-        "limit": LIMIT
-    }
-    
     print(f"Fetching data from {API_URL}...")
     try:
-        response = requests.get(API_URL, params=params)
-        response.raise_for_status()
-        return response.json()
+        results, _ = fetch_all(search)
+        return {"results": results}
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data: {e}")
         return None
 
+# Failure-type rule table: the first rule (in order) with any keyword occurring
+# in the lower-cased reason wins; records matching no rule get DEFAULT_FAILURE_TYPE.
+FAILURE_TYPE_RULES = [
+    ("Impurity/Contamination", ["impurity", "impurities", "contamination"]),
+    ("Sterility Issue", ["sterility", "sterile", "microbial"]),
+    ("CGMP Violation", ["cgmp", "gmp"]),
+    ("Batch Record Issue", ["batch"]),
+    ("Specification Failure", ["failed"]),
+]
+DEFAULT_FAILURE_TYPE = "Other Quality Issue"
+
+FIELDS = [
+    "event_id", "recall_number", "recalling_firm", "status", "classification",
+    "reason_for_recall", "product_description", "failure_type", "report_date",
+    "country", "state", "city"
+]
+# Low-cardinality columns are dictionary-encoded into integer arrays in a RecordBatch
+CATEGORICAL_FIELDS = ["status", "classification", "failure_type", "country", "state"]
+
+
+def compile_failure_classifier(rules=FAILURE_TYPE_RULES, default=DEFAULT_FAILURE_TYPE):
+    """
+    Compiles the rule table into a flat, priority-ordered probe table.
+
+    Each keyword is paired with its rule index and the first keyword found in
+    the reason decides the label, which is exactly the sequential if/elif
+    semantics. Keywords that contain an earlier-or-equal-priority keyword
+    (e.g. "cgmp" after "gmp") can never change the outcome and are dropped.
+    Returns (classify, labels) where classify maps a lower-cased reason to an
+    index into labels.
+    """
+    probes = []
+    for index, (_, words) in enumerate(rules):
+        for word in sorted({w.lower() for w in words}, key=len):
+            if not any(other in word for other, _ in probes):
+                probes.append((word, index))
+    probes = tuple(probes)
+    labels = [label for label, _ in rules] + [default]
+    default_index = len(rules)
+
+    def classify(lower_reason):
+        for word, index in probes:
+            if word in lower_reason:
+                return index
+        return default_index
+
+    return classify, labels
+
+
+_classify, FAILURE_TYPES = compile_failure_classifier()
+
+
+def classify_failure_type(reason):
+    """Maps a recall reason to its failure type label."""
+    return FAILURE_TYPES[_classify(reason.lower())]
+
+
+class RecordBatch:
+    """
+    Columnar page of extracted records.
+
+    Categorical columns are stored as array('H') codes into a per-column
+    vocabulary; the remaining columns are plain per-field lists.
+    """
+
+    def __init__(self):
+        self.vocab = {name: {} for name in CATEGORICAL_FIELDS}
+        self.columns = {
+            name: array("H") if name in self.vocab else []
+            for name in FIELDS
+        }
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def labels(self, name):
+        """Returns the vocabulary of a categorical column, indexed by code."""
+        return list(self.vocab[name])
+
+    def column(self, name):
+        """Returns a column decoded to Python values."""
+        if name in self.vocab:
+            labels = self.labels(name)
+            return [labels[code] for code in self.columns[name]]
+        return self.columns[name]
+
+    def to_records(self):
+        """Yields the batch as extract_fields()-style dicts."""
+        decoded = [self.column(name) for name in FIELDS]
+        for row in zip(*decoded):
+            yield dict(zip(FIELDS, row))
+
+
+def _dictionary_encode(values):
+    """Returns (vocab, codes) with vocab mapping each distinct value to its code."""
+    vocab = {value: code for code, value in enumerate(dict.fromkeys(values))}
+    return vocab, array("H", map(vocab.__getitem__, values))
+
+def extract_batch(records, classify=_classify, labels=FAILURE_TYPES):
+    """Extracts a page of API records into a columnar RecordBatch."""
+    batch = RecordBatch()
+    cols = batch.columns
+
+    reasons = [r.get("reason_for_recall", "") for r in records]
+    cols["reason_for_recall"] = reasons
+    cols["product_description"] = [r.get("product_description", "") for r in records]
+    for name in ("event_id", "recall_number", "recalling_firm", "report_date", "city"):
+        cols[name] = [r.get(name) for r in records]
+
+    # Failure-type codes are classifier indices, so the vocabulary is the label table.
+    # Recall reasons are heavily templated, so each distinct text is classified once.
+    batch.vocab["failure_type"] = {label: i for i, label in enumerate(labels)}
+    memo = {reason: classify(reason.lower()) for reason in dict.fromkeys(reasons)}
+    cols["failure_type"] = array("H", map(memo.__getitem__, reasons))
+    for name in ("status", "classification", "country", "state"):
+        batch.vocab[name], cols[name] = _dictionary_encode([r.get(name) for r in records])
+
+    batch.length = len(reasons)
+    return batch
+
 def extract_fields(record):
     """Extracts relevant fields from a single API record."""
     reason = record.get("reason_for_recall", "")
     desc = record.get("product_description", "")
-    
-    # Simple logic to determine failure type base on matched keyword in reason
-    failure_type = "Other Quality Issue"
-    lower_reason = reason.lower()
-    
-    if any(x in lower_reason for x in ["impurity", "impurities", "contamination"]):
-        failure_type = "Impurity/Contamination"
-    elif any(x in lower_reason for x in ["sterility", "sterile", "microbial"]):
-        failure_type = "Sterility Issue"
-    elif any(x in lower_reason for x in ["cgmp", "gmp"]):
-        failure_type = "CGMP Violation"
-    elif "batch" in lower_reason:
-        failure_type = "Batch Record Issue"
-    elif "failed" in lower_reason:
-         failure_type = "Specification Failure"
 
     return {
         "event_id": record.get("event_id"),
@@ -72,29 +334,166 @@ def extract_fields(record):
         "classification": record.get("classification"),
         "reason_for_recall": reason,
         "product_description": desc,
-        "failure_type": failure_type,
+        "failure_type": classify_failure_type(reason),
         "report_date": record.get("report_date"),
         "country": record.get("country"),
         "state": record.get("state"),
         "city": record.get("city")
     }
 
-def main():
-    data = fetch_data()
+def record_key(record):
+    """Upsert key of an extracted record: (event_id, recall_number)."""
+    return f"{record.get('event_id')}|{record.get('recall_number')}"
+
+def content_hash(record):
+    """Stable hash of an extracted record, used to detect changed records."""
+    payload = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_state(path=STATE_FILE):
+    """Loads the ingestion watermark and per-record hashes of the previous run."""
+    if not os.path.exists(path):
+        return {"watermark": None, "hashes": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_state(state, path=STATE_FILE):
+    with open(path, "w") as f:
+        json.dump(state, f)
+
+def incremental_search(watermark, lookback_days=LOOKBACK_DAYS):
+    """Restricts the search to records reported on or after the watermark (minus lookback)."""
+    base = " OR ".join(SEARCH_TERMS)
+    if not watermark:
+        return base
+    since = datetime.strptime(watermark, "%Y%m%d") - timedelta(days=lookback_days)
+    return f"({base}) AND report_date:[{since:%Y%m%d} TO 99991231]"
+
+def compute_changeset(records, previous_hashes, full=False):
+    """
+    Diffs freshly extracted records against the previous run's hashes.
+    Removals can only be detected on a full fetch; incremental fetches see a window.
+    Returns (changeset, hashes) where hashes is the updated key -> hash map.
+    """
+    hashes = {} if full else dict(previous_hashes)
+    added, changed = [], []
+    for record in records:
+        key = record_key(record)
+        digest = content_hash(record)
+        previous = previous_hashes.get(key)
+        if previous is None:
+            added.append(key)
+        elif previous != digest:
+            changed.append(key)
+        hashes[key] = digest
+
+    removed = [key for key in previous_hashes if key not in hashes] if full else []
+    return {"added": added, "changed": changed, "removed": removed}, hashes
+
+def upsert_records(existing, records, removed=()):
+    """
+    Streams the existing corpus with new/changed records merged in by record_key.
+    Only the delta is held in memory; unchanged records pass straight through.
+    """
+    delta = {record_key(r): r for r in records}
+    removed = set(removed)
+    for record in existing:
+        key = record_key(record)
+        if key in removed:
+            continue
+        yield delta.pop(key, record)
+    yield from delta.values()
+
+def _write_changeset(changeset):
+    with open(CHANGESET_FILE, "w") as f:
+        json.dump(changeset, f, indent=4)
+
+def _unchanged(state):
+    """
+    Changeset of an incremental fetch that found nothing new. The corpus and
+    the state are left alone, and the fetch ID does not move: the changeset
+    leads from the last fetch to itself, so stages that applied it stay in sync.
+    """
+    changeset = {"added": [], "changed": [], "removed": [], "watermark": state["watermark"],
+                 "fetch_id": state.get("fetch_id"), "previous_fetch_id": state.get("fetch_id"),
+                 "full": False, "records": []}
+    _write_changeset(changeset)
+    print(f"No new or changed records; corpus and state left as they were (watermark {state['watermark']})")
+    return changeset
+
+def ingest(full=False, output_file=OUTPUT_FILE):
+    """
+    Fetches new records (or everything when full), upserts them into the raw
+    corpus and writes the changeset. Returns the changeset, or None on failure.
+    """
+    state = load_state()
+    full = full or not state.get("watermark") or not os.path.exists(output_file)
+    search = None if full else incremental_search(state["watermark"])
+    if not full:
+        print(f"Incremental fetch since watermark {state['watermark']} (lookback {LOOKBACK_DAYS} days)")
+
+    data = fetch_data(search)
     
     if data and "results" in data:
         results = data["results"]
         print(f"Found {len(results)} records.")
         
-        extracted_data = [extract_fields(r) for r in results]
-        
-        # Save to file
-        with open(OUTPUT_FILE, "w") as f:
-            json.dump(extracted_data, f, indent=4)
+        extracted_data = list(extract_batch(results).to_records())
+        changeset, hashes = compute_changeset(extracted_data, state.get("hashes", {}), full=full)
+        dates = [r["report_date"] for r in extracted_data if r.get("report_date")]
+
+        if not full:
+            delta_keys = set(changeset["added"]) | set(changeset["changed"])
+            delta = [r for r in extracted_data if record_key(r) in delta_keys]
+            if not delta:
+                return _unchanged(state)
+
+        # Save to file (one JSON record per line). Incremental runs with only
+        # new records append them; changed records need the corpus rewritten.
+        # The state records the corpus size it matches, so records appended by
+        # a run that failed before saving the state are cut off and re-fetched.
+        corpus_size = state.get("corpus_size")
+        if full:
+            saved = write_records(output_file, extracted_data)
+        elif (not changeset["changed"] and output_file.endswith(".jsonl") and corpus_size is not None
+              and os.path.getsize(output_file) >= corpus_size):
+            saved = append_records(output_file, delta, expected_size=corpus_size)
+        else:
+            saved = write_records(output_file, upsert_records(iter_records(output_file), delta))
+
+        # Fetch IDs chain the changesets, so a consumer can tell whether it
+        # applied the previous one or missed a delta and must rebuild
+        previous_fetch_id = state.get("fetch_id")
+        state = {"watermark": max(dates + [state.get("watermark") or ""]) or None, "hashes": hashes,
+                 "fetch_id": datetime.now().strftime("%Y%m%dT%H%M%S.%f"),
+                 "corpus_size": os.path.getsize(output_file)}
+        changeset["watermark"] = state["watermark"]
+        changeset["fetch_id"] = state["fetch_id"]
+        changeset["previous_fetch_id"] = previous_fetch_id
+        changeset["full"] = full
+        if not full:
+            # The delta itself, so consumers can refresh without rescanning the corpus
+            changeset["records"] = delta
+        _write_changeset(changeset)
+        save_state(state)
         
-        print(f"Successfully saved {len(extracted_data)} records to {OUTPUT_FILE}")
+        print(f"Successfully saved {saved} records to {output_file}")
+        print(f"Changeset: {len(changeset['added'])} added, {len(changeset['changed'])} changed, "
+              f"{len(changeset['removed'])} removed (watermark {state['watermark']})")
+        return changeset
     else:
         print("No results found or error occurred.")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch openFDA drug enforcement quality events.")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-download the whole corpus instead of only records past the watermark")
+    parser.add_argument("--output", default=OUTPUT_FILE,
+                        help="Raw JSONL output; use a .jsonl.gz or .jsonl.zst suffix to compress")
+    args = parser.parse_args()
+
+    ingest(full=args.full, output_file=args.output)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,165 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+# Offline stand-in for the openFDA enforcement endpoint.
+# Serves synthetic records with the same skip/limit, search_after (Link header)
+# and 404-on-empty semantics as api.fda.gov, and can inject 429/503 responses
+# so the fetcher's throttling and retry paths can be exercised without network.
+
+MAX_SKIP = 25000
+REASONS = [
+    "Presence of impurities: NDMA above acceptable limit",
+    "Lack of Assurance of Sterility",
+    "CGMP Deviations: products manufactured under practices not in compliance",
+    "Failed Dissolution Specifications",
+    "Batch record discrepancies identified during review",
+    "Microbial contamination of non-sterile products",
+    "Labeling: incorrect strength on carton",
+]
+FIRMS = ["Acme Pharma Inc.", "Globex Labs LLC", "Initech Generics", "Umbrella Health Corp."]
+STATES = ["NJ", "NY", "CA", "TX", "PA", "NC"]
+
+
+def make_records(count, seed=0):
+    """Builds a deterministic synthetic enforcement corpus."""
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        records.append({
+            "event_id": str(80000 + i),
+            "recall_number": f"D-{i:05d}-2024",
+            "recalling_firm": rng.choice(FIRMS),
+            "status": rng.choice(["Ongoing", "Terminated", "Completed"]),
+            "classification": rng.choice(["Class I", "Class II", "Class III"]),
+            "reason_for_recall": rng.choice(REASONS),
+            "product_description": f"Product {i}, tablets, 10 mg, NDC 0000-{i:04d}",
+            "report_date": f"2024{1 + i % 12:02d}{1 + i % 28:02d}",
+            "country": "United States",
+            "state": rng.choice(STATES),
+            "city": "Springfield",
+        })
+    return records
+
+
+class StubOpenFDAServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the synthetic corpus and fault-injection knobs.
+    """
+    daemon_threads = True
+
+    def __init__(self, records, host="127.0.0.1", port=0, error_rate=0.0, latency=0.0):
+        super().__init__((host, port), StubOpenFDAHandler)
+        self.records = records
+        self.error_rate = error_rate
+        self.latency = latency
+        self.requests_served = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/drug/enforcement.json"
+
+
+class StubOpenFDAHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled sessions are reused
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests_served += 1
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(random.choice([429, 503]), {"error": {"code": "SERVER_ERROR"}},
+                       {"Retry-After": "0"})
+            return
+
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        limit = int(params.get("limit", 1))
+        if "search_after" in params:
+            start = int(params["search_after"])
+        else:
+            start = int(params.get("skip", 0))
+            if start > MAX_SKIP:
+                self._send(400, {"error": {"code": "BAD_REQUEST", "message": "Skip value must be 25000 or less."}})
+                return
+
+        page = server.records[start:start + limit]
+        if not page:
+            self._send(404, {"error": {"code": "NOT_FOUND", "message": "No matches found!"}})
+            return
+
+        headers = {}
+        end = start + len(page)
+        if end < len(server.records):
+            next_params = {k: v for k, v in params.items() if k != "skip"}
+            next_params["search_after"] = str(end)
+            headers["Link"] = f'<{server.url}?{urlencode(next_params)}>; rel="next"'
+
+        self._send(200, {
+            "meta": {"results": {"skip": start, "limit": limit, "total": len(server.records)}},
+            "results": page,
+        }, headers)
+
+
+def start_server(records, **kwargs):
+    """Starts the stub on a background thread and returns the server."""
+    server = StubOpenFDAServer(records, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    import argparse
+    from openfda_connector import fetch_all
+
+    parser = argparse.ArgumentParser(description="Offline openFDA stand-in and fetcher benchmark.")
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=200.0)
+    parser.add_argument("--serve", action="store_true", help="Only serve, do not run the benchmark")
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    server = start_server(records, error_rate=args.error_rate, latency=args.latency)
+    print(f"Stub openFDA serving {len(records)} records at {server.url}")
+
+    if args.serve:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return
+
+    for page_size, workers in [(1000, 1), (1000, args.workers)]:
+        results, stats = fetch_all(search="", api_url=server.url, page_size=page_size,
+                                   max_workers=workers, rate=args.rate)
+        assert [r["event_id"] for r in results] == [r["event_id"] for r in records], "Result mismatch"
+        print(f"workers={workers}: {stats['pages_per_sec']:.1f} pages/s, {stats['records_per_sec']:.0f} records/s")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
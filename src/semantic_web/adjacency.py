@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from record_io import iter_records
+from neighborhood import CONCEPT, ENTITY
+
+# Compact adjacency index over the enriched graph for "related events" queries.
+# The graph relevant here is bipartite: recall events on one side, the NER
+# entities they mention and their failure-type concept on the other. Every
+# node gets an integer ID and the edges are kept twice as CSR arrays
+# (event -> features and feature -> events), so k-hop expansion, shared-entity
+# rankings and co-occurrence counts are a few vectorized gathers and
+# np.bincount calls instead of multi-join SPARQL against Fuseki.
+
+EVENT = "event"
+KINDS = [EVENT, ENTITY, CONCEPT]
+FEATURE_KINDS = (ENTITY, CONCEPT)
+
+EVENT_BASE = "http://example.org/resource/event/"
+FDA = "http://example.org/fda/quality/"
+
+
+def _csr(rows, cols, n_rows):
+    """CSR (indptr, indices) from COO edge arrays, columns sorted per row."""
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order].astype(np.int32)
+
+
+def _gather(indptr, indices, rows):
+    """Concatenated CSR rows, plus the position in rows each entry came from."""
+    starts, ends = indptr[rows], indptr[rows + 1]
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return indices[starts[owner] + offsets], owner
+
+
+class AdjacencyIndex:
+    """
+    Node table (uris, labels, kinds) plus event->feature and feature->event
+    CSR arrays. Event nodes without edges are either featureless or deleted.
+    """
+
+    def __init__(self, uris, labels, kinds, rows, cols):
+        self.uris = list(uris)
+        self.labels = list(labels)
+        self.kinds = np.asarray(kinds, dtype=np.int8)
+        self.ids = {uri: i for i, uri in enumerate(self.uris)}
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.cols = np.asarray(cols, dtype=np.int32)
+        n = len(self.uris)
+        self.out_indptr, self.out_indices = _csr(self.rows, self.cols, n)
+        self.in_indptr, self.in_indices = _csr(self.cols, self.rows, n)
+        # Inverse document frequency of each feature over events
+        df = np.diff(self.in_indptr)
+        events = max(int((np.diff(self.out_indptr) > 0).sum()), 1)
+        self.idf = np.where(df > 0, np.log1p(events / np.maximum(df, 1)), 0.0)
+
+    # -- Building --
+
+    @classmethod
+    def build(cls, records, enrichment):
+        return cls([], [], [], [], []).update(records, enrichment=enrichment)
+
+    def update(self, records, removed_event_ids=(), enrichment=None):
+        """
+        Returns a new index where the edges of the given events are replaced
+        by those derived from records and removed events lose theirs. records
+        must hold every current recall of each event it touches, since an
+        event's edges are the union over its recalls. Node IDs of existing
+        nodes are kept, new nodes are appended.
+        """
+        uris, labels, kinds = list(self.uris), list(self.labels), list(self.kinds)
+        ids = dict(self.ids)
+
+        def node(uri, label, kind):
+            if uri not in ids:
+                ids[uri] = len(uris)
+                uris.append(uri)
+                labels.append(label)
+                kinds.append(KINDS.index(kind))
+            elif label:
+                labels[ids[uri]] = label
+            return ids[uri]
+
+        new_rows, new_cols, touched = [], [], set()
+        for record in records:
+            doc = enrichment.document(record)
+            event = node(doc["event_uri"], doc.get("recalling_firm") or doc.get("event_id"), EVENT)
+            touched.add(event)
+            if doc.get("failure_type_uri"):
+                new_rows.append(event)
+                new_cols.append(node(doc["failure_type_uri"], doc["failure_type_labels"][0], CONCEPT))
+            for entity in doc["entities"]:
+                new_rows.append(event)
+                new_cols.append(node(entity["uri"], entity.get("label") or entity["uri"].rsplit("/", 1)[-1], ENTITY))
+        touched.update(ids[EVENT_BASE + str(e)] for e in removed_event_ids if EVENT_BASE + str(e) in ids)
+
+        keep = ~np.isin(self.rows, np.fromiter(touched, dtype=np.int64, count=len(touched)))
+        rows = np.concatenate([self.rows[keep], np.asarray(new_rows, dtype=np.int32)])
+        cols = np.concatenate([self.cols[keep], np.asarray(new_cols, dtype=np.int32)])
+        # The same event can list an entity more than once
+        edges = np.unique(np.stack([rows, cols], axis=1), axis=0) if len(rows) else np.empty((0, 2), dtype=np.int32)
+        return AdjacencyIndex(uris, labels, kinds, edges[:, 0], edges[:, 1])
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, kinds=self.kinds, rows=self.rows, cols=self.cols,
+                 uris=np.array(self.uris, dtype=str), labels=np.array(self.labels, dtype=str))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["uris"].tolist(), data["labels"].tolist(), data["kinds"], data["rows"], data["cols"])
+
+    # -- Queries --
+
+    def _id(self, uri):
+        if uri not in self.ids:
+            raise KeyError(f"Unknown node {uri}")
+        return self.ids[uri]
+
+    def _node(self, i):
+        return {"uri": self.uris[i], "label": self.labels[i], "kind": KINDS[self.kinds[i]]}
+
+    def neighbors(self, uri, hops=2, limit=None):
+        """
+        Nodes within `hops` edges of uri (edges followed in both directions),
+        as {uri: distance}, nearest first.
+        """
+        start = self._id(uri)
+        distance = np.full(len(self.uris), -1, dtype=np.int32)
+        distance[start] = 0
+        frontier = np.array([start])
+        for hop in range(1, hops + 1):
+            out, _ = _gather(self.out_indptr, self.out_indices, frontier)
+            into, _ = _gather(self.in_indptr, self.in_indices, frontier)
+            reached = np.unique(np.concatenate([out, into]))
+            frontier = reached[distance[reached] < 0]
+            if not len(frontier):
+                break
+            distance[frontier] = hop
+        found = np.flatnonzero(distance > 0)
+        found = found[np.argsort(distance[found], kind="stable")][:limit]
+        return {self.uris[i]: int(distance[i]) for i in found}
+
+    def related_events(self, event_uri, limit=10, kinds=FEATURE_KINDS):
+        """
+        Events sharing entities or the failure type with event_uri, ranked by
+        the summed IDF of the shared features (rare shared entities count
+        more than a common failure type). Returns dicts with the event,
+        score and the shared features.
+        """
+        event = self._id(event_uri)
+        kind_ids = [KINDS.index(kind) for kind in kinds]
+        features = self.out_indices[self.out_indptr[event]:self.out_indptr[event + 1]]
+        features = features[np.isin(self.kinds[features], kind_ids)]
+        others, owner = _gather(self.in_indptr, self.in_indices, features)
+        scores = np.bincount(others, weights=self.idf[features][owner], minlength=len(self.uris))
+        scores[event] = 0
+        top = np.flatnonzero(scores)
+        top = top[np.lexsort((top, -scores[top]))][:limit]
+
+        results = []
+        for other in top:
+            shared = np.intersect1d(features, self.out_indices[self.out_indptr[other]:self.out_indptr[other + 1]])
+            results.append(dict(self._node(other), score=float(scores[other]),
+                                shared=[self._node(f) for f in shared]))
+        return results
+
+    def cooccurring(self, uri, limit=10, kind=None):
+        """
+        Features that appear on the same events as the feature (or event) uri,
+        with the number of events they share.
+        """
+        node = self._id(uri)
+        if KINDS[self.kinds[node]] == EVENT:
+            events = np.array([node])
+        else:
+            events = self.in_indices[self.in_indptr[node]:self.in_indptr[node + 1]]
+        features, _ = _gather(self.out_indptr, self.out_indices, events)
+        if kind:
+            features = features[self.kinds[features] == KINDS.index(kind)]
+        counts = np.bincount(features, minlength=len(self.uris))
+        counts[node] = 0
+        top = np.flatnonzero(counts)
+        top = top[np.lexsort((top, -counts[top]))][:limit]
+        return [dict(self._node(f), events=int(counts[f])) for f in top]
+
+    def stats(self):
+        return {
+            "nodes": len(self.uris),
+            "edges": len(self.rows),
+            **{f"{kind}_nodes": int((self.kinds == i).sum()) for i, kind in enumerate(KINDS)},
+        }
+
+
+def build_or_update(index_path, json_path, changeset=None, mentions_path=None, taxonomy_path=None):
+    """
+    Applies a changeset (dict or path) to the saved index, or compiles the
+    whole enriched corpus. Saves and returns the index.
+    """
+    from search_indexer import load_enrichment
+    enrichment = load_enrichment(mentions_path, taxonomy_path)
+    if isinstance(changeset, str):
+        with open(changeset, "r") as f:
+            changeset = json.load(f)
+
+    started = time.monotonic()
+    if changeset is not None and os.path.exists(index_path):
+        keys = changeset.get("added", []) + changeset.get("changed", []) + changeset.get("removed", [])
+        touched = {key.split("|", 1)[0] for key in keys}
+        # Edges are derived from all recalls of a touched event, not only the
+        # changed ones; an event keeps its edges as long as any recall remains
+        records, present = [], set()
+        for record in iter_records(json_path):
+            event_id = str(record.get("event_id"))
+            if event_id in touched:
+                present.add(event_id)
+                records.append(record)
+        removed = touched - present
+        index = AdjacencyIndex.load(index_path).update(records, removed, enrichment)
+        print(f"Updated adjacency index with {len(records)} records of {len(touched)} events, "
+              f"{len(removed)} removed events")
+    else:
+        index = AdjacencyIndex.build(iter_records(json_path), enrichment)
+    index.save(index_path)
+    stats = index.stats()
+    print(f"Adjacency index at {index_path}: {stats['nodes']} nodes, {stats['edges']} edges "
+          f"({time.monotonic() - started:.1f}s)")
+    return index
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    JSON_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.jsonl")
+    CHANGESET_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.changeset.json")
+    INDEX_PATH = os.path.join(BASE_DIR, "data", "processed", "adjacency.npz")
+    MENTIONS_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_entity_mentions.nt")
+    TAXONOMY_PATH = os.path.join(BASE_DIR, "data", "processed", "failure_taxonomy.ttl")
+
+    parser = argparse.ArgumentParser(description="Compile the event/entity/failure-type adjacency index.")
+    parser.add_argument("--changed-only", action="store_true",
+                        help=f"Apply {os.path.basename(CHANGESET_PATH)} instead of rebuilding")
+    parser.add_argument("--related", metavar="EVENT_ID", help="Print the events related to an event")
+    args = parser.parse_args()
+
+    if args.related:
+        index = AdjacencyIndex.load(INDEX_PATH)
+        started = time.perf_counter()
+        related = index.related_events(EVENT_BASE + args.related)
+        print(f"{len(related)} related events in {(time.perf_counter() - started) * 1000:.2f} ms")
+        for r in related:
+            print(f"  {r['score']:6.2f}  {r['uri']}  shares {', '.join(s['label'] for s in r['shared'])}")
+    else:
+        build_or_update(INDEX_PATH, JSON_PATH, CHANGESET_PATH if args.changed_only else None,
+                        MENTIONS_PATH, TAXONOMY_PATH)
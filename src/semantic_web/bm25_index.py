@@ -0,0 +1,395 @@
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from record_io import iter_records
+from event_search import FACETS, FACET_SIZE, PAGE_SIZE
+
+# Embedded BM25 full-text index over the raw quality events.
+# Used as the dashboard's search backend when Elasticsearch is unreachable, so
+# it answers the same requests (free text, facet filters and counts, paged
+# results) in the same result shape as event_search.search_events.
+#
+# On disk the index is a directory of immutable segments plus a manifest.
+# Each segment stores a CSR inverted index as flat .npy arrays (term offsets,
+# posting doc ids, term frequencies), per-document lengths, dates and facet
+# codes, and the documents themselves as JSONL with byte offsets. Everything
+# is opened with np.load(mmap_mode="r") / mmap, so opening an index is cheap
+# and pages are only read when touched. Updates add a new segment and
+# tombstone the superseded documents in older ones; compact() merges them.
+
+K1 = 1.2
+B = 0.75
+MAX_SEGMENTS = 8
+MANIFEST = "manifest.json"
+
+# Fields whose text is indexed; must be present in the source documents
+TEXT_FIELDS = ["recalling_firm", "reason_for_recall", "product_description", "failure_type",
+               "city", "state", "entity_labels"]
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were with".split()
+)
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercased alphanumeric tokens without stopwords, with a light plural strip."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def document_text(doc):
+    parts = []
+    for field in TEXT_FIELDS:
+        value = doc.get(field)
+        if isinstance(value, list):
+            parts.extend(str(v) for v in value)
+        elif value:
+            parts.append(str(value))
+    return " ".join(parts)
+
+
+def _date_key(value):
+    digits = re.sub(r"\D", "", str(value or ""))[:8]
+    return int(digits) if len(digits) == 8 else 0
+
+
+def write_segment(path, docs):
+    """Writes one segment for a list of (event_id, document) pairs."""
+    os.makedirs(path)
+    postings = {}
+    doc_len = np.zeros(len(docs), dtype=np.int32)
+    dates = np.zeros(len(docs), dtype=np.int32)
+    facet_values = {field: {} for field in FACETS}
+    facet_codes = {field: np.full(len(docs), -1, dtype=np.int32) for field in FACETS}
+    doc_offsets = np.zeros(len(docs) + 1, dtype=np.int64)
+
+    with open(os.path.join(path, "docs.jsonl"), "wb") as f:
+        for i, (event_id, doc) in enumerate(docs):
+            tokens = tokenize(document_text(doc))
+            doc_len[i] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((i, tf))
+            dates[i] = _date_key(doc.get("report_date"))
+            for field in FACETS:
+                value = doc.get(field)
+                if value:
+                    codes = facet_values[field]
+                    facet_codes[field][i] = codes.setdefault(value, len(codes))
+            line = (json.dumps(doc) + "\n").encode("utf-8")
+            f.write(line)
+            doc_offsets[i + 1] = doc_offsets[i] + len(line)
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for t, term in enumerate(terms):
+        offsets[t + 1] = offsets[t] + len(postings[term])
+    posting_docs = np.empty(offsets[-1], dtype=np.int32)
+    posting_tfs = np.empty(offsets[-1], dtype=np.uint16)
+    for t, term in enumerate(terms):
+        entries = postings[term]
+        posting_docs[offsets[t]:offsets[t + 1]] = [doc for doc, _ in entries]
+        posting_tfs[offsets[t]:offsets[t + 1]] = [min(tf, 65535) for _, tf in entries]
+
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    np.save(os.path.join(path, "posting_docs.npy"), posting_docs)
+    np.save(os.path.join(path, "posting_tfs.npy"), posting_tfs)
+    np.save(os.path.join(path, "doc_len.npy"), doc_len)
+    np.save(os.path.join(path, "dates.npy"), dates)
+    np.save(os.path.join(path, "doc_offsets.npy"), doc_offsets)
+    for field in FACETS:
+        np.save(os.path.join(path, f"facet_{field}.npy"), facet_codes[field])
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({
+            "ids": [event_id for event_id, _ in docs],
+            "terms": terms,
+            "facets": {field: list(values) for field, values in facet_values.items()},
+        }, f)
+
+
+class Segment:
+    """A read-only, memory-mapped segment."""
+
+    def __init__(self, path, deleted=()):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        self.ids = meta["ids"]
+        self.term_ids = {term: i for i, term in enumerate(meta["terms"])}
+        self.facet_values = meta["facets"]
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.offsets = load("offsets.npy")
+        self.posting_docs = load("posting_docs.npy")
+        self.posting_tfs = load("posting_tfs.npy")
+        self.doc_len = load("doc_len.npy")
+        self.dates = load("dates.npy")
+        self.doc_offsets = load("doc_offsets.npy")
+        self.facet_codes = {field: load(f"facet_{field}.npy") for field in FACETS}
+        self.live = np.ones(len(self.ids), dtype=bool)
+        self.live[list(deleted)] = False
+        self._docs = None
+
+    def postings(self, term):
+        t = self.term_ids.get(term)
+        if t is None:
+            return None, None
+        start, end = self.offsets[t], self.offsets[t + 1]
+        return self.posting_docs[start:end], self.posting_tfs[start:end]
+
+    def document(self, i):
+        if self._docs is None:
+            self._docs = np.memmap(os.path.join(self.path, "docs.jsonl"), dtype=np.uint8, mode="r")
+        return json.loads(self._docs[self.doc_offsets[i]:self.doc_offsets[i + 1]].tobytes())
+
+    def facet_mask(self, field, values):
+        wanted = [self.facet_values[field].index(v) for v in values if v in self.facet_values[field]]
+        return np.isin(self.facet_codes[field], wanted)
+
+
+class BM25Index:
+    """
+    Segmented BM25 index in a directory. Open with BM25Index(path); create or
+    refresh with build() / update().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST), "r") as f:
+            self.manifest = json.load(f)
+        self.segments = [Segment(os.path.join(path, name), self.manifest["deleted"].get(name, ()))
+                         for name in self.manifest["segments"]]
+        live_len = [seg.doc_len[seg.live] for seg in self.segments]
+        self.doc_count = sum(len(lengths) for lengths in live_len)
+        total_len = sum(int(lengths.sum()) for lengths in live_len)
+        self.avgdl = total_len / self.doc_count if self.doc_count else 1.0
+
+    # -- Writing --
+
+    @classmethod
+    def build(cls, path, records, enrichment=None):
+        """(Re)builds the index from scratch from an iterable of raw records."""
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        docs = _documents(records, enrichment)
+        write_segment(os.path.join(tmp_path, "seg_000001"), list(docs.items()))
+        _write_manifest(tmp_path, {"segments": ["seg_000001"], "deleted": {}, "next": 2})
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def update(self, records, removed_ids=(), enrichment=None):
+        """
+        Adds or replaces documents (keyed by event_id) and deletes removed_ids,
+        by writing one new segment and tombstoning older copies. Merges all
+        segments once there are more than MAX_SEGMENTS. Returns the reopened index.
+        """
+        docs = _documents(records, enrichment)
+        replaced = set(docs) | set(removed_ids)
+        manifest = dict(self.manifest, deleted=dict(self.manifest["deleted"]))
+        for seg in self.segments:
+            stale = [i for i, event_id in enumerate(seg.ids) if event_id in replaced and seg.live[i]]
+            if stale:
+                manifest["deleted"][seg.name] = sorted(set(manifest["deleted"].get(seg.name, [])) | set(stale))
+        if docs:
+            name = f"seg_{manifest['next']:06d}"
+            write_segment(os.path.join(self.path, name), list(docs.items()))
+            manifest["segments"] = manifest["segments"] + [name]
+            manifest["next"] += 1
+        _write_manifest(self.path, manifest)
+        index = BM25Index(self.path)
+        if len(index.segments) > MAX_SEGMENTS:
+            index = index.compact()
+        return index
+
+    def compact(self):
+        """Merges all live documents into a single segment."""
+        docs = []
+        for seg in self.segments:
+            docs.extend((seg.ids[i], seg.document(i)) for i in np.flatnonzero(seg.live))
+        name = f"seg_{self.manifest['next']:06d}"
+        write_segment(os.path.join(self.path, name), docs)
+        old = self.manifest["segments"]
+        _write_manifest(self.path, {"segments": [name], "deleted": {}, "next": self.manifest["next"] + 1})
+        for old_name in old:
+            shutil.rmtree(os.path.join(self.path, old_name), ignore_errors=True)
+        return BM25Index(self.path)
+
+    # -- Searching --
+
+    def _match(self, seg, terms, idf):
+        """BM25 scores and the AND-match mask of one segment."""
+        scores = np.zeros(len(seg.ids), dtype=np.float32)
+        if not terms:
+            return scores, seg.live.copy()
+        hits = np.zeros(len(seg.ids), dtype=np.int32)
+        norm = K1 * (1 - B + B * seg.doc_len / self.avgdl)
+        for term in terms:
+            docs, tfs = seg.postings(term)
+            if docs is None:
+                return scores, np.zeros(len(seg.ids), dtype=bool)
+            tfs = tfs.astype(np.float32)
+            scores[docs] += idf[term] * tfs * (K1 + 1) / (tfs + norm[docs])
+            hits[docs] += 1
+        return scores, (hits == len(terms)) & seg.live
+
+    def search(self, text, filters=None, page_size=PAGE_SIZE, search_after=None, facet_size=FACET_SIZE):
+        """
+        Same contract as event_search.search_events: all query terms must
+        match, hits are ranked by BM25 then report_date. search_after is the
+        "sort" value of the previous page's last hit (its rank).
+        """
+        started = time.perf_counter()
+        filters = {field: values for field, values in (filters or {}).items() if values}
+        terms = list(dict.fromkeys(tokenize(text or "")))
+        df = {term: 0 for term in terms}
+        for seg in self.segments:
+            for term in terms:
+                docs, _ = seg.postings(term)
+                if docs is not None:
+                    df[term] += int(seg.live[docs].sum())
+        n = max(self.doc_count, 1)
+        idf = {term: np.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5)) for term in terms}
+
+        candidates = []
+        facet_counts = {field: {} for field in FACETS}
+        for s, seg in enumerate(self.segments):
+            scores, matched = self._match(seg, terms, idf)
+            masks = {field: seg.facet_mask(field, values) for field, values in filters.items()}
+            selected = matched.copy()
+            for mask in masks.values():
+                selected &= mask
+            # Each facet is counted under the other facets' filters, as in the ES query
+            for field in FACETS:
+                base = matched.copy()
+                for other, mask in masks.items():
+                    if other != field:
+                        base &= mask
+                codes = seg.facet_codes[field][base]
+                counts = np.bincount(codes[codes >= 0], minlength=len(seg.facet_values[field]))
+                for code in np.flatnonzero(counts):
+                    value = seg.facet_values[field][code]
+                    facet_counts[field][value] = facet_counts[field].get(value, 0) + int(counts[code])
+            docs = np.flatnonzero(selected)
+            candidates.append((np.full(len(docs), s), docs, scores[docs], seg.dates[docs]))
+
+        seg_ids = np.concatenate([c[0] for c in candidates]) if candidates else np.empty(0, dtype=int)
+        doc_ids = np.concatenate([c[1] for c in candidates]) if candidates else np.empty(0, dtype=int)
+        scores = np.concatenate([c[2] for c in candidates]) if candidates else np.empty(0)
+        dates = np.concatenate([c[3] for c in candidates]) if candidates else np.empty(0)
+        order = np.lexsort((doc_ids, seg_ids, -dates.astype(np.int64), -scores))
+
+        start = int(search_after[0]) + 1 if search_after else 0
+        page = order[start:start + page_size]
+        hits = []
+        for rank, i in enumerate(page, start):
+            seg = self.segments[seg_ids[i]]
+            hits.append({
+                "_id": seg.ids[doc_ids[i]],
+                "_score": float(scores[i]),
+                "_source": seg.document(doc_ids[i]),
+                "sort": [rank],
+            })
+
+        facets = {
+            field: sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:facet_size]
+            for field, counts in facet_counts.items()
+        } if not search_after else {}
+        took_ms = (time.perf_counter() - started) * 1000
+        return {
+            "hits": hits,
+            "total": len(order),
+            "facets": facets,
+            "next_after": hits[-1]["sort"] if start + page_size < len(order) and hits else None,
+            "took_ms": round(took_ms),
+            "latency_ms": took_ms,
+            "backend": "bm25",
+        }
+
+
+def _documents(records, enrichment=None):
+    """{event_id: document}; later records for the same event win, as with ES _id."""
+    docs = {}
+    for record in records:
+        event_id = record.get("event_id")
+        if event_id:
+            docs[event_id] = enrichment.document(record) if enrichment else record
+    return docs
+
+
+def _write_manifest(path, manifest):
+    tmp_path = os.path.join(path, MANIFEST + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(path, MANIFEST))
+
+
+def build_or_update(index_path, json_path, changeset=None, mentions_path=None, taxonomy_path=None):
+    """
+    Applies a changeset (dict or path) to an existing index, or rebuilds the
+    index from the whole raw corpus. Returns the open index.
+    """
+    from search_indexer import load_enrichment
+    enrichment = load_enrichment(mentions_path, taxonomy_path)
+    if isinstance(changeset, str):
+        with open(changeset, "r") as f:
+            changeset = json.load(f)
+
+    started = time.monotonic()
+    if changeset is not None and os.path.exists(os.path.join(index_path, MANIFEST)):
+        # Documents are per event: rebuild every touched event from all its remaining recalls
+        removed = {key.split("|", 1)[0] for key in changeset.get("removed", [])}
+        events = removed | {key.split("|", 1)[0] for key in changeset.get("added", []) + changeset.get("changed", [])}
+        records, present = [], set()
+        for record in iter_records(json_path):
+            present.add(record.get("event_id"))
+            if record.get("event_id") in events:
+                records.append(record)
+        index = BM25Index(index_path).update(records, removed - present, enrichment)
+        print(f"Updated BM25 index with {len(records)} records, {len(removed - present)} deletions")
+    else:
+        index = BM25Index.build(index_path, iter_records(json_path), enrichment)
+        print(f"Built BM25 index of {index.doc_count} documents")
+    print(f"BM25 index at {index_path}: {index.doc_count} documents, {len(index.segments)} segments "
+          f"({time.monotonic() - started:.1f}s)")
+    return index
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    JSON_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.jsonl")
+    CHANGESET_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.changeset.json")
+    INDEX_PATH = os.path.join(BASE_DIR, "data", "processed", "bm25_index")
+    MENTIONS_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_entity_mentions.nt")
+    TAXONOMY_PATH = os.path.join(BASE_DIR, "data", "processed", "failure_taxonomy.ttl")
+
+    parser = argparse.ArgumentParser(description="Build the embedded BM25 search index (offline ES fallback).")
+    parser.add_argument("--changed-only", action="store_true",
+                        help=f"Apply {os.path.basename(CHANGESET_PATH)} instead of rebuilding")
+    parser.add_argument("--search", help="Run a query against the index and print the top hits")
+    args = parser.parse_args()
+
+    if args.search is not None:
+        result = BM25Index(INDEX_PATH).search(args.search)
+        print(f"{result['total']} hits in {result['took_ms']} ms")
+        for hit in result["hits"]:
+            print(f"  {hit['_score']:6.2f}  {hit['_id']}  {hit['_source'].get('reason_for_recall', '')[:80]}")
+    else:
+        build_or_update(INDEX_PATH, JSON_PATH, CHANGESET_PATH if args.changed_only else None,
+                        MENTIONS_PATH, TAXONOMY_PATH)
@@ -5,7 +5,8 @@ import os
 
 # For this environment, we will generate a simple markdown report of the ontology.
 
-from rdflib import Graph, RDF, RDFS, OWL, DCTERMS
+from rdflib import RDF, RDFS, OWL, DCTERMS
+from graph_cache import load_graph
 
 def generate_docs(ontology_path, output_path):
     """
@@ -15,8 +16,7 @@ def generate_docs(ontology_path, output_path):
         print(f"Ontology file not found: {ontology_path}")
         return
 
-    g = Graph()
-    g.parse(ontology_path, format="turtle")
+    g = load_graph(ontology_path, format="turtle")
     
     with open(output_path, 'w') as f:
         # Title & Meta
@@ -0,0 +1,88 @@
+import time
+
+# Faceted, paginated search over the fda_events index.
+# Free text goes into the scored query; facet selections are term filters in
+# filter context (cached by Elasticsearch, no scoring). Facet selections are
+# applied as a post_filter and every facet is aggregated under the other
+# facets' filters, so a facet keeps showing its alternatives after a value is
+# picked. Pages are walked with search_after on a stable sort instead of
+# from/size, so deep pages cost the same as the first.
+
+INDEX = "fda_events"
+PAGE_SIZE = 10
+FACET_SIZE = 20
+
+# Facet field -> label shown in the dashboard
+FACETS = {
+    "failure_type": "Failure type",
+    "classification": "Classification",
+    "state": "State",
+    "recalling_firm": "Firm",
+}
+
+# Tie-broken sort, required for search_after
+SORT = ["_score", {"report_date": {"order": "desc", "unmapped_type": "date"}}, {"event_id": "asc"}]
+
+
+def _filter_clauses(filters, exclude=None):
+    return [{"terms": {field: list(values)}}
+            for field, values in sorted(filters.items()) if values and field != exclude]
+
+
+def build_query(text, filters=None, page_size=PAGE_SIZE, search_after=None, facet_size=FACET_SIZE):
+    """
+    Search body for free text plus {facet field: [values]} filters.
+    search_after is the sort key of the last hit of the previous page.
+    """
+    filters = filters or {}
+    if text and text.strip():
+        scored = {"query_string": {"query": text, "default_operator": "AND"}}
+    else:
+        scored = {"match_all": {}}
+
+    body = {
+        "query": scored,
+        "post_filter": {"bool": {"filter": _filter_clauses(filters)}},
+        "sort": SORT,
+        "size": page_size,
+        "track_total_hits": True,
+        "aggs": {
+            field: {
+                "filter": {"bool": {"filter": _filter_clauses(filters, exclude=field)}},
+                "aggs": {"values": {"terms": {"field": field, "size": facet_size}}},
+            }
+            for field in FACETS
+        },
+    }
+    if search_after:
+        body["search_after"] = list(search_after)
+        # Facet counts do not change between pages
+        del body["aggs"]
+    return body
+
+
+def search_events(es, text, filters=None, page_size=PAGE_SIZE, search_after=None, index=INDEX):
+    """
+    Runs one page of a faceted search. Returns a dict with hits, total,
+    facets ({field: [(value, count)]}, only on the first page), next_after
+    (cursor for the next page, None on the last one), took_ms (as reported
+    by Elasticsearch) and latency_ms (measured round trip).
+    """
+    body = build_query(text, filters, page_size, search_after)
+    started = time.perf_counter()
+    res = es.search(index=index, body=body)
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    hits = res["hits"]["hits"]
+    facets = {
+        field: [(bucket["key"], bucket["doc_count"]) for bucket in agg["values"]["buckets"]]
+        for field, agg in res.get("aggregations", {}).items()
+    }
+    return {
+        "hits": hits,
+        "total": res["hits"]["total"]["value"],
+        "facets": facets,
+        "next_after": hits[-1]["sort"] if len(hits) == page_size else None,
+        "took_ms": res.get("took"),
+        "latency_ms": latency_ms,
+    }
@@ -0,0 +1,325 @@
+import os
+import time
+import queue
+import argparse
+import threading
+from itertools import islice
+from record_io import iter_records
+
+# Single-read fan-out of the raw corpus to every output.
+# The raw file is read and decoded once and the records, as read, are handed
+# in batches to a set of sinks, each running on its own thread behind a
+# bounded queue. A slow sink fills its queue and blocks the reader
+# (backpressure) instead of letting batches pile up in memory, so memory stays
+# flat and the wall time tracks the slowest sink rather than the sum of all of
+# them. The sinks write the same outputs as the separate stages (transform,
+# taxonomy, index); the SQLite sink is only used from the command line, since
+# the pipeline persists after validation.
+
+BATCH_SIZE = 1000
+QUEUE_BATCHES = 8
+_DONE = object()
+
+
+class Sink:
+    """
+    A consumer of the record stream. run(records) is called once on the
+    sink's thread with an iterator over all records and returns a summary.
+    """
+    name = "sink"
+    # Set by run() when an optional sink had nothing to write to
+    skipped = False
+
+    def run(self, records):
+        raise NotImplementedError
+
+
+class NTriplesSink(Sink):
+    """The knowledge graph as N-Triples (same output as transform_to_ntriples)."""
+    name = "ntriples"
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+
+    def run(self, records):
+        from rdf_transformer import event_ntriples, concept_ntriples
+        events = triples = 0
+        failure_types = set()
+        tmp_path = self.output_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                lines = event_ntriples(record)
+                if lines:
+                    events += 1
+                    triples += len(lines)
+                    f.writelines(lines)
+                if record.get("failure_type"):
+                    failure_types.add(record["failure_type"])
+            for failure_type in sorted(failure_types):
+                lines = concept_ntriples(failure_type)
+                f.writelines(lines)
+                triples += len(lines)
+        os.replace(tmp_path, self.output_path)
+        return f"{events} events, {triples} triples -> {self.output_path}"
+
+
+class TaxonomySink(Sink):
+    """Accumulates the failure types and writes the SKOS taxonomy at the end."""
+    name = "taxonomy"
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+
+    def run(self, records):
+        from taxonomy_builder import taxonomy_graph
+        failure_types = {record["failure_type"] for record in records if record.get("failure_type")}
+        tmp_path = self.output_path + ".tmp"
+        taxonomy_graph(failure_types).serialize(destination=tmp_path, format="turtle")
+        os.replace(tmp_path, self.output_path)
+        return f"{len(failure_types)} failure types -> {self.output_path}"
+
+
+class SearchSink(Sink):
+    """
+    Reindexes Elasticsearch behind the alias from the stream, or applies a
+    fetch changeset to the live index. Documents are enriched with the
+    mention and cluster files already on disk; failure-type labels come from
+    the stream itself, since the taxonomy sink is rewriting that file at the
+    same time. An optional sink skips (instead of failing) when Elasticsearch
+    is unreachable.
+    """
+    name = "search"
+
+    def __init__(self, es_host, alias="fda_events", mentions_path=None, clusters_path=None,
+                 changeset=None, optional=False):
+        self.es_host = es_host
+        self.alias = alias
+        self.paths = (mentions_path, clusters_path)
+        self.changeset = changeset
+        self.optional = optional
+
+    def run(self, records):
+        from search_indexer import _alias_indices, _connect, load_enrichment, index_changeset, reindex
+        es = _connect(self.es_host)
+        if es is None:
+            if self.optional:
+                self.skipped = True
+                return f"skipped, Elasticsearch at {self.es_host} is not reachable"
+            raise RuntimeError(f"Elasticsearch at {self.es_host} is not reachable")
+        mentions_path, clusters_path = self.paths
+        enrichment = load_enrichment(mentions_path, clusters_path=clusters_path)
+        records = self._labelled(records, enrichment)
+        if self.changeset is not None and _alias_indices(es, self.alias):
+            count = index_changeset(es, None, self.changeset, self.alias, enrichment=enrichment, records=records)
+        else:
+            count = reindex(es, None, self.alias, enrichment=enrichment, records=records)
+        if count is None:
+            raise RuntimeError("Elasticsearch indexing failed")
+        return f"{count} documents -> {self.alias}"
+
+    @staticmethod
+    def _labelled(records, enrichment):
+        """Passes records through, adding each new failure type's concept labels to enrichment."""
+        from taxonomy_builder import taxonomy_graph
+        seen = set()
+        for record in records:
+            failure_type = record.get("failure_type")
+            if failure_type and failure_type not in seen:
+                seen.add(failure_type)
+                enrichment.add_concept_labels(taxonomy_graph([failure_type]))
+            yield record
+
+
+class SQLStoreSink(Sink):
+    """
+    Bulk loads the event and concept triples into the SQLite triple store,
+    then the given sidecar files (NER mentions, duplicate clusters).
+    """
+    name = "sql"
+
+    def __init__(self, db_url, extra_files=(), replace=True):
+        self.db_url = db_url
+        self.extra_files = extra_files
+        self.replace = replace
+
+    def run(self, records):
+        from rdf_transformer import event_triples, concept_triples
+        from triple_store import SQLiteTripleStore
+        store = SQLiteTripleStore()
+        store.open(self.db_url, create=True)
+        try:
+            if self.replace:
+                store.clear()
+            failure_types = set()
+            with store.bulk() as loader:
+                for record in records:
+                    for triple in event_triples(record):
+                        loader.add(triple)
+                    if record.get("failure_type"):
+                        failure_types.add(record["failure_type"])
+                for failure_type in sorted(failure_types):
+                    for triple in concept_triples(failure_type):
+                        loader.add(triple)
+            for path in self.extra_files:
+                if path and os.path.exists(path):
+                    store.load_file(path)
+            return f"{len(store)} triples -> {self.db_url}"
+        finally:
+            store.close()
+
+
+class MentionsSink(Sink):
+    """Runs NER over the stream and writes the entity mention sidecar (like enrich_delta)."""
+    name = "mentions"
+
+    def __init__(self, output_path, cache_path=None):
+        self.output_path = output_path
+        self.cache_path = cache_path
+
+    def run(self, records):
+        from ner_enricher import (annotate, annotate_cached, add_mentions, load_annotator, model_id,
+                                  record_texts, _report_cache)
+        from ner_cache import NERCache
+        from ntriples import NTriplesWriter
+        cache = NERCache(self.cache_path) if self.cache_path else None
+        texts = record_texts(records)
+        annotated = annotate_cached(load_annotator, texts, cache, model_id()) if cache else annotate(load_annotator(), texts)
+        count = 0
+        defined = set()
+        with NTriplesWriter(self.output_path) as out:
+            for event_id, entities in annotated:
+                count += add_mentions(out, event_id, entities, defined)
+        _report_cache(cache)
+        return f"{count} mentions -> {self.output_path}"
+
+
+class _Worker(threading.Thread):
+    """Runs one sink over the batches arriving on its bounded queue."""
+
+    def __init__(self, sink, queue_batches):
+        super().__init__(name=f"sink-{sink.name}", daemon=True)
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=queue_batches)
+        self.finished = threading.Event()
+        self.result = self.error = None
+        self.seconds = 0.0
+        self.blocked = 0.0  # time the reader spent waiting on this sink's full queue
+
+    def records(self):
+        while True:
+            batch = self.queue.get()
+            if batch is _DONE:
+                return
+            yield from batch
+
+    def run(self):
+        started = time.monotonic()
+        try:
+            self.result = self.sink.run(self.records())
+        except Exception as e:
+            self.error = e
+        finally:
+            self.seconds = time.monotonic() - started
+            self.finished.set()
+
+    def put(self, batch):
+        """Blocks while the queue is full; gives up once the sink has stopped."""
+        started = time.monotonic()
+        while not self.finished.is_set():
+            try:
+                self.queue.put(batch, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.blocked += time.monotonic() - started
+
+
+def fan_out(json_path, sinks, batch_size=BATCH_SIZE, queue_batches=QUEUE_BATCHES):
+    """
+    Reads json_path once and streams the records to every sink concurrently.
+    Sinks share the record dicts and must not modify them. Returns
+    {sink name: {"result" | "error", "seconds", "blocked"}} ("skipped" is set
+    for optional sinks that had nothing to write to) and raises RuntimeError
+    if any sink failed (after all of them finished).
+    """
+    if not os.path.exists(json_path):
+        raise FileNotFoundError(f"Input file not found: {json_path}")
+
+    workers = [_Worker(sink, queue_batches) for sink in sinks]
+    for worker in workers:
+        worker.start()
+
+    started = time.monotonic()
+    records = 0
+    stream = iter_records(json_path)
+    for batch in iter(lambda: list(islice(stream, batch_size)), []):
+        records += len(batch)
+        for worker in workers:
+            worker.put(batch)
+    for worker in workers:
+        worker.put(_DONE)
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+
+    report = {}
+    print(f"Fanned out {records} records to {len(workers)} sinks in {elapsed:.1f}s "
+          f"(sinks sum to {sum(w.seconds for w in workers):.1f}s)")
+    for worker in workers:
+        outcome = {"seconds": round(worker.seconds, 3), "blocked": round(worker.blocked, 3)}
+        if worker.error is not None:
+            outcome["error"] = str(worker.error)
+        else:
+            outcome["result"] = worker.result
+        report[worker.sink.name] = outcome
+        if worker.sink.skipped:
+            outcome["skipped"] = True
+        print(f"  {worker.sink.name:<9} {worker.seconds:6.1f}s  reader blocked {worker.blocked:5.1f}s  "
+              f"{outcome.get('result') or 'FAILED: ' + outcome['error']}")
+
+    failed = [name for name, outcome in report.items() if "error" in outcome]
+    if failed:
+        raise RuntimeError(f"Fan-out sinks failed: {', '.join(failed)}")
+    return report
+
+
+def default_sinks(names, paths, es_host, changeset=None, optional_search=False):
+    """
+    Builds the named sinks over the pipeline's standard paths. The search sink
+    applies changeset when given and, with optional_search, skips when
+    Elasticsearch is down.
+    """
+    factories = {
+        "ntriples": lambda: NTriplesSink(paths["kg"]),
+        "taxonomy": lambda: TaxonomySink(paths["taxonomy"]),
+        "search": lambda: SearchSink(es_host, mentions_path=paths["mentions"], clusters_path=paths["clusters"],
+                                     changeset=changeset, optional=optional_search),
+        "sql": lambda: SQLStoreSink(f"sqlite:///{paths['db']}", extra_files=(paths["mentions"], paths["clusters"])),
+        "mentions": lambda: MentionsSink(paths["mentions"], paths.get("ner_cache")),
+    }
+    return [factories[name]() for name in names]
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
+    JSON_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.jsonl")
+    PATHS = {
+        "kg": os.path.join(PROCESSED_DIR, "fda_knowledge_graph.nt"),
+        "taxonomy": os.path.join(PROCESSED_DIR, "failure_taxonomy.ttl"),
+        "mentions": os.path.join(PROCESSED_DIR, "fda_entity_mentions.nt"),
+        "clusters": os.path.join(PROCESSED_DIR, "fda_duplicate_clusters.nt"),
+        "db": os.path.join(PROCESSED_DIR, "fda_graph.db"),
+        "ner_cache": os.path.join(PROCESSED_DIR, "ner_cache.sqlite"),
+    }
+
+    parser = argparse.ArgumentParser(description="Read the raw corpus once and feed all outputs concurrently.")
+    parser.add_argument("--sinks", nargs="+", default=["ntriples", "taxonomy", "search", "sql"],
+                        choices=["ntriples", "taxonomy", "search", "sql", "mentions"])
+    parser.add_argument("--es-host", default=os.environ.get("ES_HOST", "http://localhost:9200"))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--queue-batches", type=int, default=QUEUE_BATCHES,
+                        help="Batches buffered per sink before the reader blocks")
+    args = parser.parse_args()
+
+    fan_out(JSON_PATH, default_sinks(args.sinks, PATHS, args.es_host), args.batch_size, args.queue_batches)
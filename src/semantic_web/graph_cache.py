@@ -0,0 +1,232 @@
+import os
+import time
+import hashlib
+import numpy as np
+from rdflib import BNode, Dataset, Graph, Literal, URIRef
+from ntriples import rdf_format
+
+# Binary cache of parsed RDF files.
+# Parsing Turtle (or N-Triples) with rdflib dominates the startup of every
+# stage that reads the graph. The first parse of a file also writes
+# <file>.gcache: a dictionary-encoded term table (kinds, one UTF-8 blob with
+# offsets, datatype and language codes) plus an (n, 3) int32 triple array and
+# the file's prefix bindings, stamped with the SHA-256 of the source. Later
+# loads of the same content rebuild terms straight from the table, either into
+# an rdflib Graph or as a read-only GraphView that decodes terms lazily. Any
+# change to the source changes its hash and the cache is rebuilt. N-Quads and
+# TriG files are read as the union of their graphs (graph names are dropped).
+
+SUFFIX = ".gcache"
+HASH_CHUNK = 1 << 20
+URI, BNODE, LITERAL = 0, 1, 2
+
+stats = {"hits": 0, "misses": 0, "load_seconds": 0.0, "parse_seconds": 0.0}
+
+
+def content_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(path):
+    return path + SUFFIX
+
+
+def _encode(graph):
+    """Term table, triple array and prefix bindings of a graph."""
+    ids = {}
+    terms = []
+    triple_ids = []
+    for triple in graph.triples((None, None, None)):
+        for term in triple:
+            term_id = ids.get(term)
+            if term_id is None:
+                term_id = ids[term] = len(terms)
+                terms.append(term)
+            triple_ids.append(term_id)
+    triples = np.array(triple_ids, dtype=np.int32).reshape(-1, 3)
+
+    kinds = np.empty(len(terms), dtype=np.uint8)
+    datatype_ids, lang_ids = {}, {}
+    datatypes = np.full(len(terms), -1, dtype=np.int32)
+    langs = np.full(len(terms), -1, dtype=np.int32)
+    lexical = []
+    for i, term in enumerate(terms):
+        lexical.append(str(term).encode("utf-8"))
+        if isinstance(term, Literal):
+            kinds[i] = LITERAL
+            if term.datatype is not None:
+                datatypes[i] = datatype_ids.setdefault(str(term.datatype), len(datatype_ids))
+            if term.language is not None:
+                langs[i] = lang_ids.setdefault(term.language, len(lang_ids))
+        else:
+            kinds[i] = BNODE if isinstance(term, BNode) else URI
+    namespaces = list(graph.namespaces())
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in lexical], out=offsets[1:])
+    return {
+        "kinds": kinds,
+        "blob": np.frombuffer(b"".join(lexical), dtype=np.uint8),
+        "offsets": offsets,
+        "datatypes": datatypes,
+        "langs": langs,
+        "datatype_table": np.array(list(datatype_ids), dtype=str),
+        "lang_table": np.array(list(lang_ids), dtype=str),
+        "triples": triples,
+        "prefixes": np.array([prefix for prefix, _ in namespaces], dtype=str),
+        "namespaces": np.array([str(uri) for _, uri in namespaces], dtype=str),
+    }
+
+
+def write_cache(encoded, path, source_hash):
+    tmp_path = cache_path(path) + ".tmp.npz"
+    np.savez(tmp_path, source_hash=np.array(source_hash), **encoded)
+    os.replace(tmp_path, cache_path(path))
+
+
+class GraphView:
+    """
+    Read-only, lazily decoded view of a cached graph. Supports len(),
+    triples((s, p, o)) with rdflib terms or None, namespaces(), and to_graph().
+    """
+
+    def __init__(self, data):
+        self.kinds = data["kinds"]
+        self.blob = data["blob"].tobytes()
+        self.offsets = data["offsets"]
+        self.datatypes = data["datatypes"]
+        self.langs = data["langs"]
+        self.datatype_table = [URIRef(dt) for dt in data["datatype_table"].tolist()]
+        self.lang_table = data["lang_table"].tolist()
+        self.triple_ids = data["triples"]
+        self.bindings = list(zip(data["prefixes"].tolist(), data["namespaces"].tolist()))
+        self._terms = {}
+        self._ids = None
+
+    def __len__(self):
+        return len(self.triple_ids)
+
+    def term(self, i):
+        term = self._terms.get(i)
+        if term is None:
+            lexical = self.blob[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+            kind = self.kinds[i]
+            if kind == URI:
+                term = URIRef(lexical)
+            elif kind == BNODE:
+                term = BNode(lexical)
+            else:
+                dt, lang = self.datatypes[i], self.langs[i]
+                term = Literal(lexical, lang=self.lang_table[lang] if lang >= 0 else None,
+                               datatype=self.datatype_table[dt] if dt >= 0 else None)
+            self._terms[i] = term
+        return term
+
+    def terms(self):
+        """All terms, decoded in one pass."""
+        return [self.term(i) for i in range(len(self.kinds))]
+
+    def _term_id(self, term):
+        if self._ids is None:
+            self._ids = {t: i for i, t in enumerate(self.terms())}
+        return self._ids.get(term, -1)
+
+    def triples(self, pattern=(None, None, None)):
+        mask = np.ones(len(self.triple_ids), dtype=bool)
+        for j, term in enumerate(pattern):
+            if term is not None:
+                mask &= self.triple_ids[:, j] == self._term_id(term)
+        for s, p, o in self.triple_ids[mask].tolist():
+            yield self.term(s), self.term(p), self.term(o)
+
+    def __iter__(self):
+        return self.triples()
+
+    def namespaces(self):
+        """The (prefix, namespace URI) bindings of the source file."""
+        return [(prefix, URIRef(uri)) for prefix, uri in self.bindings]
+
+    def to_graph(self, graph=None):
+        """
+        Adds the triples to graph (a new Graph by default), binds the source's
+        prefixes as parsing would, and returns it.
+        """
+        graph = graph if graph is not None else Graph()
+        for prefix, uri in self.namespaces():
+            graph.bind(prefix, uri)
+        terms = self.terms()
+        # Straight into the store: the terms are already valid rdflib nodes,
+        # so Graph.add's per-triple type checks are skipped.
+        add = graph.store.add
+        for s, p, o in self.triple_ids.tolist():
+            add((terms[s], terms[p], terms[o]), graph, False)
+        return graph
+
+
+def load_view(path, format=None):
+    """GraphView of an RDF file, served from its cache when the content matches."""
+    started = time.perf_counter()
+    source_hash = content_hash(path)
+    cached = cache_path(path)
+    if os.path.exists(cached):
+        with np.load(cached) as data:
+            # Caches written before prefixes were stored are rebuilt
+            if str(data["source_hash"]) == source_hash and "prefixes" in data.files:
+                view = GraphView(data)
+                elapsed = time.perf_counter() - started
+                stats["hits"] += 1
+                stats["load_seconds"] += elapsed
+                print(f"[graph cache] hit {os.path.basename(path)}: {len(view)} triples in {elapsed:.2f}s")
+                return view
+
+    format = format or rdf_format(path)
+    # Graph().parse would drop the quads of named graphs
+    graph = Dataset(default_union=True) if format in ("nquads", "trig") else Graph()
+    graph.parse(path, format=format)
+    parsed = time.perf_counter() - started
+    encoded = _encode(graph)
+    try:
+        write_cache(encoded, path, source_hash)
+    except OSError as e:
+        print(f"[graph cache] could not write {cached}: {e}")
+    stats["misses"] += 1
+    stats["parse_seconds"] += parsed
+    print(f"[graph cache] miss {os.path.basename(path)}: parsed {len(graph)} triples in {parsed:.2f}s, "
+          f"cached in {time.perf_counter() - started - parsed:.2f}s")
+    return GraphView(encoded)
+
+
+def load_graph(path, format=None, graph=None):
+    """
+    Drop-in for Graph().parse(path): returns an rdflib Graph with the file's
+    triples (added to graph when given), using the binary cache.
+    """
+    view = load_view(path, format)
+    started = time.perf_counter()
+    graph = view.to_graph(graph)
+    stats["load_seconds"] += time.perf_counter() - started
+    return graph
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build or time the binary parsed-graph cache of RDF files.")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    for path in args.files:
+        started = time.perf_counter()
+        Graph().parse(path, format=rdf_format(path))
+        parse_seconds = time.perf_counter() - started
+        load_view(path)
+        started = time.perf_counter()
+        view = load_view(path)
+        view_seconds = time.perf_counter() - started
+        graph = view.to_graph()
+        graph_seconds = time.perf_counter() - started
+        print(f"{path}: rdflib parse {parse_seconds:.2f}s, cached view {view_seconds:.2f}s, "
+              f"cached Graph {graph_seconds:.2f}s ({len(graph)} triples, "
+              f"{os.path.getsize(cache_path(path)) / 1e6:.1f} MB cache)")
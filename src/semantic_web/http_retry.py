@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Retry helpers shared by the HTTP clients (openFDA fetch, Fuseki uploads).
+
+
+def retry_delay(response, default):
+    """
+    Seconds to wait before retrying: the Retry-After header (delta-seconds or
+    an HTTP-date, RFC 9110) when it parses, else default.
+    """
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+            return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            pass
+    return default
@@ -0,0 +1,408 @@
+import os
+import re
+import json
+import time
+import zlib
+import argparse
+import numpy as np
+from record_io import iter_records
+
+# Near-duplicate clustering of recall narratives with MinHash and LSH.
+# Each record's reason_for_recall + product_description is normalized (case,
+# punctuation, and digit runs, which are mostly lot numbers, NDCs and dates)
+# into word 3-gram shingles, hashed to 32 bits, and reduced to a NUM_PERM MinHash
+# signature in NumPy batches. Signatures are split into BANDS bands; records
+# whose band hashes collide are candidates, and a candidate joins a cluster
+# when its estimated Jaccard similarity to the bucket's representative
+# reaches THRESHOLD. Every bucket remembers its representative, so new
+# records are only compared against the buckets they fall into and the
+# corpus is never compared pairwise. Clusters of two or more records are
+# written as fda: triples (a sidecar like the NER mentions) and joined into
+# the search documents.
+
+NUM_PERM = 128
+BANDS = 16  # 8 rows per band: candidate threshold ~ (1/16) ** (1/8) = 0.71
+THRESHOLD = 0.7
+SHINGLE = 3
+BATCH_SIZE = 10000
+PERM_BLOCK = 32  # permutations hashed at once, bounds the batch's temporary matrix
+SEED = 1
+
+FDA = "http://example.org/fda/quality/"
+EVENT_BASE = "http://example.org/resource/event/"
+CLUSTER_BASE = "http://example.org/resource/duplicate_cluster/"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_DIGITS = re.compile(r"[0-9]+")
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+_rng = np.random.default_rng(SEED)
+# Multiply-shift hash family h(x) = (a * x + b) >> 32 over 64-bit words, a odd
+_A = _rng.integers(1, 1 << 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+# Per-row multipliers folding a band's rows into one 64-bit bucket key
+_BAND_MIX = _rng.integers(1, 1 << 63, NUM_PERM // BANDS, dtype=np.uint64) | np.uint64(1)
+
+_token_hashes = {}
+
+
+def _token_ids(text):
+    ids = []
+    for token in _TOKEN.findall(_DIGITS.sub("0", text.lower())):
+        h = _token_hashes.get(token)
+        if h is None:
+            h = _token_hashes[token] = zlib.crc32(token.encode("utf-8"))
+        ids.append(h)
+    return ids
+
+
+def record_text(record):
+    return f"{record.get('reason_for_recall') or ''} {record.get('product_description') or ''}"
+
+
+def shingle_hashes(texts):
+    """
+    Flat uint64 array of 32-bit shingle hashes for a batch of texts, plus
+    the start offset of each text. Texts shorter than one shingle hash as a
+    single shingle of what they have.
+    """
+    tokens = [_token_ids(text) for text in texts]
+    lengths = np.array([len(t) for t in tokens], dtype=np.int64)
+    flat = np.fromiter((h for t in tokens for h in t), dtype=np.uint64, count=int(lengths.sum()))
+    starts = np.cumsum(lengths) - lengths
+
+    # Rolling polynomial hash of SHINGLE consecutive token hashes, computed
+    # for every position and then restricted to windows inside one text
+    ends = np.repeat(starts + lengths, lengths)
+    h = np.zeros(len(flat), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for k in range(SHINGLE):
+            index = np.arange(len(flat)) + k
+            shifted = np.where(index < ends, flat[np.minimum(index, len(flat) - 1)], np.uint64(0))
+            h = h * np.uint64(0x9E3779B1) + shifted
+    counts = np.maximum(lengths - SHINGLE + 1, np.minimum(lengths, 1))
+    owner = np.repeat(np.arange(len(texts)), counts)
+    position = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    shingles = (h[starts[owner] + position] ^ (h[starts[owner] + position] >> np.uint64(32))) & _MASK32
+    return shingles, np.cumsum(counts) - counts, counts
+
+
+def minhash(texts):
+    """
+    (len(texts), NUM_PERM) uint32 signatures, and a mask of the texts that had
+    any shingles. Texts without shingles get all-ones and must not be bucketed.
+    """
+    signatures = np.full((len(texts), NUM_PERM), 0xFFFFFFFF, dtype=np.uint32)
+    shingles, starts, counts = shingle_hashes(texts)
+    present = counts > 0
+    if not present.any():
+        return signatures, present
+    # (shingles, PERM_BLOCK) hash matrices, wrapping mod 2^64 by design
+    for block in range(0, NUM_PERM, PERM_BLOCK):
+        a, b = _A[block:block + PERM_BLOCK], _B[block:block + PERM_BLOCK]
+        with np.errstate(over="ignore"):
+            hashed = ((shingles[:, None] * a[None, :] + b[None, :]) >> np.uint64(32)).astype(np.uint32)
+        signatures[present, block:block + PERM_BLOCK] = np.minimum.reduceat(hashed, starts[present], axis=0)
+    return signatures, present
+
+
+def band_keys(signatures):
+    """(n, BANDS) uint64 bucket keys, one per band of rows."""
+    rows = signatures.reshape(len(signatures), BANDS, NUM_PERM // BANDS).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        return (rows * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+
+
+class DuplicateIndex:
+    """
+    Incremental MinHash/LSH state: per-record signatures and cluster labels
+    (a cluster is labelled with the row of its oldest record), and per band
+    a sorted table of bucket keys with the representative row of each bucket.
+    """
+
+    def __init__(self, keys=(), event_ids=(), signatures=None, clusters=None, alive=None,
+                 buckets=None, representatives=None):
+        self.keys = list(keys)
+        self.event_ids = list(event_ids)
+        self.rows = {key: i for i, key in enumerate(self.keys)}
+        # Grown by doubling, so adding a batch does not copy every signature
+        self._signatures = signatures if signatures is not None else np.empty((0, NUM_PERM), dtype=np.uint32)
+        self.clusters = clusters if clusters is not None else np.empty(0, dtype=np.int64)
+        self.alive = alive if alive is not None else np.empty(0, dtype=bool)
+        self.buckets = buckets or [np.empty(0, dtype=np.uint64) for _ in range(BANDS)]
+        self.representatives = representatives or [np.empty(0, dtype=np.int64) for _ in range(BANDS)]
+        self.changed_events = None
+
+    @property
+    def signatures(self):
+        return self._signatures[:len(self.keys)]
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def remove(self, keys):
+        """Retires records and re-clusters what they held together. Returns the number retired."""
+        rows = self._retire(keys)
+        if len(rows):
+            self._split(rows)
+        return len(rows)
+
+    def _retire(self, keys):
+        rows = np.array([self.rows.pop(key) for key in keys if key in self.rows], dtype=np.int64)
+        self.alive[rows] = False
+        return rows
+
+    def _split(self, retired):
+        """
+        Re-clusters the live members of the clusters that lost retired rows,
+        so records joined only through a retired record come apart (union-find
+        alone never splits). Retired rows stop representing buckets; the
+        members are bucketed again and verified like new records. Returns
+        candidate pairs checked.
+        """
+        for band in range(BANDS):
+            live = self.alive[self.representatives[band]]
+            if not live.all():
+                self.buckets[band] = self.buckets[band][live]
+                self.representatives[band] = self.representatives[band][live]
+        affected = np.isin(self.clusters, np.unique(self.clusters[retired]))
+        self.clusters[affected] = np.flatnonzero(affected)
+        members = np.flatnonzero(affected & self.alive)
+        # Records without shingles (all-ones signature) stay singletons, as in _add_batch
+        return self._bucket(members[(self.signatures[members] != 0xFFFFFFFF).any(axis=1)])
+
+    def add(self, records, batch_size=BATCH_SIZE):
+        """Adds (or replaces, by event_id|recall_number) records in batches. Returns candidate pairs checked."""
+        checked = 0
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                checked += self._add_batch(batch)
+                batch = []
+        if batch:
+            checked += self._add_batch(batch)
+        return checked
+
+    def _add_batch(self, records):
+        keys = [f"{r.get('event_id')}|{r.get('recall_number')}" for r in records]
+        retired = self._retire(keys)
+        first = len(self.keys)
+        rows = np.arange(first, first + len(records))
+        signatures, present = minhash([record_text(r) for r in records])
+        self.keys.extend(keys)
+        self.event_ids.extend(str(r.get("event_id")) for r in records)
+        self.rows.update(zip(keys, rows.tolist()))
+        if len(self._signatures) < len(self.keys):
+            grown = np.empty((max(len(self.keys), 2 * len(self._signatures)), NUM_PERM), dtype=np.uint32)
+            grown[:first] = self._signatures[:first]
+            self._signatures = grown
+        self._signatures[first:len(self.keys)] = signatures
+        self.clusters = np.concatenate([self.clusters, rows])
+        # A key repeated within the batch keeps only its last record
+        latest = np.fromiter((self.rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        self.alive = np.concatenate([self.alive, latest == rows])
+        checked = self._split(retired) if len(retired) else 0
+
+        # Records with an empty narrative would all collide (identical all-ones
+        # signatures); they stay singletons
+        return checked + self._bucket(rows[present & (latest == rows)])
+
+    def _bucket(self, rows):
+        """
+        Looks up (or opens) the bucket of each of rows in every band, verifies
+        the candidates against the bucket representatives and merges the
+        similar ones. Returns candidate pairs checked.
+        """
+        sources, targets = [], []
+        for band, keys_b in enumerate(band_keys(self.signatures[rows]).T):
+            buckets, reps = self.buckets[band], self.representatives[band]
+            # Buckets that already exist: compare against their representative
+            pos = np.searchsorted(buckets, keys_b)
+            found = pos < len(buckets)
+            found[found] = buckets[pos[found]] == keys_b[found]
+            rep = np.empty(len(rows), dtype=np.int64)
+            rep[found] = reps[pos[found]]
+            # New buckets: the batch's first record in them represents them
+            new_keys, first_index, inverse = np.unique(keys_b[~found], return_index=True, return_inverse=True)
+            rep[~found] = rows[~found][first_index][inverse]
+            insert_at = np.searchsorted(buckets, new_keys)
+            self.buckets[band] = np.insert(buckets, insert_at, new_keys)
+            self.representatives[band] = np.insert(reps, insert_at, rows[~found][first_index])
+
+            pair = rep != rows
+            sources.append(rows[pair])
+            targets.append(rep[pair])
+
+        sources, targets = np.concatenate(sources), np.concatenate(targets)
+        if len(sources):
+            # Candidates from several bands repeat; verify each pair once
+            pairs = np.unique(sources * len(self.keys) + targets)
+            sources, targets = pairs // len(self.keys), pairs % len(self.keys)
+            similar = (self.signatures[sources] == self.signatures[targets]).mean(axis=1) >= THRESHOLD
+            self._union(sources[similar], targets[similar])
+        return len(sources)
+
+    def _union(self, sources, targets):
+        """Merges the clusters of each pair, keeping the smaller (older) label."""
+        while len(sources):
+            a, b = self.clusters[sources], self.clusters[targets]
+            differ = a != b
+            if not differ.any():
+                return
+            mapping = np.arange(len(self.clusters))
+            np.minimum.at(mapping, np.maximum(a, b)[differ], np.minimum(a, b)[differ])
+            while True:
+                jumped = mapping[mapping]
+                if np.array_equal(jumped, mapping):
+                    break
+                mapping = jumped
+            self.clusters = mapping[self.clusters]
+
+    def cluster_sizes(self):
+        return np.bincount(self.clusters[self.alive], minlength=len(self.clusters))
+
+    def duplicate_clusters(self):
+        """{cluster label: [record keys]} for clusters with two or more live records."""
+        sizes = self.cluster_sizes()
+        live = np.flatnonzero(self.alive & (sizes[self.clusters] > 1))
+        clusters = {}
+        for row in live[np.argsort(self.clusters[live], kind="stable")]:
+            clusters.setdefault(int(self.clusters[row]), []).append(row)
+        return clusters
+
+    def event_clusters(self):
+        """{event_id: ((cluster label, size), ...)} for events in a duplicate cluster."""
+        events = {}
+        for label, rows in self.duplicate_clusters().items():
+            for event_id in dict.fromkeys(self.event_ids[row] for row in rows):
+                events.setdefault(event_id, []).append((label, len(rows)))
+        return {event_id: tuple(clusters) for event_id, clusters in events.items()}
+
+    # -- Persistence --
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, keys=np.array(self.keys, dtype=str), event_ids=np.array(self.event_ids, dtype=str),
+                 signatures=self.signatures, clusters=self.clusters, alive=self.alive,
+                 **{f"buckets_{b}": self.buckets[b] for b in range(BANDS)},
+                 **{f"representatives_{b}": self.representatives[b] for b in range(BANDS)})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["keys"].tolist(), data["event_ids"].tolist(), data["signatures"], data["clusters"],
+                       data["alive"], [data[f"buckets_{b}"] for b in range(BANDS)],
+                       [data[f"representatives_{b}"] for b in range(BANDS)])
+
+
+def write_triples(index, output_path):
+    """
+    Writes the duplicate clusters as N-Triples: each cluster is an
+    fda:DuplicateCluster with an fda:clusterSize, and each event with a
+    member record points to it with fda:inDuplicateCluster.
+    """
+    from ntriples import nt_literal, nt_term
+    a = nt_term("http://www.w3.org/1999/02/22-rdf-syntax-ns#type")
+    in_cluster, size = nt_term(FDA + "inDuplicateCluster"), nt_term(FDA + "clusterSize")
+    integer = "http://www.w3.org/2001/XMLSchema#integer"
+    clusters = index.duplicate_clusters()
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for label, rows in clusters.items():
+            cluster = nt_term(f"{CLUSTER_BASE}{label}")
+            f.write(f"{cluster} {a} {nt_term(FDA + 'DuplicateCluster')} .\n")
+            f.write(f"{cluster} {size} {nt_literal(str(len(rows)), datatype=integer)} .\n")
+            count += 2
+            for event_id in dict.fromkeys(index.event_ids[row] for row in rows):
+                f.write(f"{nt_term(EVENT_BASE + event_id)} {in_cluster} {cluster} .\n")
+                count += 1
+    return len(clusters), count
+
+
+def build_or_update(state_path, output_path, json_path, changeset=None):
+    """
+    Applies a changeset (dict or path) to the saved LSH state, or clusters
+    the whole corpus, then rewrites the triples sidecar. Returns the index;
+    after a changeset its changed_events are the events whose clusters or
+    cluster sizes changed (None after a full build).
+    """
+    if isinstance(changeset, str):
+        with open(changeset, "r") as f:
+            changeset = json.load(f)
+
+    started = time.monotonic()
+    if changeset is not None and os.path.exists(state_path):
+        index = DuplicateIndex.load(state_path)
+        before = index.event_clusters()
+        records = changeset.get("records")
+        if records is None:
+            keys = set(changeset.get("added", [])) | set(changeset.get("changed", []))
+            records = [r for r in iter_records(json_path) if f"{r.get('event_id')}|{r.get('recall_number')}" in keys]
+        removed = index.remove(changeset.get("removed", []))
+        checked = index.add(records)
+        # A record joining or leaving a cluster changes what its other members' documents say
+        after = index.event_clusters()
+        index.changed_events = {e for e in before.keys() | after.keys() if before.get(e) != after.get(e)}
+        print(f"Added {len(records)} records to the LSH index ({checked} candidate pairs checked, {removed} removed, "
+              f"{len(index.changed_events)} events with changed clusters)")
+    else:
+        index = DuplicateIndex()
+        checked = index.add(iter_records(json_path))
+        print(f"Clustered {len(index)} records ({checked} candidate pairs checked)")
+    index.save(state_path)
+    clusters, triples = write_triples(index, output_path)
+    print(f"Wrote {clusters} near-duplicate clusters ({triples} triples) to {output_path} "
+          f"({time.monotonic() - started:.1f}s)")
+    return index
+
+
+def benchmark(n, templates=2000, seed=0):
+    """
+    Clusters n synthetic recalls: boilerplate templates whose copies differ in
+    the firm named at the end. Reports throughput and how well the clusters
+    recover the templates.
+    """
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    words = ["".join(rng.choice(letters, 6)) for _ in range(5000)]
+    base = [" ".join(rng.choice(words, 25)) for _ in range(templates)]
+    firms = ["".join(rng.choice(letters, 8)) for _ in range(500)]
+
+    def records():
+        for i in range(n):
+            yield {"event_id": str(i), "recall_number": f"R-{i}", "product_description": "",
+                   "reason_for_recall": f"{base[i % templates]} recalled by {firms[rng.integers(len(firms))]}"}
+
+    index = DuplicateIndex()
+    started = time.monotonic()
+    checked = index.add(records())
+    elapsed = time.monotonic() - started
+    template = np.arange(n) % templates
+    # A cluster is pure when all its records come from one template
+    clusters = index.duplicate_clusters()
+    pure = sum(len(set(template[rows])) == 1 for rows in clusters.values())
+    clustered = np.bincount(index.clusters, minlength=n)[index.clusters] > 1
+    print(f"{n} records in {elapsed:.1f}s ({n / elapsed:.0f} records/s), {checked} candidate pairs checked")
+    print(f"{len(clusters)} clusters for {templates} templates, {pure} pure, "
+          f"{clustered.mean():.1%} of records clustered")
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    JSON_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.jsonl")
+    CHANGESET_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.changeset.json")
+    STATE_PATH = os.path.join(BASE_DIR, "data", "processed", "near_duplicates.npz")
+    OUTPUT_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_duplicate_clusters.nt")
+
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate recall narratives with MinHash/LSH.")
+    parser.add_argument("--changed-only", action="store_true",
+                        help=f"Apply {os.path.basename(CHANGESET_PATH)} to the saved LSH state")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Cluster N synthetic records and report throughput")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+    else:
+        build_or_update(STATE_PATH, OUTPUT_PATH, JSON_PATH, CHANGESET_PATH if args.changed_only else None)
@@ -0,0 +1,170 @@
+import time
+import threading
+from collections import OrderedDict
+
+# One-hop neighborhoods of recall events for the dashboard graph view.
+# A neighborhood is a compact tuple of (predicate, object, label, kind) edges.
+# Events indexed with the denormalized search fields are built straight from
+# their ES document; the rest are fetched for a whole result page in one
+# batched SPARQL query that returns exactly one row per edge. Built
+# neighborhoods are memoized in a bounded LRU shared by all sessions; entries
+# expire after TTL seconds so a refreshed graph shows up without a restart.
+
+MAX_ENTRIES = 20000
+TTL = 600
+BATCH_SIZE = 50
+
+FDA = "http://example.org/fda/quality/"
+
+# Edge kinds, used by the dashboard for node colors
+LITERAL = "literal"
+CONCEPT = "concept"
+ENTITY = "entity"
+RESOURCE = "resource"
+
+# Search document fields that become literal edges, with their graph predicate
+DOCUMENT_FIELDS = [
+    ("recall_number", "recallNumber"),
+    ("recalling_firm", "recallingFirm"),
+    ("reason_for_recall", "reasonForRecall"),
+    ("report_date", "date"),
+]
+
+BATCH_QUERY = """
+PREFIX fda: <http://example.org/fda/quality/>
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+
+SELECT ?event ?p ?o (SAMPLE(?l) AS ?label) (SAMPLE(?t) AS ?type) WHERE {{
+  VALUES ?event {{ {values} }}
+  ?event ?p ?o .
+  OPTIONAL {{ ?o rdfs:label|skos:prefLabel ?l }}
+  OPTIONAL {{ ?o fda:entityType ?t }}
+}}
+GROUP BY ?event ?p ?o
+"""
+
+
+def short_name(uri):
+    """Local name of a predicate or resource URI."""
+    return uri.split("/")[-1].split("#")[-1]
+
+
+def edge_kind(predicate, is_literal):
+    if is_literal:
+        return LITERAL
+    if predicate == "hasFailureType":
+        return CONCEPT
+    if predicate == "mentionsEntity":
+        return ENTITY
+    return RESOURCE
+
+
+def from_document(doc):
+    """Neighborhood of an event from its denormalized search document."""
+    edges = []
+    # Literal node ids are "<predicate>:<value>", as in from_bindings
+    for field, predicate in DOCUMENT_FIELDS:
+        if doc.get(field):
+            edges.append((predicate, f"{predicate}:{doc[field]}", str(doc[field]), LITERAL))
+    if doc.get("failure_type_uri"):
+        labels = doc.get("failure_type_labels") or [doc.get("failure_type")]
+        edges.append(("hasFailureType", doc["failure_type_uri"], labels[0], CONCEPT))
+    for entity in doc.get("entities", []):
+        edges.append(("mentionsEntity", entity["uri"], entity.get("label") or short_name(entity["uri"]), ENTITY))
+    return tuple(edges)
+
+
+def from_bindings(bindings):
+    """Groups batched SPARQL rows into {event URI: neighborhood}."""
+    grouped = {}
+    for row in bindings:
+        predicate = short_name(row["p"]["value"])
+        value = row["o"]["value"]
+        is_literal = row["o"]["type"] != "uri"
+        if is_literal:
+            node_id, label = f"{predicate}:{value}", value
+        else:
+            node_id, label = value, row.get("label", {}).get("value", short_name(value))
+        grouped.setdefault(row["event"]["value"], []).append(
+            (predicate, node_id, label, edge_kind(predicate, is_literal)))
+    return {event: tuple(edges) for event, edges in grouped.items()}
+
+
+class NeighborhoodService:
+    """
+    Memoizing neighborhood lookup over a SPARQLClient. prefetch() fills the
+    cache for a page of events at once so that get() is a dictionary hit.
+    Cached neighborhoods expire after ttl seconds.
+    """
+
+    def __init__(self, client, max_entries=MAX_ENTRIES, batch_size=BATCH_SIZE, ttl=TTL):
+        self.client = client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+
+    def _store(self, event_uri, edges):
+        with self.lock:
+            self.cache[event_uri] = (time.monotonic(), edges)
+            self.cache.move_to_end(event_uri)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+    def prefetch(self, event_uris, documents=None):
+        """
+        Makes sure the neighborhoods of event_uris are cached. documents maps
+        event URIs to their search documents; denormalized ones need no query.
+        Returns {event URI: neighborhood}.
+        """
+        documents = documents or {}
+        found, missing = {}, []
+        now = time.monotonic()
+        with self.lock:
+            for uri in dict.fromkeys(event_uris):
+                entry = self.cache.get(uri)
+                if entry is not None and now - entry[0] < self.ttl:
+                    self.cache.move_to_end(uri)
+                    found[uri] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(uri)
+                    self.misses += 1
+
+        to_query = []
+        for uri in missing:
+            doc = documents.get(uri)
+            if doc and "event_uri" in doc:
+                found[uri] = from_document(doc)
+                self._store(uri, found[uri])
+            else:
+                to_query.append(uri)
+
+        batches = [to_query[i:i + self.batch_size] for i in range(0, len(to_query), self.batch_size)]
+        queries = [BATCH_QUERY.format(values=" ".join(f"<{uri}>" for uri in batch)) for batch in batches]
+        self.queries += len(queries)
+        for batch, result in zip(batches, self.client.query_many(queries, strict=True) if queries else []):
+            fetched = from_bindings(result["results"]["bindings"])
+            for uri in batch:
+                found[uri] = fetched.get(uri, ())
+                self._store(uri, found[uri])
+        return found
+
+    def get(self, event_uri, document=None):
+        return self.prefetch([event_uri], {event_uri: document} if document else None)[event_uri]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.cache),
+                "queries": self.queries,
+            }
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# Persistent cache of filtered NER results.
+# Entries are keyed by sha256(model id + text). The model id covers the model
+# version, the entity labels and the source of the entity filter (see
+# ner_enricher.model_id), so a model upgrade or a change to the filter
+# heuristics simply misses instead of serving stale spans. The cache
+# is bounded: once it grows past max_entries the least recently used entries
+# are evicted.
+
+MAX_ENTRIES = 500000
+SQLITE_MAX_VARIABLES = 900
+
+
+class NERCache:
+    """
+    SQLite-backed text -> entity-span cache with LRU eviction and hit/miss counters.
+    """
+
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ner_cache ("
+            " key TEXT PRIMARY KEY, spans TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ner_cache_last_used ON ner_cache(last_used)")
+
+    @staticmethod
+    def key(model_id, text):
+        return hashlib.sha256(f"{model_id}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Returns {key: spans} for the cached keys and bumps their recency."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), SQLITE_MAX_VARIABLES):
+            chunk = unique[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, spans FROM ner_cache WHERE key IN ({placeholders})", chunk
+            )
+            for key, spans in rows:
+                found[key] = [tuple(span) for span in json.loads(spans)]
+
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE ner_cache SET last_used = ? WHERE key = ?",
+                                  [(now, key) for key in found])
+            self.conn.commit()
+
+        hits = sum(1 for key in keys if key in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items):
+        """Stores (key, spans) pairs, then evicts down to the size bound."""
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO ner_cache (key, spans, last_used) VALUES (?, ?, ?)",
+            [(key, json.dumps(spans), now) for key, spans in items],
+        )
+        self.conn.commit()
+        self.evict()
+
+    def evict(self):
+        """Drops the least recently used entries beyond max_entries."""
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM ner_cache").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM ner_cache WHERE key IN "
+                "(SELECT key FROM ner_cache ORDER BY last_used LIMIT ?)", (excess,)
+            )
+            self.conn.commit()
+        return max(excess, 0)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM ner_cache").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    CACHE_PATH = os.path.join(BASE_DIR, "data", "processed", "ner_cache.sqlite")
+
+    if os.path.exists(CACHE_PATH):
+        cache = NERCache(CACHE_PATH)
+        print(f"{CACHE_PATH}: {len(cache)} cached texts")
+        cache.close()
+    else:
+        print(f"No NER cache at {CACHE_PATH}")
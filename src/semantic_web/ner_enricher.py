@@ -1,25 +1,226 @@
 import spacy
 import os
-from rdflib import Graph, Literal, Namespace, URIRef
+import re
+import time
+import hashlib
+import inspect
+import argparse
+from itertools import islice
+from rdflib import Literal, Namespace, URIRef
 from rdflib.namespace import RDF, RDFS, SKOS
+from record_io import iter_records
+from ner_cache import NERCache
+from ntriples import NTriplesWriter
+from graph_cache import load_graph
 
 # Namespaces
 FDA = Namespace("http://example.org/fda/quality/")
 
-def enrich_data(input_ttl_path, output_ttl_path):
+MODEL_NAME = os.environ.get("SPACY_MODEL", "en_core_web_sm")
+# Unix socket of a resident NER worker (ner_service.py) to use instead of loading the model
+WORKER_SOCKET = os.environ.get("NER_WORKER_SOCKET")
+# We focus on ORG (Companies), GPE (Locations)
+ENTITY_LABELS = ("ORG", "GPE")
+BATCH_SIZE = 256
+N_PROCESS = 1
+# Texts are looked up in the NER cache in chunks; only the misses reach spaCy
+CACHE_CHUNK = 20000
+
+def load_model(model_name=MODEL_NAME):
+    """
+    Loads the spaCy pipeline with every component NER does not need disabled.
+    A shared tok2vec is only kept if the ner component listens to it.
+    """
+    nlp = spacy.load(model_name)
+    keep = {"ner"}
+    for name, pipe in nlp.pipeline:
+        if "ner" in getattr(pipe, "listening_components", []):
+            keep.add(name)
+    disabled = [name for name in nlp.pipe_names if name not in keep]
+    nlp.select_pipes(disable=disabled)
+    print(f"Loaded {model_name}, running {nlp.pipe_names} (disabled {disabled})")
+    return nlp
+
+def load_annotator(worker_socket=WORKER_SOCKET, model_name=MODEL_NAME):
+    """
+    The NER model for annotate(): a client of the resident worker on
+    worker_socket when one is running the same model, else the spaCy pipeline
+    loaded in-process. The client falls back to the latter if the worker dies.
+    """
+    if worker_socket:
+        from ner_service import NERClient
+        try:
+            client = NERClient.connect(worker_socket, fallback=lambda: load_model(model_name))
+            worker_model = client.ping()["model"]
+        except (OSError, ConnectionError, RuntimeError) as e:
+            print(f"NER worker on {worker_socket} unavailable ({e}); loading the model in-process")
+        else:
+            if worker_model == model_id(model_name):
+                print(f"Using NER worker on {worker_socket} ({worker_model})")
+                return client
+            print(f"NER worker runs {worker_model}, not {model_id(model_name)}; loading the model in-process")
+            client.close()
+    return load_model(model_name)
+
+def iter_texts(json_path):
+    """Yields (text, event_id) for every raw record with annotatable text."""
+    return record_texts(iter_records(json_path))
+
+def record_texts(records):
+    """(text, event_id) pairs of the records that have annotatable text."""
+    for record in records:
+        event_id = record.get("event_id")
+        text = (record.get("product_description") or "") + " " + (record.get("reason_for_recall") or "")
+
+        if not event_id or not text.strip():
+            continue
+        yield text, event_id
+
+def filter_entities(doc):
+    """Returns the (text, label) entities of a doc that we link into the graph."""
+    entities = []
+    for ent in doc.ents:
+        if ent.label_ in ENTITY_LABELS:
+            text_clean = ent.text.strip()
+
+            # Heuristic/Guard: Skip obvious false positives from NER
+            if ent.label_ == "ORG" and (text_clean.startswith("Failed ") or "Impurities" in text_clean or len(text_clean) > 50):
+                continue
+            entities.append((ent.text, ent.label_))
+    return entities
+
+def annotate(nlp, texts, batch_size=BATCH_SIZE, n_process=N_PROCESS):
+    """
+    Streams (text, event_id) pairs through nlp.pipe and yields (event_id, entities)
+    in input order. Reports throughput in docs/sec when done. nlp may also be a
+    resident worker client (see load_annotator), which reports batch latencies.
+    """
+    if hasattr(nlp, "request"):
+        yield from nlp.annotate(texts, batch_size)
+        return
+    started = time.monotonic()
+    docs = 0
+    for doc, event_id in nlp.pipe(texts, as_tuples=True, batch_size=batch_size, n_process=n_process):
+        docs += 1
+        yield event_id, filter_entities(doc)
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(f"Annotated {docs} docs in {elapsed:.1f}s ({docs / elapsed:.1f} docs/s, "
+          f"batch_size={batch_size}, n_process={n_process})")
+
+def model_id(model_name=MODEL_NAME):
+    """
+    Identifies the model, its version and the entity filter without loading the
+    pipeline, so cache keys change whenever any of them does. The filter is
+    identified by its labels and a hash of filter_entities' source, which
+    covers its heuristics.
+    """
+    if spacy.util.is_package(model_name):
+        path = spacy.util.get_package_path(model_name)
+    else:
+        path = model_name
+    meta = spacy.util.get_model_meta(path)
+    filter_hash = hashlib.sha256(inspect.getsource(filter_entities).encode("utf-8")).hexdigest()[:12]
+    return f"{meta.get('lang')}_{meta.get('name')}-{meta.get('version')}:{','.join(ENTITY_LABELS)}:{filter_hash}"
+
+def annotate_cached(load_nlp, texts, cache, model_key, batch_size=BATCH_SIZE, n_process=N_PROCESS):
+    """
+    Like annotate(), but serves texts seen before from the cache. The model is
+    only loaded (via load_nlp) once the first cache miss shows up.
+    """
+    nlp = None
+    texts = iter(texts)
+    while True:
+        chunk = list(islice(texts, CACHE_CHUNK))
+        if not chunk:
+            break
+        keys = [NERCache.key(model_key, text) for text, _ in chunk]
+        found = cache.get_many(keys)
+
+        # Boilerplate texts repeat within a chunk; annotate each distinct one once
+        misses = {key: text for (text, _), key in zip(chunk, keys) if key not in found}
+        misses = [(text, key) for key, text in misses.items()]
+        if misses:
+            if nlp is None:
+                nlp = load_nlp()
+            fresh = dict(annotate(nlp, misses, batch_size, n_process))
+            cache.put_many(fresh.items())
+            found.update(fresh)
+
+        for (_, event_id), key in zip(chunk, keys):
+            yield event_id, found[key]
+
+def entity_slug(text):
+    """Safer slug generation: replace non-alphanumeric chars with _"""
+    slug = re.sub(r'[^a-zA-Z0-9]', '_', text.strip().lower())
+    return re.sub(r'_+', '_', slug).strip('_')
+
+def add_mentions(g, event_id, entities, defined=None):
+    """
+    Adds mention and entity triples for one event; returns the number of
+    distinct entities it mentions. Repeats within the event are dropped here.
+    defined, a set shared across calls, remembers the entity definitions
+    (entity, name and type keys; not triples) already written, so a streamed
+    sidecar defines each entity once instead of once per mentioning event.
+    """
+    defined = set() if defined is None else defined
+    event_uri = URIRef(f"http://example.org/resource/event/{event_id}")
+    triples = {}
+    for text, label in entities:
+        entity_uri = URIRef(f"http://example.org/resource/entity/{entity_slug(text)}")
+
+        # Link event to entity
+        triples[(event_uri, FDA.mentionsEntity, entity_uri)] = None
+
+        # Define entity
+        if entity_uri not in defined:
+            defined.add(entity_uri)
+            triples[(entity_uri, RDF.type, FDA.Entity)] = None
+            triples[(entity_uri, RDF.type, SKOS.Concept)] = None
+        if (entity_uri, text) not in defined:
+            defined.add((entity_uri, text))
+            triples[(entity_uri, RDFS.label, Literal(text))] = None
+            triples[(entity_uri, SKOS.prefLabel, Literal(text))] = None
+        if (entity_uri, None, label) not in defined:
+            defined.add((entity_uri, None, label))
+            triples[(entity_uri, FDA.entityType, Literal(label))] = None
+    for triple in triples:
+        g.add(triple)
+    return sum(1 for triple in triples if triple[0] == event_uri)
+
+def _default_json_path():
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.jsonl")
+
+def _annotated(json_path, batch_size, n_process, cache_path, worker_socket=WORKER_SOCKET):
+    """Returns (annotated, cache): the (event_id, entities) stream and the open cache, if any."""
+    load = lambda: load_annotator(worker_socket)
+    if cache_path:
+        cache = NERCache(cache_path)
+        return annotate_cached(load, iter_texts(json_path), cache, model_id(),
+                               batch_size, n_process), cache
+    print("Loading NER model...")
+    return annotate(load(), iter_texts(json_path), batch_size, n_process), None
+
+def _report_cache(cache):
+    if cache:
+        stats = cache.stats()
+        print(f"NER cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.1%} hit rate, {stats['entries']} entries)")
+        cache.close()
+
+def enrich_data(input_ttl_path, output_ttl_path, json_path=None, batch_size=BATCH_SIZE, n_process=N_PROCESS,
+                cache_path=None, worker_socket=WORKER_SOCKET):
     """
     Reads the RDF graph, finds product descriptions, runs NER, and adds links.
+    With a cache_path, entities of previously annotated texts are reused; with a
+    worker_socket, texts are annotated by the resident NER worker if it is up.
     """
     if not os.path.exists(input_ttl_path):
         print(f"Input file not found: {input_ttl_path}")
         return
 
-    print("Loading SpaCy model...")
-    nlp = spacy.load("en_core_web_sm")
-
     print(f"Loading knowledge graph: {input_ttl_path}")
-    g = Graph()
-    g.parse(input_ttl_path, format="turtle")
+    g = load_graph(input_ttl_path)
     g.bind("fda", FDA)
 
     # Find events with product descriptions (logic: in original JSON described, here we map from JSON properties or check if we kept it in RDF)
@@ -28,59 +229,72 @@ def enrich_data(input_ttl_path, output_ttl_path):
     # Checking rdf_transformer.py... it didn't map product_description explicitly.
     # To save time, we will scan the JSON source again for text, but link to the URI constructed by event_id.
     
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    JSON_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.json")
-    
-    import json
-    with open(JSON_PATH, 'r') as f:
-        data = json.load(f)
+    if json_path is None:
+        json_path = _default_json_path()
 
     print("Enriching graph with extracted entities...")
     count = 0
-    for record in data:
-        event_id = record.get("event_id")
-        text = record.get("product_description", "") + " " + record.get("reason_for_recall", "")
-        
-        if not event_id or not text.strip():
-            continue
-
-        doc = nlp(text)
-        event_uri = URIRef(f"http://example.org/resource/event/{event_id}")
-
-        for ent in doc.ents:
-            # We focus on ORG (Companies), GPE (Locations)
-            if ent.label_ in ["ORG", "GPE"]:
-                text_clean = ent.text.strip()
-                
-                # Heuristic/Guard: Skip obvious false positives from NER
-                if ent.label_ == "ORG" and (text_clean.startswith("Failed ") or "Impurities" in text_clean or len(text_clean) > 50):
-                    continue
-                
-                # Safer slug generation: replace non-alphanumeric chars with _
-                import re
-                entity_slug = re.sub(r'[^a-zA-Z0-9]', '_', text_clean.lower())
-                entity_slug = re.sub(r'_+', '_', entity_slug).strip('_')
-                
-                entity_uri = URIRef(f"http://example.org/resource/entity/{entity_slug}")
-                
-                # Link event to entity
-                g.add((event_uri, FDA.mentionsEntity, entity_uri))
-                
-                # Define entity
-                g.add((entity_uri, RDF.type, FDA.Entity))
-                g.add((entity_uri, RDF.type, SKOS.Concept))
-                g.add((entity_uri, RDFS.label, Literal(ent.text)))
-                g.add((entity_uri, SKOS.prefLabel, Literal(ent.text)))
-                g.add((entity_uri, FDA.entityType, Literal(ent.label_)))
-                count += 1
+    defined = set()
+    annotated, cache = _annotated(json_path, batch_size, n_process, cache_path, worker_socket)
+    for event_id, entities in annotated:
+        count += add_mentions(g, event_id, entities, defined)
     
     print(f"Added {count} entity mentions.")
+    _report_cache(cache)
     g.serialize(destination=output_ttl_path, format="turtle")
     print(f"Enriched graph saved to {output_ttl_path}")
 
+def enrich_delta(output_path, json_path=None, batch_size=BATCH_SIZE, n_process=N_PROCESS,
+                 cache_path=None, graph_uri=None, worker_socket=WORKER_SOCKET):
+    """
+    Writes only the entity/mention triples as a streamed N-Triples sidecar
+    (N-Quads in graph_uri when given) to be loaded alongside the base graph.
+    The base graph is never parsed, so cost tracks the new triples only.
+    """
+    if json_path is None:
+        json_path = _default_json_path()
+    if not os.path.exists(json_path):
+        print(f"Input file not found: {json_path}")
+        return
+
+    print("Extracting entity mentions...")
+    count = 0
+    defined = set()
+    annotated, cache = _annotated(json_path, batch_size, n_process, cache_path, worker_socket)
+    with NTriplesWriter(output_path, graph_uri=graph_uri) as out:
+        for event_id, entities in annotated:
+            count += add_mentions(out, event_id, entities, defined)
+
+    print(f"Added {count} entity mentions.")
+    _report_cache(cache)
+    print(f"Wrote {len(out)} enrichment triples to {output_path}")
+
 if __name__ == "__main__":
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    INPUT_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.ttl")
+    INPUT_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.nt")
     OUTPUT_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph_enriched.ttl")
-    
-    enrich_data(INPUT_PATH, OUTPUT_PATH)
+    DELTA_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_entity_mentions.nt")
+    CACHE_PATH = os.path.join(BASE_DIR, "data", "processed", "ner_cache.sqlite")
+
+    parser = argparse.ArgumentParser(description="Enrich the knowledge graph with spaCy NER entities.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--n-process", type=int, default=N_PROCESS,
+                        help="Worker processes for nlp.pipe (-1 uses all cores)")
+    parser.add_argument("--no-cache", action="store_true", help="Re-annotate every text")
+    parser.add_argument("--delta", action="store_true",
+                        help=f"Only write the new triples to {os.path.basename(DELTA_PATH)} instead of "
+                             "re-serializing the whole graph")
+    parser.add_argument("--graph", help="Named graph URI for the delta (writes N-Quads)")
+    parser.add_argument("--worker", nargs="?", const=os.path.join(BASE_DIR, "data", "processed", "ner_worker.sock"),
+                        default=WORKER_SOCKET, metavar="SOCKET",
+                        help="Annotate via the resident NER worker (ner_service.py) if it is running")
+    args = parser.parse_args()
+    cache_path = None if args.no_cache else CACHE_PATH
+
+    if args.delta:
+        delta_path = DELTA_PATH[:-3] + ".nq" if args.graph else DELTA_PATH
+        enrich_delta(delta_path, batch_size=args.batch_size, n_process=args.n_process,
+                     cache_path=cache_path, graph_uri=args.graph, worker_socket=args.worker)
+    else:
+        enrich_data(INPUT_PATH, OUTPUT_PATH, batch_size=args.batch_size, n_process=args.n_process,
+                    cache_path=cache_path, worker_socket=args.worker)
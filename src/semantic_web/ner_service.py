@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import signal
+import threading
+import subprocess
+import socketserver
+from collections import deque
+from itertools import islice
+import numpy as np
+from ner_enricher import MODEL_NAME, BATCH_SIZE, annotate, filter_entities, load_model, model_id
+
+# Resident NER worker.
+# Loading and warming up the spaCy pipeline costs seconds, which dominates
+# enrichment of the few records an incremental fetch brings in. The worker
+# loads the model once and serves annotation requests over a Unix socket (or
+# stdin/stdout when spawned as a child process). The protocol is one JSON
+# object per line each way:
+#   {"op": "annotate", "texts": [...]} -> {"entities": [[[text, label], ...], ...], "seconds": ...}
+#   {"op": "ping"} -> {"model": ..., "pid": ..., "uptime": ...}
+#   {"op": "stats"} -> per-batch latency summary
+#   {"op": "shutdown"}
+# Failures come back as {"error": ...}. NERClient speaks the protocol and falls
+# back to the in-process model when the worker goes away mid-run.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SOCKET_PATH = os.path.join(BASE_DIR, "data", "processed", "ner_worker.sock")
+CONNECT_TIMEOUT = 2.0
+REQUEST_TIMEOUT = 300.0
+# Batches kept for the latency summary
+METRICS_WINDOW = 1000
+
+
+def latency_summary(batches):
+    """Summary of (docs, seconds) batch samples."""
+    if not batches:
+        return {"batches": 0, "docs": 0}
+    docs = np.array([b[0] for b in batches])
+    seconds = np.array([b[1] for b in batches])
+    return {
+        "batches": len(batches),
+        "docs": int(docs.sum()),
+        "p50_ms": round(float(np.percentile(seconds, 50)) * 1000, 1),
+        "p95_ms": round(float(np.percentile(seconds, 95)) * 1000, 1),
+        "max_ms": round(float(seconds.max()) * 1000, 1),
+        "docs_per_s": round(float(docs.sum() / max(seconds.sum(), 1e-9)), 1),
+    }
+
+
+class NERWorker:
+    """The loaded model and its per-batch metrics; answers protocol requests."""
+
+    def __init__(self, model_name=MODEL_NAME, batch_size=BATCH_SIZE):
+        started = time.monotonic()
+        self.nlp = load_model(model_name)
+        self.model = model_id(model_name)
+        self.batch_size = batch_size
+        self.load_seconds = time.monotonic() - started
+        self.started = time.monotonic()
+        self.lock = threading.Lock()  # spaCy pipelines are not safe to share between threads
+        self.batches = deque(maxlen=METRICS_WINDOW)
+        print(f"[ner worker] {self.model} ready in {self.load_seconds:.1f}s", file=sys.stderr)
+
+    def annotate(self, texts):
+        with self.lock:
+            started = time.perf_counter()
+            entities = [filter_entities(doc) for doc in self.nlp.pipe(texts, batch_size=self.batch_size)]
+            seconds = time.perf_counter() - started
+            self.batches.append((len(texts), seconds))
+        return entities, seconds
+
+    def handle(self, request):
+        op = request.get("op", "annotate")
+        if op == "annotate":
+            entities, seconds = self.annotate(request["texts"])
+            return {"entities": entities, "seconds": seconds}
+        if op == "ping":
+            return {"model": self.model, "pid": os.getpid(), "uptime": time.monotonic() - self.started}
+        if op == "stats":
+            return {"model": self.model, "load_seconds": self.load_seconds, **latency_summary(self.batches)}
+        if op == "shutdown":
+            return {"ok": True}
+        raise ValueError(f"Unknown op: {op}")
+
+    def serve_stream(self, rfile, wfile):
+        """Answers requests line by line until EOF; returns True on shutdown."""
+        for line in rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                response = self.handle(request)
+            except Exception as e:
+                request, response = {}, {"error": f"{type(e).__name__}: {e}"}
+            wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            wfile.flush()
+            if request.get("op") == "shutdown":
+                return True
+        return False
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path=SOCKET_PATH, model_name=MODEL_NAME, batch_size=BATCH_SIZE):
+    """Runs the worker on a Unix socket until a shutdown request or Ctrl-C."""
+    if os.path.exists(socket_path):
+        try:
+            NERClient.connect(socket_path).close()
+            raise RuntimeError(f"An NER worker is already listening on {socket_path}")
+        except OSError:
+            os.remove(socket_path)  # stale socket of a worker that died
+
+    worker = NERWorker(model_name, batch_size)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            if worker.serve_stream(self.rfile, self.wfile):
+                threading.Thread(target=server.shutdown, daemon=True).start()
+
+    server = _Server(socket_path, Handler)
+    os.chmod(socket_path, 0o600)
+    print(f"[ner worker] listening on {socket_path}", file=sys.stderr)
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        print(f"[ner worker] stopped: {latency_summary(worker.batches)}", file=sys.stderr)
+
+
+class NERClient:
+    """
+    Client of a resident NER worker. annotate() has the same interface as
+    ner_enricher.annotate(); with a fallback (a callable returning a spaCy
+    pipeline) it finishes in-process if the worker stops answering.
+    """
+
+    def __init__(self, rfile, wfile, close=None, fallback=None):
+        self.rfile = rfile
+        self.wfile = wfile
+        self._close = close
+        self.fallback = fallback
+        self.batches = []  # (docs, round-trip seconds, worker seconds) per batch
+
+    @classmethod
+    def connect(cls, socket_path=SOCKET_PATH, fallback=None):
+        """Connects to the worker on socket_path; raises OSError if none is listening."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(socket_path)
+            sock.settimeout(REQUEST_TIMEOUT)
+        except OSError:
+            sock.close()
+            raise
+        return cls(sock.makefile("rb"), sock.makefile("wb"), sock.close, fallback)
+
+    @classmethod
+    def spawn(cls, model_name=MODEL_NAME, fallback=None):
+        """Starts a worker as a child process speaking the protocol over stdin/stdout."""
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--stdio", "--model", model_name],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        def close():
+            proc.wait()
+        return cls(proc.stdout, proc.stdin, close, fallback)
+
+    def request(self, **request):
+        self.wfile.write(json.dumps(request).encode("utf-8") + b"\n")
+        self.wfile.flush()
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("NER worker closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(f"NER worker: {response['error']}")
+        return response
+
+    def ping(self):
+        return self.request(op="ping")
+
+    def stats(self):
+        return self.request(op="stats")
+
+    def annotate(self, texts, batch_size=BATCH_SIZE):
+        """Yields (event_id, entities) for (text, event_id) pairs, one request per batch."""
+        texts = iter(texts)
+        started = time.monotonic()
+        try:
+            while True:
+                batch = list(islice(texts, batch_size))
+                if not batch:
+                    break
+                sent = time.perf_counter()
+                try:
+                    response = self.request(op="annotate", texts=[text for text, _ in batch])
+                except (OSError, ConnectionError, ValueError) as e:
+                    if self.fallback is None:
+                        raise
+                    print(f"NER worker failed ({e}); annotating the rest in-process")
+                    yield from annotate(self.fallback(), _chain(batch, texts), batch_size)
+                    return
+                self.batches.append((len(batch), time.perf_counter() - sent, response["seconds"]))
+                for (_, event_id), entities in zip(batch, response["entities"]):
+                    yield event_id, [tuple(entity) for entity in entities]
+        finally:
+            self.report(time.monotonic() - started)
+
+    def report(self, elapsed):
+        if not self.batches:
+            return
+        round_trip = latency_summary([(docs, rtt) for docs, rtt, _ in self.batches])
+        overhead = sum(rtt - worker for _, rtt, worker in self.batches) / len(self.batches)
+        print(f"Annotated {round_trip['docs']} docs via NER worker in {elapsed:.1f}s: {round_trip['batches']} batches, "
+              f"p50 {round_trip['p50_ms']}ms, p95 {round_trip['p95_ms']}ms, max {round_trip['max_ms']}ms "
+              f"(transport {overhead * 1000:.1f}ms/batch)")
+        self.batches = []
+
+    def close(self):
+        if self._close:
+            self.wfile.close()
+            self.rfile.close()
+            self._close()
+            self._close = None
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _chain(batch, rest):
+    yield from batch
+    yield from rest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident NER worker: keeps the spaCy model loaded between runs.")
+    parser.add_argument("--socket", default=os.environ.get("NER_WORKER_SOCKET", SOCKET_PATH))
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--stdio", action="store_true", help="Serve one client on stdin/stdout instead of a socket")
+    parser.add_argument("--stats", action="store_true", help="Print the running worker's latency metrics")
+    parser.add_argument("--stop", action="store_true", help="Shut down the running worker")
+    args = parser.parse_args()
+
+    if args.stats or args.stop:
+        client = NERClient.connect(args.socket)
+        print(json.dumps(client.request(op="shutdown" if args.stop else "stats"), indent=2))
+        client.close()
+    elif args.stdio:
+        # stdout carries the protocol; route the model's own logging to stderr
+        protocol_out, sys.stdout = sys.stdout.buffer, sys.stderr
+        NERWorker(args.model, args.batch_size).serve_stream(sys.stdin.buffer, protocol_out)
+    else:
+        serve(args.socket, args.model, args.batch_size)
@@ -0,0 +1,83 @@
+import os
+from rdflib import BNode, Literal
+
+# Minimal streaming N-Triples / N-Quads writer.
+# Triples are written line by line as they are produced instead of being
+# collected in an rdflib Graph and serialized at the end, so memory stays
+# proportional to what is being written rather than to the whole graph.
+
+# N-Triples string escapes; other control characters become \uXXXX
+_ESCAPES = {ord("\\"): "\\\\", ord('"'): '\\"', ord("\n"): "\\n", ord("\r"): "\\r",
+            ord("\t"): "\\t", ord("\b"): "\\b", ord("\f"): "\\f"}
+_ESCAPES.update({c: f"\\u{c:04X}" for c in list(range(0x20)) + [0x7F] if c not in _ESCAPES})
+
+
+def nt_literal(lexical, lang=None, datatype=None):
+    """N-Triples literal from a lexical form: single-line, control characters escaped."""
+    lexical = lexical.translate(_ESCAPES)
+    if lang:
+        return f'"{lexical}"@{lang}'
+    if datatype:
+        return f'"{lexical}"^^<{datatype}>'
+    return f'"{lexical}"'
+
+
+def nt_term(term):
+    """
+    N-Triples form of an rdflib term (or a plain IRI string). Unlike
+    term.n3(), literals are always single-line with escaped control
+    characters (n3() writes Turtle long strings).
+    """
+    if isinstance(term, Literal):
+        return nt_literal(str(term), term.language, term.datatype)
+    if isinstance(term, BNode):
+        return f"_:{term}"
+    return f"<{term}>"
+
+
+class NTriplesWriter:
+    """
+    Writes rdflib terms as N-Triples, or as N-Quads when a graph URI is given.
+    Statements are written as they come, without a global duplicate check, so
+    callers dedupe what they emit (RDF stores collapse repeats on load).
+    Mirrors the part of the Graph API the pipeline uses: add() and len().
+    Output goes to <path>.tmp and replaces path only on a clean close, so an
+    interrupted run leaves the previous file in place.
+    """
+
+    def __init__(self, path, graph_uri=None):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.graph = f" <{graph_uri}>" if graph_uri else ""
+        self.count = 0
+        self.f = open(self.tmp_path, "w", encoding="utf-8")
+
+    def add(self, triple):
+        s, p, o = triple
+        self.f.write(f"{nt_term(s)} {nt_term(p)} {nt_term(o)}{self.graph} .\n")
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def close(self, commit=True):
+        """Closes the file and moves it into place (or discards it when commit is false)."""
+        if self.f.closed:
+            return
+        self.f.close()
+        if commit:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+
+def rdf_format(path):
+    """Guesses the rdflib parser format from a file name."""
+    ext = os.path.splitext(path)[1].lower()
+    return {".nt": "nt", ".nq": "nquads", ".ttl": "turtle"}.get(ext, "turtle")
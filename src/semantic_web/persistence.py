@@ -1,19 +1,56 @@
 import os
+import time
+import argparse
 from rdflib import Graph, URIRef, Literal
-from rdflib.plugin import register, Store
-from rdflib_sqlalchemy import registerplugins
+from triple_store import SQLiteTripleStore
+from graph_cache import load_view
 
-# Register SQLAlchemy Store plugin
-registerplugins()
-
-def persist_graph(ttl_file_path, db_url="sqlite:///fda_graph.db"):
+def persist_graph(ttl_file_path, db_url="sqlite:///fda_graph.db", backend="native", replace=False):
     """
     Reads a TTL file and persists it to a SQL database.
+    ttl_file_path may also be an already loaded rdflib Graph.
+    backend "native" bulk loads into the dictionary-encoded SQLite triple store;
+    "sqlalchemy" uses the original rdflib_sqlalchemy store.
+    With replace, the native store is emptied first instead of appended to.
     """
-    if not os.path.exists(ttl_file_path):
+    if not isinstance(ttl_file_path, Graph) and not os.path.exists(ttl_file_path):
         print(f"TTL file not found: {ttl_file_path}")
         return
 
+    if backend == "native":
+        return persist_native(ttl_file_path, db_url, replace)
+    return persist_sqlalchemy(ttl_file_path, db_url)
+
+def persist_native(source, db_url, replace=False):
+    """Bulk loads a Graph or RDF file into a SQLiteTripleStore; returns the triple count."""
+    store = SQLiteTripleStore()
+    store.open(db_url, create=True)
+    if replace:
+        store.clear()
+
+    started = time.monotonic()
+    if isinstance(source, Graph):
+        print(f"Loading {len(source)} in-memory triples into {db_url}...")
+        for prefix, namespace in source.namespaces():
+            store.bind(prefix, namespace)
+        added = store.bulk_load(source)
+    else:
+        print(f"Loading data from {source} into {db_url}...")
+        added = store.load_file(source)
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(f"Persisted {added} new triples in {elapsed:.1f}s ({added / elapsed:.0f} triples/s).")
+
+    # Verify by counting (answered by SQLite, not by iterating triples)
+    count = len(store)
+    print(f"Total Triples in DB: {count}")
+    store.close()
+    return count
+
+def persist_sqlalchemy(ttl_file_path, db_url):
+    # Optional dependency, only needed for the legacy backend
+    from rdflib_sqlalchemy import registerplugins
+    registerplugins()
+
     # Use a specific identifier for the graph
     identifier = URIRef("http://example.org/fda/quality/graph")
     
@@ -21,10 +58,13 @@ def persist_graph(ttl_file_path, db_url="sqlite:///fda_graph.db"):
     store = Graph(store="SQLAlchemy", identifier=identifier)
     store.open(db_url, create=True)
     
-    print(f"Loading data from {ttl_file_path} into {db_url}...")
-    # Load data into the store
-    # Note: parse() on a store-backed graph adds the triples to the store
-    store.parse(ttl_file_path, format="turtle")
+    if isinstance(ttl_file_path, Graph):
+        print(f"Loading {len(ttl_file_path)} in-memory triples into {db_url}...")
+        store.addN((s, p, o, store) for s, p, o in ttl_file_path)
+    else:
+        print(f"Loading data from {ttl_file_path} into {db_url}...")
+        # Load data into the store (decoded from the parsed-graph cache)
+        store.addN((s, p, o, store) for s, p, o in load_view(ttl_file_path))
     
     print(f"Persisted {len(store)} triples to database.")
     
@@ -37,11 +77,17 @@ def persist_graph(ttl_file_path, db_url="sqlite:///fda_graph.db"):
     print(f"Total Triples in DB: {count}")
     
     store.close()
+    return count
 
 if __name__ == "__main__":
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    DATA_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.ttl")
+    DATA_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.nt")
     DB_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_graph.db")
     DB_URL = f"sqlite:///{DB_PATH}"
 
-    persist_graph(DATA_PATH, DB_URL)
+    parser = argparse.ArgumentParser(description="Persist the knowledge graph to SQLite.")
+    parser.add_argument("--backend", choices=["native", "sqlalchemy"], default="native")
+    parser.add_argument("--replace", action="store_true", help="Empty the native store before loading")
+    args = parser.parse_args()
+
+    persist_graph(DATA_PATH, DB_URL, backend=args.backend, replace=args.replace)
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from rdflib import Graph, URIRef
+from rdflib.namespace import RDF
+
+from record_io import write_records
+from rdf_transformer import transform_to_ntriples
+from persistence import persist_graph
+from triple_store import SQLiteTripleStore
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ingestion"))
+from openfda_connector import extract_fields
+from openfda_stub_server import make_records
+
+# Load and lookup benchmark: the dictionary-encoded SQLite triple store versus
+# the original rdflib_sqlalchemy backend, on a knowledge graph built from
+# synthetic enforcement records.
+
+FDA = "http://example.org/fda/quality/"
+GRAPH_ID = URIRef("http://example.org/fda/quality/graph")
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<30} {elapsed:8.3f}s")
+    return result, elapsed
+
+
+def build_graph(workdir, events):
+    raw_path = os.path.join(workdir, "events.jsonl")
+    nt_path = os.path.join(workdir, "graph.nt")
+    write_records(raw_path, (extract_fields(r) for r in make_records(events)))
+    transform_to_ntriples(raw_path, nt_path, workers=1)
+    return nt_path
+
+
+def lookups(graph, sample_event):
+    """The pattern lookups measured on both backends: (label, fn) pairs."""
+    return [
+        ("len(graph)", lambda: len(graph)),
+        ("count all (iterate)", lambda: sum(1 for _ in graph.triples((None, None, None)))),
+        ("events by rdf:type (POS)", lambda: sum(1 for _ in graph.subjects(RDF.type, URIRef(FDA + "RecallEvent")))),
+        ("one event's triples (SPO)", lambda: sum(1 for _ in graph.predicate_objects(sample_event))),
+        ("firm lookups x200 (OSP)", lambda: sum(
+            1 for o in sorted(set(graph.objects(None, URIRef(FDA + "recallingFirm"))))[:200]
+            for _ in graph.subjects(URIRef(FDA + "recallingFirm"), o))),
+    ]
+
+
+def bench_native(nt_path, db_path):
+    print("\nNative SQLite triple store")
+    count, load_s = timed("load (bulk, from file)", lambda: persist_graph(nt_path, db_path))
+    store = SQLiteTripleStore()
+    store.open(db_path)
+    graph = Graph(store=store)
+    sample = next(graph.subjects(RDF.type, URIRef(FDA + "RecallEvent")))
+    results = {label: timed(label, fn) for label, fn in lookups(graph, sample)}
+    timed("count by predicate (SQL)", lambda: store.count((None, RDF.type, None)))
+    store.close()
+    return count, load_s, results
+
+
+def bench_sqlalchemy(nt_path, db_path):
+    from rdflib_sqlalchemy import registerplugins
+    registerplugins()
+    print("\nrdflib_sqlalchemy store")
+    count, load_s = timed("load (store.parse)", lambda: persist_graph(nt_path, f"sqlite:///{db_path}",
+                                                                      backend="sqlalchemy"))
+    graph = Graph(store="SQLAlchemy", identifier=GRAPH_ID)
+    graph.open(f"sqlite:///{db_path}")
+    sample = next(graph.subjects(RDF.type, URIRef(FDA + "RecallEvent")))
+    results = {label: timed(label, fn) for label, fn in lookups(graph, sample)}
+    graph.close()
+    return count, load_s, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the native triple store against rdflib_sqlalchemy.")
+    parser.add_argument("--events", type=int, default=20000, help="Synthetic recall events to load")
+    parser.add_argument("--native-only", action="store_true", help="Skip the (slow) rdflib_sqlalchemy run")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="persistence_bench_")
+    try:
+        nt_path = build_graph(workdir, args.events)
+        native = bench_native(nt_path, os.path.join(workdir, "native.db"))
+        if args.native_only:
+            return
+        legacy = bench_sqlalchemy(nt_path, os.path.join(workdir, "sqlalchemy.db"))
+
+        assert native[0] == legacy[0], f"Triple counts differ: {native[0]} vs {legacy[0]}"
+        print(f"\nBoth stores hold {native[0]} triples")
+        print(f"  {'load':<30} {legacy[1] / native[1]:7.1f}x faster")
+        for label, (value, native_s) in native[2].items():
+            legacy_value, legacy_s = legacy[2][label]
+            assert value == legacy_value, f"{label}: {value} vs {legacy_value}"
+            print(f"  {label:<30} {legacy_s / max(native_s, 1e-9):7.1f}x faster")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
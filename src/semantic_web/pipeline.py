@@ -0,0 +1,448 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Single entry point for the data pipeline.
+# Stages form a DAG. Each stage is fingerprinted from the content of its input
+# files, the source of the modules implementing it and its config; a stage whose
+# fingerprint and outputs are unchanged since the last successful run is skipped.
+# Independent stages run concurrently, and the knowledge graph is parsed at most
+# once per run and handed to the stages that need it in memory.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SRC_DIR = os.path.join(BASE_DIR, "src")
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
+STATE_FILE = os.path.join(PROCESSED_DIR, "pipeline_state.json")
+
+RAW_PATH = os.path.join(RAW_DIR, "fda_quality_events.jsonl")
+CHANGESET_PATH = os.path.join(RAW_DIR, "fda_quality_events.changeset.json")
+KG_PATH = os.path.join(PROCESSED_DIR, "fda_knowledge_graph.nt")
+MENTIONS_PATH = os.path.join(PROCESSED_DIR, "fda_entity_mentions.nt")
+TAXONOMY_PATH = os.path.join(PROCESSED_DIR, "failure_taxonomy.ttl")
+NER_CACHE_PATH = os.path.join(PROCESSED_DIR, "ner_cache.sqlite")
+DB_PATH = os.path.join(PROCESSED_DIR, "fda_graph.db")
+BM25_PATH = os.path.join(PROCESSED_DIR, "bm25_index")
+ADJACENCY_PATH = os.path.join(PROCESSED_DIR, "adjacency.npz")
+SNAPSHOT_DIR = os.path.join(PROCESSED_DIR, "snapshot")
+TREND_CUBE_PATH = os.path.join(PROCESSED_DIR, "trend_cube.npz")
+DUPLICATES_STATE_PATH = os.path.join(PROCESSED_DIR, "near_duplicates.npz")
+CLUSTERS_PATH = os.path.join(PROCESSED_DIR, "fda_duplicate_clusters.nt")
+ONTOLOGY_PATH = os.path.join(PROCESSED_DIR, "ontology.ttl")
+ONTOLOGY_DOCS_PATH = os.path.join(PROCESSED_DIR, "ontology_docs.md")
+SHAPES_PATH = os.path.join(BASE_DIR, "data", "shapes", "fda_shapes.ttl")
+
+ES_HOST = os.environ.get("ES_HOST", "http://localhost:9200")
+HASH_CHUNK = 1 << 20
+# Stages replaced by the single-read fan-out stage (--fanout), and its sinks.
+# persist stays a separate stage so that only a validated graph is persisted.
+FANOUT_REPLACES = ("transform", "taxonomy", "index")
+FANOUT_SINKS = ["ntriples", "taxonomy", "search"]
+
+
+class Stage:
+    """
+    A pipeline step: run(ctx) produces outputs from inputs. code lists the
+    source files whose content is part of the fingerprint.
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), code=(), config=None, deps=()):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.code = [os.path.join(SRC_DIR, path) for path in code]
+        self.config = config or {}
+        self.deps = list(deps)
+
+
+class Context:
+    """Shared state of one pipeline run, including in-memory stage results."""
+
+    def __init__(self, state):
+        self.state = state
+        self.results = {}
+        self._graph = None
+        self._graph_lock = threading.Lock()
+        self._disk_fetch_id = None
+        # Guards state, which worker threads update while the runner saves it
+        self.lock = threading.Lock()
+
+    def file_hash(self, path):
+        """
+        Content hash of a file. Hashes are memoized in the state by size and
+        mtime so unchanged multi-GB inputs are not re-read on every run.
+        """
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+        with self.lock:
+            cached = self.state["file_hashes"].get(path)
+        if cached and cached["stamp"] == stamp:
+            return cached["sha256"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                digest.update(chunk)
+        with self.lock:
+            self.state["file_hashes"][path] = {"stamp": stamp, "sha256": digest.hexdigest()}
+        return digest.hexdigest()
+
+    def fetch_id(self):
+        """ID of the fetch the raw corpus currently reflects (from this run or the last changeset on disk)."""
+        fetched = self.results.get("fetch")
+        if fetched:
+            return fetched.get("fetch_id")
+        if self._disk_fetch_id is None:
+            self._disk_fetch_id = ""
+            if os.path.exists(CHANGESET_PATH):
+                with open(CHANGESET_PATH, "r") as f:
+                    self._disk_fetch_id = json.load(f).get("fetch_id") or ""
+        return self._disk_fetch_id or None
+
+    def graph(self):
+        """The base graph plus NER mentions and duplicate clusters, parsed once and shared between stages."""
+        with self._graph_lock:
+            if self._graph is None:
+                from rdflib import Graph
+                from graph_cache import load_graph
+                g = Graph()
+                for path in (KG_PATH, MENTIONS_PATH, CLUSTERS_PATH):
+                    if os.path.exists(path):
+                        print(f"[graph] Loading {path}")
+                        load_graph(path, graph=g)
+                self._graph = g
+            return self._graph
+
+
+def fingerprint(stage, ctx):
+    digest = hashlib.sha256()
+    for path in stage.inputs + stage.code:
+        digest.update(f"{path}={ctx.file_hash(path)}\n".encode())
+    digest.update(json.dumps(stage.config, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def is_up_to_date(stage, ctx, fp):
+    previous = ctx.state["stages"].get(stage.name)
+    if not previous or previous.get("fingerprint") != fp:
+        return False
+    return all(ctx.file_hash(path) == previous["outputs"].get(path) for path in stage.outputs)
+
+
+def incremental_changeset(ctx, name):
+    """
+    The changeset of this run's fetch if stage name can apply it on top of its
+    last output, else None (rebuild). That needs an incremental fetch and the
+    stage having applied exactly the previous fetch; after a failed or skipped
+    run its artifact misses a delta and only a rebuild catches up.
+    """
+    changeset = ctx.results.get("fetch")
+    if not changeset or changeset.get("full"):
+        return None
+    applied = ctx.state["stages"].get(name, {}).get("applied_fetch")
+    if applied is None or applied != changeset.get("previous_fetch_id"):
+        print(f"[{name}] last applied fetch {applied} is not the previous fetch "
+              f"{changeset.get('previous_fetch_id')}; rebuilding instead")
+        return None
+    return changeset
+
+
+def search_changeset(ctx, name):
+    """
+    incremental_changeset() for a stage writing search documents, plus the
+    events whose duplicate clusters this run's dedupe changed: their
+    documents carry the cluster sizes. None (rebuild) after a full dedupe.
+    """
+    changeset = incremental_changeset(ctx, name)
+    if changeset is None or "dedupe" not in ctx.results:
+        return changeset
+    events = ctx.results["dedupe"]["changed_events"]
+    if events is None:
+        print(f"[{name}] duplicate clusters were rebuilt; rebuilding instead")
+        return None
+    return dict(changeset, events=events)
+
+
+# -- Stage implementations --
+
+def run_fetch(ctx):
+    sys.path.insert(0, os.path.join(SRC_DIR, "ingestion"))
+    from openfda_connector import ingest
+    return ingest(output_file=RAW_PATH)
+
+
+def run_transform(ctx):
+    from rdf_transformer import transform_to_ntriples
+    transform_to_ntriples(RAW_PATH, KG_PATH)
+
+
+def run_enrich(ctx):
+    from ner_enricher import enrich_delta
+    enrich_delta(MENTIONS_PATH, json_path=RAW_PATH, cache_path=NER_CACHE_PATH)
+
+
+def run_taxonomy(ctx):
+    from taxonomy_builder import build_taxonomy
+    build_taxonomy(RAW_PATH, TAXONOMY_PATH)
+
+
+def run_index(ctx):
+    from search_indexer import _connect, index_data
+    if _connect(ES_HOST) is None:
+        # Like the fan-out search sink: don't fail the run without Elasticsearch;
+        # the stage re-runs (and rebuilds the index) next time
+        return {"incomplete": True}
+    # After an incremental fetch in this run only its changeset is applied
+    # (if the index has the previous one); otherwise it is rebuilt behind the alias
+    changeset = search_changeset(ctx, "index")
+    if index_data(RAW_PATH, es_host=ES_HOST, changeset=changeset, mentions_path=MENTIONS_PATH,
+                  taxonomy_path=TAXONOMY_PATH, clusters_path=CLUSTERS_PATH) is None:
+        raise RuntimeError(f"Elasticsearch indexing at {ES_HOST} did not complete")
+
+
+def run_bm25(ctx):
+    from bm25_index import build_or_update
+    changeset = incremental_changeset(ctx, "bm25")
+    build_or_update(BM25_PATH, RAW_PATH, changeset, MENTIONS_PATH, TAXONOMY_PATH)
+
+
+def run_adjacency(ctx):
+    from adjacency import build_or_update
+    changeset = incremental_changeset(ctx, "adjacency")
+    build_or_update(ADJACENCY_PATH, RAW_PATH, changeset, MENTIONS_PATH, TAXONOMY_PATH)
+
+
+def run_snapshot(ctx):
+    from snapshot import write_snapshot
+    write_snapshot(RAW_PATH, SNAPSHOT_DIR, MENTIONS_PATH, TAXONOMY_PATH)
+
+
+def run_trends(ctx):
+    from trend_cube import build_or_update
+    changeset = incremental_changeset(ctx, "trends")
+    build_or_update(TREND_CUBE_PATH, RAW_PATH, changeset)
+
+
+def run_dedupe(ctx):
+    from near_duplicates import build_or_update
+    changeset = incremental_changeset(ctx, "dedupe")
+    index = build_or_update(DUPLICATES_STATE_PATH, CLUSTERS_PATH, RAW_PATH, changeset)
+    changed = index.changed_events
+    return {"changed_events": sorted(changed) if changed is not None else None}
+
+
+def run_fanout(ctx):
+    from fanout import fan_out, default_sinks
+    paths = {"kg": KG_PATH, "taxonomy": TAXONOMY_PATH, "mentions": MENTIONS_PATH, "clusters": CLUSTERS_PATH}
+    # Like the index stage: apply this run's changeset to the live index when
+    # possible, and don't let an unreachable Elasticsearch fail the stage
+    sinks = default_sinks(FANOUT_SINKS, paths, ES_HOST, changeset=search_changeset(ctx, "fanout"),
+                          optional_search=True)
+    report = fan_out(RAW_PATH, sinks)
+    skipped = [name for name, outcome in report.items() if outcome.get("skipped")]
+    # Re-run next time (with a full reindex) so the skipped sinks catch up
+    return {"sinks": report, "incomplete": bool(skipped)}
+
+
+def run_validate(ctx):
+    from validator import validate_graph
+    conforms = validate_graph(ctx.graph(), SHAPES_PATH)
+    if not conforms:
+        raise RuntimeError("SHACL validation failed")
+    return conforms
+
+
+def run_persist(ctx):
+    from persistence import persist_graph
+    persist_graph(ctx.graph(), f"sqlite:///{DB_PATH}", replace=True)
+
+
+def run_docs(ctx):
+    from doc_generator import generate_docs
+    generate_docs(ONTOLOGY_PATH, ONTOLOGY_DOCS_PATH)
+
+
+def build_stages(fetch=False, fanout=False):
+    stages = []
+    if fetch:
+        stages.append(Stage("fetch", run_fetch, outputs=[RAW_PATH],
+                            code=["ingestion/openfda_connector.py"],
+                            # Network input: re-run whenever requested
+                            config={"requested_at": time.time()}))
+    upstream = ["fetch"] if fetch else []
+    stages += [
+        Stage("transform", run_transform, inputs=[RAW_PATH], outputs=[KG_PATH],
+              code=["semantic_web/rdf_transformer.py", "semantic_web/record_io.py"], deps=upstream),
+        Stage("enrich", run_enrich, inputs=[RAW_PATH], outputs=[MENTIONS_PATH],
+              code=["semantic_web/ner_enricher.py", "semantic_web/ner_cache.py", "semantic_web/ner_service.py",
+                    "semantic_web/ntriples.py", "semantic_web/record_io.py"],
+              config={"model": os.environ.get("SPACY_MODEL", "en_core_web_sm")}, deps=upstream),
+        Stage("taxonomy", run_taxonomy, inputs=[RAW_PATH], outputs=[TAXONOMY_PATH],
+              code=["semantic_web/taxonomy_builder.py", "semantic_web/record_io.py"], deps=upstream),
+        Stage("dedupe", run_dedupe, inputs=[RAW_PATH], outputs=[DUPLICATES_STATE_PATH, CLUSTERS_PATH],
+              code=["semantic_web/near_duplicates.py", "semantic_web/record_io.py"], deps=upstream),
+        Stage("index", run_index, inputs=[RAW_PATH, MENTIONS_PATH, TAXONOMY_PATH, CLUSTERS_PATH],
+              code=["semantic_web/search_indexer.py", "semantic_web/record_io.py",
+                    "semantic_web/ntriples.py", "semantic_web/rdf_transformer.py"],
+              config={"es_host": ES_HOST}, deps=["enrich", "taxonomy", "dedupe"]),
+        Stage("bm25", run_bm25, inputs=[RAW_PATH, MENTIONS_PATH, TAXONOMY_PATH],
+              outputs=[os.path.join(BM25_PATH, "manifest.json")],
+              code=["semantic_web/bm25_index.py", "semantic_web/event_search.py",
+                    "semantic_web/search_indexer.py", "semantic_web/record_io.py"],
+              deps=["enrich", "taxonomy"]),
+        Stage("adjacency", run_adjacency, inputs=[RAW_PATH, MENTIONS_PATH, TAXONOMY_PATH],
+              outputs=[ADJACENCY_PATH],
+              code=["semantic_web/adjacency.py", "semantic_web/search_indexer.py",
+                    "semantic_web/record_io.py"],
+              deps=["enrich", "taxonomy"]),
+        Stage("snapshot", run_snapshot, inputs=[RAW_PATH, MENTIONS_PATH, TAXONOMY_PATH],
+              outputs=[os.path.join(SNAPSHOT_DIR, f"{table}.{ext}")
+                       for table in ("events", "mentions", "failure_types") for ext in ("parquet", "arrow")],
+              code=["semantic_web/snapshot.py", "semantic_web/search_indexer.py", "semantic_web/record_io.py"],
+              deps=["enrich", "taxonomy"]),
+        Stage("trends", run_trends, inputs=[RAW_PATH], outputs=[TREND_CUBE_PATH],
+              code=["semantic_web/trend_cube.py", "semantic_web/record_io.py"], deps=upstream),
+        Stage("validate", run_validate, inputs=[KG_PATH, MENTIONS_PATH, CLUSTERS_PATH, SHAPES_PATH],
+              code=["semantic_web/validator.py"], deps=["transform", "enrich", "dedupe"]),
+        Stage("persist", run_persist, inputs=[KG_PATH, MENTIONS_PATH, CLUSTERS_PATH], outputs=[DB_PATH],
+              code=["semantic_web/persistence.py", "semantic_web/triple_store.py"], deps=["validate"]),
+        Stage("docs", run_docs, inputs=[ONTOLOGY_PATH], outputs=[ONTOLOGY_DOCS_PATH],
+              code=["semantic_web/doc_generator.py"]),
+    ]
+    if fanout:
+        # One read of the raw file feeds the graph, taxonomy and search outputs concurrently
+        stages = [stage for stage in stages if stage.name not in FANOUT_REPLACES]
+        for stage in stages:
+            stage.deps = list(dict.fromkeys("fanout" if dep in FANOUT_REPLACES else dep for dep in stage.deps))
+        stages.insert(len(upstream) + 2, Stage(
+            "fanout", run_fanout, inputs=[RAW_PATH, MENTIONS_PATH, CLUSTERS_PATH],
+            outputs=[KG_PATH, TAXONOMY_PATH],
+            code=["semantic_web/fanout.py", "semantic_web/rdf_transformer.py", "semantic_web/taxonomy_builder.py",
+                  "semantic_web/search_indexer.py", "semantic_web/record_io.py"],
+            config={"es_host": ES_HOST, "sinks": FANOUT_SINKS}, deps=upstream + ["enrich", "dedupe"]))
+    return stages
+
+
+def load_state(path=STATE_FILE):
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            state = json.load(f)
+    else:
+        state = {}
+    state.setdefault("stages", {})
+    state.setdefault("file_hashes", {})
+    return state
+
+
+def save_state(state, path=STATE_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_pipeline(stages, force=(), workers=4, state_path=STATE_FILE):
+    """
+    Runs the stage DAG, skipping stages that are up to date. A stage is only
+    skipped if none of its upstream stages ran in this invocation.
+    force is a collection of stage names to re-run regardless ("all" for every stage).
+    Returns {stage name: "ran" | "skipped" | "failed" | "blocked"}.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    state = load_state(state_path)
+    ctx = Context(state)
+    status = {}
+    running = {}
+
+    def execute(stage):
+        fp = fingerprint(stage, ctx)
+        upstream_ran = any(status.get(dep) == "ran" for dep in stage.deps)
+        if not upstream_ran and stage.name not in force and "all" not in force and is_up_to_date(stage, ctx, fp):
+            print(f"[{stage.name}] up to date, skipping")
+            return "skipped"
+
+        print(f"[{stage.name}] running...")
+        started = time.monotonic()
+        result = ctx.results[stage.name] = stage.run(ctx)
+        # A stage may succeed for its dependents yet ask to be re-run from scratch next time
+        incomplete = isinstance(result, dict) and result.get("incomplete")
+        record = {
+            "fingerprint": None if incomplete else fp,
+            "outputs": {path: ctx.file_hash(path) for path in stage.outputs},
+            # The fetch this stage's outputs are now in sync with
+            "applied_fetch": None if incomplete else ctx.fetch_id(),
+            "seconds": round(time.monotonic() - started, 3),
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with ctx.lock:
+            state["stages"][stage.name] = record
+        print(f"[{stage.name}] done in {time.monotonic() - started:.1f}s"
+              + (" (incomplete, will re-run)" if incomplete else ""))
+        return "ran"
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while len(status) < len(stages):
+            for stage in stages:
+                if stage.name in status or stage.name in running:
+                    continue
+                dep_status = [status.get(dep) for dep in stage.deps if dep in by_name]
+                if any(s in ("failed", "blocked") for s in dep_status):
+                    status[stage.name] = "blocked"
+                    print(f"[{stage.name}] blocked by a failed upstream stage")
+                elif all(s is not None for s in dep_status):
+                    running[stage.name] = pool.submit(execute, stage)
+
+            if not running:
+                continue
+            done, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name, future in list(running.items()):
+                if future in done:
+                    del running[name]
+                    try:
+                        status[name] = future.result()
+                    except Exception as e:
+                        print(f"[{name}] failed: {e}")
+                        with ctx.lock:
+                            state["stages"].pop(name, None)
+                        status[name] = "failed"
+            with ctx.lock:
+                save_state(state, state_path)
+
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the FDA quality-event pipeline as a cached DAG.")
+    parser.add_argument("--fetch", action="store_true", help="Include the openFDA fetch stage")
+    parser.add_argument("--force", nargs="*",
+                        help="Stage names to re-run even if up to date (no names = all)")
+    parser.add_argument("--only", nargs="*", help="Run only these stages (their deps must be satisfied)")
+    parser.add_argument("--workers", type=int, default=4, help="Stages that may run concurrently")
+    parser.add_argument("--fanout", action="store_true",
+                        help="Replace transform/taxonomy/index with one single-read fan-out stage")
+    args = parser.parse_args()
+
+    force = [] if args.force is None else (args.force or ["all"])
+    stages = build_stages(fetch=args.fetch, fanout=args.fanout)
+    if args.only:
+        stages = [stage for stage in stages if stage.name in args.only]
+
+    started = time.monotonic()
+    status = run_pipeline(stages, force=force, workers=args.workers)
+    print(f"Pipeline finished in {time.monotonic() - started:.1f}s")
+    for name, result in status.items():
+        print(f"  {name:<10} {result}")
+    if any(result in ("failed", "blocked") for result in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,175 @@
-import json
 import os
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from rdflib import Graph, Literal, Namespace, URIRef
 from rdflib.namespace import DCTERMS, RDF, SKOS, XSD
+from record_io import iter_records
+from ntriples import nt_literal, nt_term
 
 # Namespaces
 FDA = Namespace("http://example.org/fda/quality/")
 EX = Namespace("http://example.org/resource/")
 
+# Streaming writer settings: records per shard and worker processes
+CHUNK_SIZE = 50000
+WORKERS = os.cpu_count() or 1
+
+def concept_slug(failure_type):
+    """Slug used in failure-type concept URIs."""
+    return failure_type.lower().replace(" ", "_").replace("/", "_")
+
+def _literal(value, lang=None):
+    """N-Triples literal, matching what rdflib would write for Literal(value, lang=lang)."""
+    if not isinstance(value, str):
+        return nt_term(Literal(value, lang=lang))
+    return nt_literal(value, lang)
+
+_A = nt_term(RDF.type)
+_RECALL_EVENT = nt_term(FDA.RecallEvent)
+_RECALL_NUMBER = nt_term(FDA.recallNumber)
+_RECALLING_FIRM = nt_term(FDA.recallingFirm)
+_REASON = nt_term(FDA.reasonForRecall)
+_DATE = nt_term(DCTERMS.date)
+_HAS_FAILURE_TYPE = nt_term(FDA.hasFailureType)
+_CONCEPT = nt_term(SKOS.Concept)
+_PREF_LABEL = nt_term(SKOS.prefLabel)
+
+def event_ntriples(record):
+    """
+    N-Triples lines for one record's event, minting the same URIs as transform_to_rdf.
+    Failure-type concept triples are emitted separately by concept_ntriples.
+    """
+    event_id = record.get("event_id")
+    if not event_id:
+        return []
+
+    event = nt_term(EX[f"event/{event_id}"])
+    lines = [f"{event} {_A} {_RECALL_EVENT} .\n"]
+    if record.get("recall_number"):
+        lines.append(f"{event} {_RECALL_NUMBER} {_literal(record['recall_number'])} .\n")
+    if record.get("recalling_firm"):
+        lines.append(f"{event} {_RECALLING_FIRM} {_literal(record['recalling_firm'])} .\n")
+    if record.get("reason_for_recall"):
+        lines.append(f"{event} {_REASON} {_literal(record['reason_for_recall'], 'en')} .\n")
+    if record.get("report_date"):
+        lines.append(f"{event} {_DATE} {_literal(record['report_date'])} .\n")
+    if record.get("failure_type"):
+        concept = nt_term(FDA[f"failure_type/{concept_slug(record['failure_type'])}"])
+        lines.append(f"{event} {_HAS_FAILURE_TYPE} {concept} .\n")
+    return lines
+
+def event_triples(record):
+    """The triples of event_ntriples as rdflib terms, for stores that take terms."""
+    event_id = record.get("event_id")
+    if not event_id:
+        return []
+
+    event = EX[f"event/{event_id}"]
+    triples = [(event, RDF.type, FDA.RecallEvent)]
+    if record.get("recall_number"):
+        triples.append((event, FDA.recallNumber, Literal(record["recall_number"])))
+    if record.get("recalling_firm"):
+        triples.append((event, FDA.recallingFirm, Literal(record["recalling_firm"])))
+    if record.get("reason_for_recall"):
+        triples.append((event, FDA.reasonForRecall, Literal(record["reason_for_recall"], lang="en")))
+    if record.get("report_date"):
+        triples.append((event, DCTERMS.date, Literal(record["report_date"])))
+    if record.get("failure_type"):
+        triples.append((event, FDA.hasFailureType, FDA[f"failure_type/{concept_slug(record['failure_type'])}"]))
+    return triples
+
+def concept_triples(failure_type):
+    concept = FDA[f"failure_type/{concept_slug(failure_type)}"]
+    return [(concept, RDF.type, SKOS.Concept), (concept, SKOS.prefLabel, Literal(failure_type, lang="en"))]
+
+def concept_ntriples(failure_type):
+    concept = nt_term(FDA[f"failure_type/{concept_slug(failure_type)}"])
+    return [
+        f"{concept} {_A} {_CONCEPT} .\n",
+        f"{concept} {_PREF_LABEL} {_literal(failure_type, 'en')} .\n",
+    ]
+
+def _write_shard(args):
+    """Worker: writes one chunk of records to a part file. Returns (events, triples, failure types)."""
+    records, part_path = args
+    events = triples = 0
+    failure_types = set()
+    with open(part_path, "w", encoding="utf-8") as f:
+        for record in records:
+            lines = event_ntriples(record)
+            if lines:
+                events += 1
+                triples += len(lines)
+                f.writelines(lines)
+                if record.get("failure_type"):
+                    failure_types.add(record["failure_type"])
+    return events, triples, failure_types
+
+def transform_to_ntriples(input_file, output_file, workers=WORKERS, chunk_size=CHUNK_SIZE):
+    """
+    Streams FDA raw records to N-Triples without building an rdflib Graph.
+
+    Records are sharded in chunks across a process pool; each worker writes a
+    part file and the parts are concatenated in input order, followed by one
+    copy of each failure-type concept's triples. A statement may repeat when
+    several recall records share an event_id; parsers collapse those, so the
+    result is graph-isomorphic to the Turtle output.
+    """
+    if not os.path.exists(input_file):
+        print(f"Input file not found: {input_file}")
+        return
+
+    print(f"Streaming records from {input_file} with {workers} workers...")
+    records = iter_records(input_file)
+    chunks = iter(lambda: list(islice(records, chunk_size)), [])
+    shards = ((chunk, f"{output_file}.part-{i:05d}") for i, chunk in enumerate(chunks))
+
+    events = triples = 0
+    failure_types = set()
+    with open(output_file, "w", encoding="utf-8") as out:
+        def collect(results):
+            nonlocal events, triples
+            for (shard_events, shard_triples, shard_types), part_path in results:
+                events += shard_events
+                triples += shard_triples
+                failure_types.update(shard_types)
+                with open(part_path, "r", encoding="utf-8") as part:
+                    shutil.copyfileobj(part, out)
+                os.remove(part_path)
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Keep a bounded number of shards in flight so memory stays flat
+                pending = []
+                for shard in shards:
+                    pending.append((pool.submit(_write_shard, shard), shard[1]))
+                    if len(pending) >= 2 * workers:
+                        future, part_path = pending.pop(0)
+                        collect([(future.result(), part_path)])
+                collect((future.result(), part_path) for future, part_path in pending)
+        else:
+            collect((_write_shard(shard), shard[1]) for shard in shards)
+
+        for failure_type in sorted(failure_types):
+            lines = concept_ntriples(failure_type)
+            out.writelines(lines)
+            triples += len(lines)
+
+    print(f"Transformed {events} records.")
+    print(f"Streamed {triples} triples.")
+    print(f"RDF data saved to {output_file}")
+
 def transform_to_rdf(input_file, output_file):
     """
-    Transforms FDA JSON data into RDF (Turtle) format.
+    Transforms FDA raw records (JSONL or legacy JSON) into RDF (Turtle) format.
     """
     if not os.path.exists(input_file):
         print(f"Input file not found: {input_file}")
         return
 
-    print(f"Loading data from {input_file}...")
-    with open(input_file, 'r') as f:
-        data = json.load(f)
+    print(f"Streaming records from {input_file}...")
 
     g = Graph()
     g.bind("fda", FDA)
@@ -25,14 +177,16 @@ def transform_to_rdf(input_file, output_file):
     g.bind("skos", SKOS)
     g.bind("ex", EX)
 
-    print(f"Transforming {len(data)} records to RDF...")
+    print("Transforming records to RDF...")
     
-    for record in data:
+    count = 0
+    for record in iter_records(input_file):
         event_id = record.get("event_id")
         if not event_id:
             continue
             
         event_uri = EX[f"event/{event_id}"]
+        count += 1
         
         # Type definition
         g.add((event_uri, RDF.type, FDA.RecallEvent))
@@ -55,13 +209,13 @@ def transform_to_rdf(input_file, output_file):
         failure_type = record.get("failure_type")
         if failure_type:
             # Create a slug for the concept
-            concept_slug = failure_type.lower().replace(" ", "_").replace("/", "_")
-            concept_uri = FDA[f"failure_type/{concept_slug}"]
+            concept_uri = FDA[f"failure_type/{concept_slug(failure_type)}"]
             
             g.add((event_uri, FDA.hasFailureType, concept_uri))
             g.add((concept_uri, RDF.type, SKOS.Concept))
             g.add((concept_uri, SKOS.prefLabel, Literal(failure_type, lang="en")))
 
+    print(f"Transformed {count} records.")
     print(f"Serialized {len(g)} triples.")
     g.serialize(destination=output_file, format="turtle")
     print(f"RDF data saved to {output_file}")
@@ -69,7 +223,18 @@ def transform_to_rdf(input_file, output_file):
 if __name__ == "__main__":
     # Default paths for testing
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    INPUT_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.json")
-    OUTPUT_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.ttl")
-    
-    transform_to_rdf(INPUT_PATH, OUTPUT_PATH)
+    INPUT_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.jsonl")
+    OUTPUT_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.nt")
+    TURTLE_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.ttl")
+
+    parser = argparse.ArgumentParser(description="Transform raw FDA records into RDF.")
+    parser.add_argument("--turtle", action="store_true",
+                        help="Write pretty-printed Turtle via rdflib instead of streaming N-Triples")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.turtle:
+        transform_to_rdf(INPUT_PATH, TURTLE_PATH)
+    else:
+        transform_to_ntriples(INPUT_PATH, OUTPUT_PATH, workers=args.workers, chunk_size=args.chunk_size)
@@ -0,0 +1,132 @@
+import gzip
+import io
+import json
+import os
+
+# Shared reader/writer for the raw quality-event records.
+# The raw corpus is stored as newline-delimited JSON (one record per line),
+# optionally gzip (.jsonl.gz) or zstd (.jsonl.zst) compressed, so every stage can
+# stream it record by record with flat memory. Legacy JSON-array files (.json)
+# are still accepted and decoded incrementally.
+
+CHUNK_SIZE = 1 << 20
+
+
+def _open_text(path, mode):
+    """Opens a raw file in text mode, picking the codec from the extension."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading/writing .zst files requires the 'zstandard' package.")
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, "wb"), closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _iter_json_array(f, started=False):
+    """Yields the objects of a JSON array one at a time without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0  # decoding position in buffer; consumed text is dropped once per read
+    eof = False
+    while True:
+        # Skip separators between array elements
+        while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == "," or
+                                     (not started and buffer[pos] == "[")):
+            if buffer[pos] == "[":
+                started = True
+            pos += 1
+
+        if buffer.startswith("]", pos):
+            return
+        if pos < len(buffer):
+            try:
+                obj, pos = decoder.raw_decode(buffer, pos)
+                yield obj
+                continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        elif eof:
+            return
+
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def iter_records(path):
+    """
+    Streams records from a raw file (.jsonl[.gz|.zst] or a legacy JSON array).
+    """
+    with _open_text(path, "r") as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        if head == "[":
+            yield from _iter_json_array(f, started=True)
+            return
+
+        first = head + f.readline()
+        if first.strip():
+            yield json.loads(first)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_records(path, records):
+    """
+    Writes records as JSONL (compressed per extension). The file is written to a
+    temporary name and renamed, so readers never see a partially written corpus.
+    Returns the number of records written.
+    """
+    tmp_path = f"{path}.tmp{os.path.splitext(path)[1]}"
+    count = 0
+    with _open_text(tmp_path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+def append_records(path, records, expected_size=None):
+    """
+    Appends records to an uncompressed JSONL file in place (O(records), not
+    O(corpus)). On failure the file is truncated back to its previous size, so
+    readers never see a partial record. With expected_size, anything past that
+    size (records appended by a run that did not finish) is dropped first.
+    Returns the number of records appended.
+    """
+    if not path.endswith(".jsonl"):
+        raise ValueError(f"Can only append to an uncompressed .jsonl file: {path}")
+    count = 0
+    with open(path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if expected_size is not None and size > expected_size:
+            f.truncate(expected_size)
+            size = f.seek(expected_size)
+        try:
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(size)
+            raise
+    return count
@@ -1,49 +1,375 @@
 import os
 import json
+import time
+import argparse
 from elasticsearch import Elasticsearch, helpers
+from elasticsearch.exceptions import NotFoundError
+from rdflib import Dataset, Literal, URIRef
+from rdflib.namespace import RDFS, SKOS
+from record_io import iter_records
+from ntriples import rdf_format
+from rdf_transformer import concept_slug
+from graph_cache import load_view
 
-def index_data(json_path, es_host="http://localhost:9200", index_name="fda_events"):
-    """
-    Indexes the FDA quality events into Elasticsearch.
-    """
-    if not os.path.exists(json_path):
-        print(f"JSON file not found: {json_path}")
-        return
+FDA = "http://example.org/fda/quality/"
+EVENT_BASE = "http://example.org/resource/event/"
+MENTIONS_ENTITY = URIRef(FDA + "mentionsEntity")
+ENTITY_TYPE = URIRef(FDA + "entityType")
+IN_DUPLICATE_CLUSTER = URIRef(FDA + "inDuplicateCluster")
+CLUSTER_SIZE = URIRef(FDA + "clusterSize")
 
+# Bulk load tuning
+CHUNK_SIZE = 1000
+THREAD_COUNT = 4
+# Replicas restored once a fresh index is loaded (ES default)
+REPLICAS = int(os.environ.get("ES_REPLICAS", 1))
+# Previous versioned indices kept after an alias swap, for rollback
+KEEP_OLD = 1
+
+SETTINGS = {
+    "number_of_shards": 1,
+    "analysis": {
+        "analyzer": {
+            "recall_text": {
+                "type": "custom",
+                "tokenizer": "standard",
+                "filter": ["lowercase", "asciifolding", "english_stop", "english_stemmer"],
+            }
+        },
+        "filter": {
+            "english_stop": {"type": "stop", "stopwords": "_english_"},
+            "english_stemmer": {"type": "stemmer", "language": "light_english"},
+        },
+    },
+}
+
+MAPPINGS = {
+    # Unknown fields stay in _source but are not indexed
+    "dynamic": False,
+    "properties": {
+        "event_id": {"type": "keyword"},
+        "recall_number": {"type": "keyword"},
+        "recalling_firm": {"type": "keyword", "fields": {"text": {"type": "text"}}},
+        "status": {"type": "keyword"},
+        "classification": {"type": "keyword"},
+        "failure_type": {"type": "keyword"},
+        "reason_for_recall": {"type": "text", "analyzer": "recall_text"},
+        "product_description": {"type": "text", "analyzer": "recall_text"},
+        "report_date": {"type": "date", "format": "yyyyMMdd||strict_date_optional_time"},
+        "country": {"type": "keyword"},
+        "state": {"type": "keyword"},
+        "city": {"type": "keyword"},
+        # Joined in from the enriched graph (see Enrichment)
+        "event_uri": {"type": "keyword"},
+        "failure_type_uri": {"type": "keyword"},
+        "failure_type_labels": {"type": "keyword"},
+        "entities": {
+            "properties": {
+                "uri": {"type": "keyword"},
+                "label": {"type": "keyword", "fields": {"text": {"type": "text"}}},
+                "type": {"type": "keyword"},
+            }
+        },
+        "entity_labels": {"type": "keyword"},
+        "entity_types": {"type": "keyword"},
+        # Near-duplicate narrative clusters (see near_duplicates.py)
+        "duplicate_clusters": {"type": "keyword"},
+        "duplicate_cluster_size": {"type": "integer"},
+    },
+}
+
+
+def _connect(es_host):
     # In a real pipeline, we might wait for ES to be up.
     # Here we assume it's running via Docker.
     es = Elasticsearch(hosts=[es_host])
-    
+
     # Check connection (Stub for dev environment where ES might not be running)
     if not es.ping():
         print(f"Cannot connect to Elasticsearch at {es_host}. Is Docker running?")
         print("Skipping indexing step but script logic is valid.")
-        return
+        return None
 
     print("Connected to Elasticsearch.")
-    
-    with open(json_path, 'r') as f:
-        records = json.load(f)
-
-    # Generator for bulk indexing
-    def generate_actions():
-        for record in records:
-            # We can enrich this with the NER results if we parse the enriched TTL
-            # For now, index the raw JSON + a simple ID
-            yield {
-                "_index": index_name,
-                "_id": record.get("event_id"),
-                "_source": record
-            }
+    return es
+
+
+class _MentionSink:
+    """N-Triples parser sink that keeps only mention and entity triples."""
+
+    def __init__(self, enrichment):
+        self.enrichment = enrichment
+
+    def triple(self, s, p, o):
+        self.enrichment.add(s, p, o)
+
+
+class Enrichment:
+    """
+    In-memory join tables built from the enriched graph: the entities each
+    event mentions, entity labels and types, and failure-type concept labels.
+    Only the NER sidecar and the taxonomy are read, never the full graph.
+    """
+
+    def __init__(self):
+        self.mentions = {}
+        self.entity_labels = {}
+        self.entity_types = {}
+        self.concept_labels = {}
+        self.clusters = {}
+        self.cluster_sizes = {}
+
+    def add(self, s, p, o):
+        if p == MENTIONS_ENTITY:
+            self.mentions.setdefault(str(s), []).append(str(o))
+        elif p == ENTITY_TYPE:
+            self.entity_types[str(s)] = str(o)
+        elif p == RDFS.label and isinstance(o, Literal):
+            self.entity_labels[str(s)] = str(o)
+        elif p == IN_DUPLICATE_CLUSTER:
+            self.clusters.setdefault(str(s), []).append(str(o))
+        elif p == CLUSTER_SIZE:
+            self.cluster_sizes[str(s)] = int(o)
+
+    def load_mentions(self, path):
+        """Streams mention triples from the NER output (N-Triples) or parses other formats."""
+        if rdf_format(path) == "nt":
+            from rdflib.plugins.parsers.ntriples import W3CNTriplesParser
+            with open(path, "rb") as f:
+                W3CNTriplesParser(sink=_MentionSink(self)).parse(f)
+        else:
+            graph = Dataset(default_union=True)
+            graph.parse(path, format=rdf_format(path))
+            for s, p, o in graph.triples((None, None, None)):
+                self.add(s, p, o)
+
+    def load_taxonomy(self, path):
+        self.add_concept_labels(load_view(path))
+
+    def add_concept_labels(self, taxonomy):
+        """Concept labels from a taxonomy graph (anything with rdflib-style triples())."""
+        for predicate in (SKOS.prefLabel, SKOS.altLabel):
+            for concept, _, label in taxonomy.triples((None, predicate, None)):
+                labels = self.concept_labels.setdefault(str(concept), [])
+                if str(label) not in labels:
+                    labels.append(str(label))
+
+    def document(self, record):
+        """The record plus the denormalized graph fields."""
+        doc = dict(record)
+        event_uri = EVENT_BASE + str(record.get("event_id"))
+        doc["event_uri"] = event_uri
+        failure_type = record.get("failure_type")
+        if failure_type:
+            concept = f"{FDA}failure_type/{concept_slug(failure_type)}"
+            doc["failure_type_uri"] = concept
+            doc["failure_type_labels"] = self.concept_labels.get(concept, [failure_type])
+
+        entities = [
+            {"uri": uri, "label": self.entity_labels.get(uri), "type": self.entity_types.get(uri)}
+            for uri in dict.fromkeys(self.mentions.get(event_uri, ()))
+        ]
+        doc["entities"] = entities
+        doc["entity_labels"] = sorted({e["label"] for e in entities if e["label"]})
+        doc["entity_types"] = sorted({e["type"] for e in entities if e["type"]})
+        clusters = self.clusters.get(event_uri)
+        if clusters:
+            doc["duplicate_clusters"] = [uri.rsplit("/", 1)[-1] for uri in clusters]
+            doc["duplicate_cluster_size"] = max(self.cluster_sizes.get(uri, 0) for uri in clusters)
+        return doc
+
+
+def load_enrichment(mentions_path=None, taxonomy_path=None, clusters_path=None):
+    """Builds the Enrichment join tables from whichever inputs exist."""
+    enrichment = Enrichment()
+    if mentions_path and os.path.exists(mentions_path):
+        enrichment.load_mentions(mentions_path)
+        print(f"Loaded entity mentions for {len(enrichment.mentions)} events from {mentions_path}")
+    if clusters_path and os.path.exists(clusters_path):
+        # Same streaming sink; only the cluster triples are kept
+        enrichment.load_mentions(clusters_path)
+        print(f"Loaded near-duplicate clusters for {len(enrichment.clusters)} events from {clusters_path}")
+    if taxonomy_path and os.path.exists(taxonomy_path):
+        enrichment.load_taxonomy(taxonomy_path)
+        print(f"Loaded labels for {len(enrichment.concept_labels)} failure-type concepts from {taxonomy_path}")
+    return enrichment
+
+
+def generate_actions(json_path, index_name, keys=None, enrichment=None, records=None):
+    """
+    Bulk index actions streamed straight from the raw file (or from records,
+    an iterable of already read records), each document joined with its
+    graph enrichment. With keys, only records whose "event_id|recall_number"
+    key is in keys are emitted.
+    """
+    enrichment = enrichment or Enrichment()
+    for record in records if records is not None else iter_records(json_path):
+        if keys is not None and f"{record.get('event_id')}|{record.get('recall_number')}" not in keys:
+            continue
+        yield {
+            "_index": index_name,
+            "_id": record.get("event_id"),
+            "_source": enrichment.document(record)
+        }
+
 
+def _alias_indices(es, alias):
     try:
-        success, failed = helpers.bulk(es, generate_actions())
-        print(f"Indexed {success} documents. Failed: {failed}")
+        return sorted(es.indices.get_alias(name=alias))
+    except NotFoundError:
+        return []
+
+
+def _load(es, actions, chunk_size, thread_count):
+    """Runs parallel_bulk over the actions; returns (succeeded, failed)."""
+    success = failed = 0
+    for ok, info in helpers.parallel_bulk(es, actions, thread_count=thread_count, chunk_size=chunk_size,
+                                          raise_on_error=False, raise_on_exception=False):
+        if ok:
+            success += 1
+        else:
+            failed += 1
+            if failed <= 5:
+                print(f"Failed to index: {info}")
+    return success, failed
+
+
+def reindex(es, json_path, alias="fda_events", chunk_size=CHUNK_SIZE, thread_count=THREAD_COUNT,
+            enrichment=None, records=None):
+    """
+    Builds a new versioned index (<alias>_v<timestamp>) with explicit mappings,
+    loads it with refresh and replicas off, then atomically points the alias
+    at it. The live index keeps serving until the swap; on failures the new
+    index is dropped and the alias is left alone. Returns the document count.
+    records replaces reading json_path, e.g. when fed by the fan-out reader.
+    """
+    index_name = f"{alias}_v{time.strftime('%Y%m%d%H%M%S')}"
+    es.indices.create(index=index_name, body={
+        "settings": dict(SETTINGS, number_of_replicas=0, refresh_interval="-1"),
+        "mappings": MAPPINGS,
+    })
+    print(f"Loading {index_name} (chunk_size={chunk_size}, thread_count={thread_count})...")
+
+    started = time.monotonic()
+    success, failed = _load(es, generate_actions(json_path, index_name, enrichment=enrichment, records=records),
+                            chunk_size, thread_count)
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(f"Indexed {success} documents in {elapsed:.1f}s ({success / elapsed:.0f} docs/s). Failed: {failed}")
+    if failed:
+        print(f"Dropping {index_name}; {alias} is unchanged")
+        es.indices.delete(index=index_name)
+        return None
+
+    es.indices.put_settings(index=index_name, body={
+        "index": {"refresh_interval": "1s", "number_of_replicas": REPLICAS}
+    })
+    es.indices.refresh(index=index_name)
+
+    old = _alias_indices(es, alias)
+    actions = [{"add": {"index": index_name, "alias": alias}}]
+    if not old and es.indices.exists(index=alias):
+        # Legacy concrete index named like the alias: replace it in the same atomic call
+        actions.append({"remove_index": {"index": alias}})
+    actions += [{"remove": {"index": name, "alias": alias}} for name in old]
+    es.indices.update_aliases(body={"actions": actions})
+    print(f"Alias {alias} -> {index_name}")
+
+    versions = sorted(name for name in es.indices.get(index=f"{alias}_v*") if name != index_name)
+    for name in versions[:max(len(versions) - KEEP_OLD, 0)]:
+        es.indices.delete(index=name)
+        print(f"Deleted old index {name}")
+    return success
+
+
+def index_changeset(es, json_path, changeset, alias="fda_events", chunk_size=CHUNK_SIZE,
+                    thread_count=THREAD_COUNT, enrichment=None, records=None):
+    """
+    Applies an ingestion changeset to the live index behind the alias. An
+    event's document is built from its recalls, so every event with an added,
+    changed or removed recall is re-indexed from all of its remaining recalls,
+    and events with none left are deleted. The events listed under "events"
+    (e.g. those whose duplicate clusters changed) are re-indexed too. records
+    replaces reading json_path (one pass either way). Returns the number of
+    documents written, or None if any action failed (the changeset then
+    counts as not applied).
+    """
+    removed_events = {key.split("|", 1)[0] for key in changeset.get("removed", [])}
+    events = set(changeset.get("events", [])) | removed_events | {
+        key.split("|", 1)[0] for key in changeset.get("added", []) + changeset.get("changed", [])}
+    keys, present = set(), set()
+
+    def tracked():
+        for record in records if records is not None else iter_records(json_path):
+            event_id = str(record.get("event_id"))
+            present.add(event_id)
+            if event_id in events:
+                keys.add(f"{event_id}|{record.get('recall_number')}")
+            yield record
+
+    def actions():
+        yield from generate_actions(json_path, alias, keys, enrichment, records=tracked())
+        for event_id in removed_events - present:
+            yield {"_op_type": "delete", "_index": alias, "_id": event_id}
+
+    print(f"Applying changeset to {alias}: {len(events)} events to re-index, up to {len(removed_events)} deletes")
+    success, failed = _load(es, actions(), chunk_size, thread_count)
+    print(f"Indexed {success} documents. Failed: {failed}")
+    if failed:
+        return None
+    return success
+
+
+def index_data(json_path, es_host="http://localhost:9200", index_name="fda_events", changeset=None,
+               chunk_size=CHUNK_SIZE, thread_count=THREAD_COUNT, mentions_path=None, taxonomy_path=None,
+               clusters_path=None):
+    """
+    Indexes the FDA quality events into Elasticsearch.
+    index_name is the alias the dashboard queries. Without a changeset the
+    whole corpus is reindexed into a fresh index behind the alias; with one
+    (a dict or a path to the ingestion changeset JSON) only the changed
+    records are written to the live index.
+    Documents carry the NER entities from mentions_path and the failure-type
+    concept labels from taxonomy_path and the near-duplicate clusters from
+    clusters_path, when given.
+    Returns the number of indexed documents, or None if indexing did not happen.
+    """
+    if not os.path.exists(json_path):
+        print(f"Raw records file not found: {json_path}")
+        return
+
+    es = _connect(es_host)
+    if es is None:
+        return
+
+    try:
+        enrichment = load_enrichment(mentions_path, taxonomy_path, clusters_path)
+        if isinstance(changeset, str):
+            with open(changeset, "r") as f:
+                changeset = json.load(f)
+        if changeset is not None and _alias_indices(es, index_name):
+            return index_changeset(es, json_path, changeset, index_name, chunk_size, thread_count, enrichment)
+        if changeset is not None:
+            print(f"No {index_name} alias yet; doing a full reindex instead")
+        return reindex(es, json_path, index_name, chunk_size, thread_count, enrichment)
     except Exception as e:
         print(f"Indexing error: {e}")
 
 if __name__ == "__main__":
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    JSON_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.json")
-    
-    index_data(JSON_PATH)
+    JSON_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.jsonl")
+    CHANGESET_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.changeset.json")
+    MENTIONS_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_entity_mentions.nt")
+    TAXONOMY_PATH = os.path.join(BASE_DIR, "data", "processed", "failure_taxonomy.ttl")
+    CLUSTERS_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_duplicate_clusters.nt")
+
+    parser = argparse.ArgumentParser(description="Index FDA quality events into Elasticsearch.")
+    parser.add_argument("--es-host", default=os.environ.get("ES_HOST", "http://localhost:9200"))
+    parser.add_argument("--changed-only", action="store_true",
+                        help=f"Only apply {os.path.basename(CHANGESET_PATH)} to the live index")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--threads", type=int, default=THREAD_COUNT)
+    args = parser.parse_args()
+
+    index_data(JSON_PATH, es_host=args.es_host, changeset=CHANGESET_PATH if args.changed_only else None,
+               chunk_size=args.chunk_size, thread_count=args.threads,
+               mentions_path=MENTIONS_PATH, taxonomy_path=TAXONOMY_PATH, clusters_path=CLUSTERS_PATH)
@@ -0,0 +1,247 @@
+import os
+import math
+import time
+import argparse
+from array import array
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from record_io import iter_records
+
+# Columnar snapshot of the enriched corpus for analytics.
+# Three tables: events (one row per recall), mentions (event -> NER entity)
+# and failure_types (event -> failure-type concept). String columns are
+# dictionary-encoded with one dictionary per column and report_date is a real
+# date32. Each table is written as Parquet for external tools and as an
+# uncompressed Arrow IPC file, which Snapshot memory-maps so that group-bys run
+# as NumPy operations over the dictionary codes without copying or parsing.
+
+# (column, dictionary-encoded?) per table
+TABLES = {
+    "events": [
+        ("event_id", False), ("recall_number", False), ("recalling_firm", True), ("classification", True),
+        ("status", True), ("failure_type", True), ("failure_type_uri", True), ("city", True),
+        ("state", True), ("country", True), ("report_date", False),
+    ],
+    "mentions": [("event_id", True), ("entity_uri", True), ("entity_label", True), ("entity_type", True)],
+    "failure_types": [("event_id", True), ("failure_type_uri", True), ("failure_type_label", True)],
+}
+# Group-by keys derived from report_date
+DATE_PARTS = {"year": "datetime64[Y]", "month": "datetime64[M]", "day": "datetime64[D]"}
+NO_DATE = np.iinfo(np.int32).min
+# Group-bys whose key space exceeds this (and the row count) count only the groups present
+DENSE_GROUPS = 1 << 20
+
+
+class _Column:
+    """Append-only column; strings are dictionary-encoded while streaming."""
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+        self.codes = array("i")
+        self.dictionary = {}
+        self.values = []
+
+    def append(self, value):
+        if not self.encoded:
+            self.values.append(value)
+        elif value in (None, ""):
+            self.codes.append(-1)
+        else:
+            self.codes.append(self.dictionary.setdefault(value, len(self.dictionary)))
+
+    def to_arrow(self):
+        if not self.encoded:
+            return pa.array(self.values, type=pa.string())
+        codes = np.frombuffer(self.codes, dtype=np.int32)
+        indices = pa.array(codes, mask=codes < 0, type=pa.int32())
+        return pa.DictionaryArray.from_arrays(indices, pa.array(list(self.dictionary), type=pa.string()))
+
+
+def _table(columns):
+    arrays = {name: column.to_arrow() for name, column in columns.items()}
+    if "report_date" in arrays:
+        parsed = pc.strptime(arrays["report_date"], format="%Y%m%d", unit="s", error_is_null=True)
+        arrays["report_date"] = pc.cast(parsed, pa.date32())
+    return pa.table(arrays)
+
+
+def write_snapshot(json_path, output_dir, mentions_path=None, taxonomy_path=None):
+    """
+    Streams the raw file once, joins the graph enrichment and writes
+    <table>.parquet and <table>.arrow for every table. Returns row counts.
+    """
+    from search_indexer import load_enrichment
+    enrichment = load_enrichment(mentions_path, taxonomy_path)
+    started = time.monotonic()
+    columns = {table: {name: _Column(encoded) for name, encoded in spec} for table, spec in TABLES.items()}
+    events, mentions, failure_types = columns["events"], columns["mentions"], columns["failure_types"]
+    seen_events, seen_failure_types = set(), set()
+
+    for record in iter_records(json_path):
+        doc = enrichment.document(record)
+        for name, column in events.items():
+            value = doc.get(name)
+            column.append(str(value) if value is not None else None)
+        event_id = str(doc.get("event_id"))
+        # Mentions are joined per event, so every recall of the event repeats
+        # them; failure types are derived per recall and may differ
+        if event_id not in seen_events:
+            seen_events.add(event_id)
+            for entity in doc["entities"]:
+                mentions["event_id"].append(event_id)
+                mentions["entity_uri"].append(entity["uri"])
+                mentions["entity_label"].append(entity["label"])
+                mentions["entity_type"].append(entity["type"])
+        if doc.get("failure_type_uri") and (event_id, doc["failure_type_uri"]) not in seen_failure_types:
+            seen_failure_types.add((event_id, doc["failure_type_uri"]))
+            failure_types["event_id"].append(event_id)
+            failure_types["failure_type_uri"].append(doc["failure_type_uri"])
+            failure_types["failure_type_label"].append(doc["failure_type_labels"][0])
+
+    os.makedirs(output_dir, exist_ok=True)
+    counts = {}
+    for name, table_columns in columns.items():
+        table = _table(table_columns)
+        counts[name] = table.num_rows
+        pq.write_table(table, os.path.join(output_dir, f"{name}.parquet"), compression="zstd")
+        tmp_path = os.path.join(output_dir, f"{name}.arrow.tmp")
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, os.path.join(output_dir, f"{name}.arrow"))
+    print(f"Snapshot written to {output_dir}: " + ", ".join(f"{n} {name}" for name, n in counts.items())
+          + f" ({time.monotonic() - started:.1f}s)")
+    return counts
+
+
+class Snapshot:
+    """
+    Read-only, memory-mapped view of a snapshot directory with vectorized
+    filtered group-bys. Columns are decoded lazily and cached.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tables = {}
+        self._codes = {}
+
+    def table(self, name):
+        if name not in self.tables:
+            source = pa.memory_map(os.path.join(self.path, f"{name}.arrow"), "r")
+            self.tables[name] = pa.ipc.open_file(source).read_all().combine_chunks()
+        return self.tables[name]
+
+    def _days(self, table):
+        """report_date as int days since the epoch, NO_DATE for nulls."""
+        days = self.table(table).column("report_date").combine_chunks()
+        return pc.fill_null(days.cast(pa.int32()), NO_DATE).to_numpy()
+
+    def _column(self, table, name):
+        """(codes, labels) of a column: dense int codes (-1 for null) and the value of each code."""
+        key = (table, name)
+        if key not in self._codes:
+            if name in DATE_PARTS:
+                values = self._days(table)
+                missing = values == NO_DATE
+                parts = values.astype("datetime64[D]").astype(DATE_PARTS[name])
+                labels, codes = np.unique(parts[~missing], return_inverse=True)
+                full = np.full(len(values), -1, dtype=np.int64)
+                full[~missing] = codes
+                self._codes[key] = (full, [str(label) for label in labels])
+            else:
+                column = self.table(table).column(name).combine_chunks()
+                if not pa.types.is_dictionary(column.type):
+                    column = column.dictionary_encode()
+                codes = pc.fill_null(column.indices, -1).to_numpy()
+                self._codes[key] = (codes, column.dictionary.to_pylist())
+        return self._codes[key]
+
+    def _mask(self, table, where):
+        mask = np.ones(self.table(table).num_rows, dtype=bool)
+        for name, condition in (where or {}).items():
+            if name == "report_date":
+                start, end = condition
+                values = self._days(table)
+                mask &= values != NO_DATE
+                if start is not None:
+                    mask &= values >= np.datetime64(start, "D").astype(np.int64)
+                if end is not None:
+                    mask &= values <= np.datetime64(end, "D").astype(np.int64)
+                continue
+            codes, labels = self._column(table, name)
+            wanted = [condition] if isinstance(condition, str) else list(condition)
+            lookup = {label: code for code, label in enumerate(labels)}
+            mask &= np.isin(codes, [lookup[value] for value in wanted if value in lookup])
+        return mask
+
+    def count(self, by, where=None, table="events", top=None):
+        """
+        Row counts grouped by one or more columns (or year/month/day of
+        report_date), filtered by where: {column: value or values} and
+        optionally "report_date": (start, end) as ISO dates, inclusive.
+        Returns a pandas DataFrame sorted by descending count.
+        """
+        import pandas as pd
+        by = [by] if isinstance(by, str) else list(by)
+        mask = self._mask(table, where)
+        columns = [self._column(table, name) for name in by]
+        # Shift codes by one so null groups (-1) get a slot of their own
+        codes = [codes[mask] + 1 for codes, _ in columns]
+        shape = [len(labels) + 1 for _, labels in columns]
+        if math.prod(shape) <= max(DENSE_GROUPS, len(codes[0])):
+            # Small key space: one bincount over the flattened group index
+            counts = np.bincount(np.ravel_multi_index(codes, shape), minlength=1)
+            groups = np.flatnonzero(counts)
+            counts = counts[groups]
+            parts = np.unravel_index(groups, shape)
+        else:
+            # Wide key space (e.g. firm x city x month): only the groups present
+            groups, counts = np.unique(np.stack(codes, axis=1), axis=0, return_counts=True)
+            parts = groups.T
+        order = np.argsort(-counts, kind="stable")[:top]
+        counts = counts[order]
+        parts = [part[order] for part in parts]
+        frame = {
+            name: [labels[code - 1] if code else None for code in part]
+            for name, (_, labels), part in zip(by, columns, parts)
+        }
+        frame["count"] = counts
+        return pd.DataFrame(frame)
+
+    def frame(self, table="events", columns=None, where=None):
+        """Filtered rows as a pandas DataFrame (categoricals for dictionary columns)."""
+        data = self.table(table)
+        if columns:
+            data = data.select(columns)
+        mask = self._mask(table, where)
+        return data.filter(pa.array(mask)).to_pandas()
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    JSON_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.jsonl")
+    SNAPSHOT_DIR = os.path.join(BASE_DIR, "data", "processed", "snapshot")
+    MENTIONS_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_entity_mentions.nt")
+    TAXONOMY_PATH = os.path.join(BASE_DIR, "data", "processed", "failure_taxonomy.ttl")
+
+    parser = argparse.ArgumentParser(description="Write or query the columnar (Parquet/Arrow) snapshot.")
+    parser.add_argument("--count", nargs="+", metavar="COLUMN",
+                        help="Query instead of writing: count events grouped by these columns (or year/month)")
+    parser.add_argument("--where", nargs="*", default=[], metavar="COLUMN=VALUE")
+    parser.add_argument("--table", default="events", choices=list(TABLES))
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.count:
+        snapshot = Snapshot(SNAPSHOT_DIR)
+        where = {}
+        for clause in args.where:
+            name, value = clause.split("=", 1)
+            where.setdefault(name, []).append(value)
+        started = time.perf_counter()
+        result = snapshot.count(args.count, where, table=args.table, top=args.top)
+        print(result.to_string(index=False))
+        print(f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+    else:
+        write_snapshot(JSON_PATH, SNAPSHOT_DIR, MENTIONS_PATH, TAXONOMY_PATH)
@@ -1,50 +1,335 @@
-from SPARQLWrapper import SPARQLWrapper, JSON, POST, DIGEST
 import os
+import re
+import gzip
+import json
+import time
+import threading
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from ntriples import nt_term, rdf_format
+from http_retry import retry_delay
+
+# Graph Store Protocol upload settings
+CHUNK_TRIPLES = 50000
+UPLOAD_WORKERS = 4
+MAX_RETRIES = 5
+BACKOFF = 1.0
+TIMEOUT = 300
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Blank node labels are scoped to one request, so blank nodes are skolemized
+# into IRIs before the file is cut into independently uploaded chunks
+SKOLEM_BASE = "http://example.org/.well-known/genid/"
+
+# Query result cache settings
+CACHE_ENTRIES = 1024
+CACHE_TTL = 300
+QUERY_WORKERS = 8
+
+_SUBJECT_BNODE = re.compile(r"^_:(\S+)")
+_OBJECT_BNODE = re.compile(r" _:(\S+) \.\s*$")
+_STRING_OR_SPACE = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')|\s+')
+
+
+def skolemize(line):
+    """Rewrites the blank node subject/object of one N-Triples line as skolem IRIs."""
+    line = _SUBJECT_BNODE.sub(lambda m: f"<{SKOLEM_BASE}{m.group(1)}>", line)
+    return _OBJECT_BNODE.sub(lambda m: f" <{SKOLEM_BASE}{m.group(1)}> .\n", line)
+
+
+def iter_ntriples(file_path):
+    """
+    Yields the statements of an RDF file as N-Triples lines. N-Triples files
+    are streamed; other formats are read through the parsed-graph cache.
+    """
+    if rdf_format(file_path) == "nt":
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip() and not line.lstrip().startswith("#"):
+                    yield skolemize(line) if "_:" in line else line
+        return
+
+    from graph_cache import load_view
+    for s, p, o in load_view(file_path):
+        line = f"{nt_term(s)} {nt_term(p)} {nt_term(o)} .\n"
+        yield skolemize(line) if "_:" in line else line
+
+
+def iter_chunks(lines, chunk_triples=CHUNK_TRIPLES):
+    """Groups N-Triples lines into (index, body, triple count) chunks."""
+    chunk = []
+    index = 0
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_triples:
+            yield index, "".join(chunk).encode("utf-8"), len(chunk)
+            chunk = []
+            index += 1
+    if chunk:
+        yield index, "".join(chunk).encode("utf-8"), len(chunk)
+
+
+def normalize_query(sparql_query):
+    """Collapses whitespace outside string literals, so layout does not split cache entries."""
+    normalized = _STRING_OR_SPACE.sub(lambda m: m.group(1) or " ", sparql_query)
+    return normalized.strip()
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache of query results whose entries also expire after ttl
+    seconds. clear() bumps a generation counter so results of queries that were
+    in flight during an invalidation are not stored.
+    """
+
+    def __init__(self, max_entries=CACHE_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, generation):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "invalidations": self.invalidations,
+            }
+
 
 class SPARQLClient:
     """
-    Client for interacting with a SPARQL endpoint using SPARQLWrapper.
+    HTTP client (requests) for a Fuseki dataset.
+    Bulk uploads go through the Graph Store Protocol at data_endpoint
+    (by default the dataset's /data service next to the update endpoint).
+    Queries go over a pooled keep-alive session and their results are cached
+    (cache_ttl=0 disables the cache); uploads invalidate the cache.
     """
-    def __init__(self, update_endpoint, query_endpoint):
+    def __init__(self, update_endpoint, query_endpoint, data_endpoint=None, pool_size=QUERY_WORKERS,
+                 cache_entries=CACHE_ENTRIES, cache_ttl=CACHE_TTL):
         self.update_endpoint = update_endpoint
         self.query_endpoint = query_endpoint
-        self._update = SPARQLWrapper(update_endpoint)
-        self._query = SPARQLWrapper(query_endpoint)
+        self.data_endpoint = data_endpoint or update_endpoint.rsplit("/", 1)[0] + "/data"
+        self.pool_size = pool_size
+        self.cache = QueryCache(cache_entries, cache_ttl) if cache_ttl > 0 else None
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-    def upload_ttl(self, file_path, graph_uri='default'):
+    def _send_chunk(self, method, body, graph_uri, compress=True, retries=MAX_RETRIES, backoff=BACKOFF):
         """
-        Uploads a TTL file to the SPARQL store using SPARQL UPDATE (LOAD command).
-        Note: This assumes the file is accessible to the server or we read and INSERT.
-        For simplicity, we will read the file and do an INSERT DATA.
+        Sends one N-Triples chunk with PUT (replace) or POST (append), retrying
+        transient failures with exponential backoff. Returns the bytes sent.
         """
-        print(f"Reading {file_path} for upload...")
-        with open(file_path, 'r') as f:
-            ttl_data = f.read()
+        params = {"default": ""} if graph_uri == "default" else {"graph": graph_uri}
+        headers = {"Content-Type": "application/n-triples"}
+        if compress:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.request(method, self.data_endpoint, params=params, data=body,
+                                                headers=headers, timeout=TIMEOUT)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return len(body)
+                delay = retry_delay(response, backoff * (2 ** attempt))
+                error = f"HTTP {response.status_code}"
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                delay = backoff * (2 ** attempt)
+                error = e
+
+            if attempt < retries:
+                print(f"Retrying {method} chunk in {delay:.1f}s ({error})")
+                time.sleep(delay)
+
+        raise requests.exceptions.RetryError(f"Giving up after {retries} retries: {error}")
+
+    def upload_ttl(self, file_path, graph_uri='default', replace=False, chunk_triples=CHUNK_TRIPLES,
+                   workers=UPLOAD_WORKERS, compress=True, resume=True):
+        """
+        Uploads an RDF file (Turtle or N-Triples) over the Graph Store Protocol.
+        The file is streamed in chunks of chunk_triples N-Triples statements,
+        gzip-compressed, and up to workers chunks are in flight at once. With
+        replace the first chunk is PUT (replacing the graph), the rest are POSTed.
+        Finished chunks are recorded in <file>.upload.json, so a failed upload
+        resumes where it stopped when run again. Returns upload stats.
+        """
+        stat = os.stat(file_path)
+        # Whatever happens below, cached results may no longer match the dataset
+        self.invalidate_cache()
+        progress_path = file_path + ".upload.json"
+        job = {
+            "source": f"{stat.st_size}:{stat.st_mtime_ns}",
+            "target": f"{self.data_endpoint} {graph_uri}",
+            "chunk_triples": chunk_triples,
+            "replace": replace,
+        }
+        done = set()
+        if resume and os.path.exists(progress_path):
+            with open(progress_path, "r") as f:
+                previous = json.load(f)
+            if {k: previous.get(k) for k in job} == job:
+                done = set(previous["done"])
+                print(f"Resuming upload of {file_path}: {len(done)} chunks already sent")
+
+        def save_progress():
+            with open(progress_path + ".tmp", "w") as f:
+                json.dump(dict(job, done=sorted(done)), f)
+            os.replace(progress_path + ".tmp", progress_path)
+
+        print(f"Uploading {file_path} to {self.data_endpoint} ({graph_uri}, "
+              f"{'replace' if replace else 'append'}, {workers} workers)...")
+        started = time.monotonic()
+        stats = {"chunks": 0, "triples": 0, "raw_bytes": 0, "wire_bytes": 0}
+
+        def send(index, body, triples):
+            method = "PUT" if replace and index == 0 else "POST"
+            wire = self._send_chunk(method, body, graph_uri, compress)
+            return index, triples, len(body), wire
 
-        # Simple INSERT DATA (Warning: Not efficient for huge files)
-        # For huge files, use Graph Store Protocol (PUT/POST) implementation instead
-        print(f"Uploading data to {self.update_endpoint} (Stubbed for safety)...")
-        # self._update.setMethod(POST)
-        # self._update.setQuery(f"INSERT DATA {{ {ttl_data} }}")
-        # self._update.query()
-        pass
+        def record(future):
+            index, triples, raw, wire = future.result()
+            done.add(index)
+            stats["chunks"] += 1
+            stats["triples"] += triples
+            stats["raw_bytes"] += raw
+            stats["wire_bytes"] += wire
+            save_progress()
 
-    def query(self, sparql_query):
+        chunks = (c for c in iter_chunks(iter_ntriples(file_path), chunk_triples) if c[0] not in done)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            in_flight = set()
+            for index, body, triples in chunks:
+                future = pool.submit(send, index, body, triples)
+                # The replacing PUT has to land before any chunk is appended
+                if replace and index == 0:
+                    record(future)
+                    continue
+                in_flight.add(future)
+                if len(in_flight) >= workers * 2:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for f in finished:
+                        record(f)
+            for f in in_flight:
+                record(f)
+
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+        self.invalidate_cache()
+        elapsed = max(time.monotonic() - started, 1e-9)
+        stats["seconds"] = elapsed
+        stats["triples_per_sec"] = stats["triples"] / elapsed
+        print(f"Uploaded {stats['triples']} triples in {stats['chunks']} chunks in {elapsed:.1f}s "
+              f"({stats['triples_per_sec']:.0f} triples/s, {stats['wire_bytes'] / 1e6:.1f} MB on the wire "
+              f"for {stats['raw_bytes'] / 1e6:.1f} MB of N-Triples)")
+        return stats
+
+    def query(self, sparql_query, use_cache=True, strict=False):
         """
         Executes a SPARQL query and returns JSON results.
+        Results are served from the cache when an identical (modulo whitespace)
+        query was answered within the TTL. Failures return an empty result,
+        or raise with strict. The cache holds the response body, so every call
+        returns its own copy that callers may modify.
         """
-        print(f"Executing Query: {sparql_query}")
-        self._query.setQuery(sparql_query)
-        self._query.setReturnFormat(JSON)
+        key = normalize_query(sparql_query)
+        cache = self.cache if use_cache else None
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return json.loads(cached)
+            generation = cache.generation
+
+        print(f"Executing Query: {key}")
         try:
-            results = self._query.query().convert()
-            return results
+            response = self.session.post(self.query_endpoint, data={"query": sparql_query},
+                                         headers={"Accept": "application/sparql-results+json"},
+                                         timeout=TIMEOUT)
+            response.raise_for_status()
+            results = response.json()
         except Exception as e:
+            if strict:
+                raise
             print(f"Query failed: {e}")
             return {"results": {"bindings": []}} # Return empty result on failure
 
+        if cache is not None:
+            cache.put(key, response.content, generation)
+        return results
+
+    def query_many(self, queries, workers=None, use_cache=True, strict=False):
+        """
+        Runs several queries concurrently over the pooled session and returns
+        their results in input order. Identical queries are only sent once.
+        """
+        keys = [normalize_query(q) for q in queries]
+        unique = dict(zip(keys, queries))
+        workers = min(workers or self.pool_size, max(len(unique), 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {key: pool.submit(self.query, q, use_cache, strict) for key, q in unique.items()}
+            results = {key: future.result() for key, future in futures.items()}
+        return [results[key] for key in keys]
+
+    def invalidate_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
 
 if __name__ == "__main__":
-    # Example usage stub
-    client = SPARQLClient("http://localhost:3030/ds/update", "http://localhost:3030/ds/query")
-    print("SPARQL Client Initialized")
+    import argparse
+
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    DATA_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.nt")
+    FUSEKI_HOST = os.environ.get("FUSEKI_HOST", "http://localhost:3030")
+
+    parser = argparse.ArgumentParser(description="Upload an RDF file to Fuseki over the Graph Store Protocol.")
+    parser.add_argument("file", nargs="?", default=DATA_PATH)
+    parser.add_argument("--graph", default="default", help="Target graph URI (default graph if omitted)")
+    parser.add_argument("--replace", action="store_true", help="Replace the graph instead of appending")
+    parser.add_argument("--chunk-triples", type=int, default=CHUNK_TRIPLES)
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS)
+    parser.add_argument("--no-gzip", action="store_true")
+    args = parser.parse_args()
+
+    client = SPARQLClient(f"{FUSEKI_HOST}/fda/update", f"{FUSEKI_HOST}/fda/query", pool_size=args.workers)
+    client.upload_ttl(args.file, graph_uri=args.graph, replace=args.replace, chunk_triples=args.chunk_triples,
+                      workers=args.workers, compress=not args.no_gzip)
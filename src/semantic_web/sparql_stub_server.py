@@ -0,0 +1,191 @@
+import gzip
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from rdflib import Graph
+
+# Offline stand-in for a Fuseki dataset's Graph Store Protocol and query services.
+# Accepts PUT (replace) and POST (append) of N-Triples, optionally gzip
+# encoded, into the default graph (?default) or a named graph (?graph=<uri>),
+# serves them back on GET, answers SPARQL queries (/query, /sparql) over the
+# default graph with rdflib, and can inject 503 responses so the uploader's
+# retry and resume paths can be exercised without a running Fuseki.
+
+
+class StubGraphStore(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding one rdflib Graph per graph name.
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, error_rate=0.0, latency=0.0, dataset="ds"):
+        super().__init__((host, port), StubGraphStoreHandler)
+        self.dataset = dataset
+        self.graphs = {}
+        self.error_rate = error_rate
+        self.latency = latency
+        self.requests_served = 0
+        self.queries_served = 0
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/{self.dataset}"
+
+    @property
+    def data_url(self):
+        return f"{self.base_url}/data"
+
+    def graph(self, name="default"):
+        with self.lock:
+            return self.graphs.setdefault(name, Graph())
+
+
+class StubGraphStoreHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled sessions are reused
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="text/plain"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _graph_name(self):
+        params = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+        if "graph" in params:
+            return params["graph"][0]
+        return "default"
+
+    def _receive(self, replace):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.requests_served += 1
+            server.bytes_received += len(body)
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(503, b"Service Unavailable")
+            return
+
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        incoming = Graph()
+        try:
+            incoming.parse(data=body.decode("utf-8"), format="nt")
+        except Exception as e:
+            self._send(400, str(e).encode())
+            return
+
+        name = self._graph_name()
+        with server.lock:
+            if replace or name not in server.graphs:
+                server.graphs[name] = Graph()
+            target = server.graphs[name]
+            for triple in incoming:
+                target.add(triple)
+        self._send(201 if replace else 200)
+
+    def _is_query(self):
+        return urlparse(self.path).path.rsplit("/", 1)[-1] in ("query", "sparql")
+
+    def _query(self, sparql_query):
+        server = self.server
+        with server.lock:
+            server.queries_served += 1
+            graph = server.graphs.get("default", Graph())
+            try:
+                body = graph.query(sparql_query).serialize(format="json")
+            except Exception as e:
+                body = None
+                error = str(e).encode()
+        if body is None:
+            self._send(400, error)
+        else:
+            self._send(200, body, "application/sparql-results+json")
+
+    def do_PUT(self):
+        self._receive(replace=True)
+
+    def do_POST(self):
+        if self._is_query():
+            length = int(self.headers.get("Content-Length", 0))
+            form = parse_qs(self.rfile.read(length).decode("utf-8"))
+            self._query(form.get("query", [""])[0])
+        else:
+            self._receive(replace=False)
+
+    def do_GET(self):
+        if self._is_query():
+            params = parse_qs(urlparse(self.path).query)
+            self._query(params.get("query", [""])[0])
+            return
+        name = self._graph_name()
+        with self.server.lock:
+            graph = self.server.graphs.get(name)
+            body = graph.serialize(format="nt").encode() if graph is not None else None
+        if body is None:
+            self._send(404, b"No such graph")
+        else:
+            self._send(200, body, "application/n-triples")
+
+
+def start_server(**kwargs):
+    """Starts the stub on a background thread and returns the server."""
+    server = StubGraphStore(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    import os
+    import argparse
+    from rdflib.compare import isomorphic
+    from sparql_client import SPARQLClient
+
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    DATA_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.nt")
+
+    parser = argparse.ArgumentParser(description="Offline Graph Store Protocol stand-in and upload benchmark.")
+    parser.add_argument("file", nargs="?", default=DATA_PATH)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-triples", type=int, default=20000)
+    parser.add_argument("--serve", action="store_true", help="Only serve, do not run the benchmark")
+    args = parser.parse_args()
+
+    server = start_server(error_rate=args.error_rate, latency=args.latency)
+    print(f"Stub Graph Store serving at {server.data_url}")
+
+    if args.serve:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return
+
+    expected = Graph().parse(args.file, format="nt" if args.file.endswith(".nt") else "turtle")
+    client = SPARQLClient(f"{server.base_url}/update", f"{server.base_url}/query", pool_size=args.workers)
+    for workers, compress in [(1, False), (args.workers, True)]:
+        before = server.bytes_received
+        stats = client.upload_ttl(args.file, replace=True, chunk_triples=args.chunk_triples,
+                                  workers=workers, compress=compress)
+        assert isomorphic(server.graph(), expected), "Uploaded graph differs from the source file"
+        print(f"workers={workers} gzip={compress}: {stats['triples_per_sec']:.0f} triples/s, "
+              f"{(server.bytes_received - before) / 1e6:.1f} MB received by the server")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from record_io import iter_records
+
+# Materialized aggregate cube behind the dashboard trend panels.
+# Recall counts are kept per cell of month x failure_type x classification x
+# state x recalling_firm: every dimension value gets an integer code and the
+# cube is an (n_cells, 5) code matrix plus a count vector. The cube also
+# remembers which cell each record (event_id|recall_number) was counted in,
+# so a changeset is applied by moving only the changed records between cells.
+# Roll-ups (coarser time grain, fewer dimensions, filters) sum cells with
+# np.bincount and never touch the records.
+
+DIMENSIONS = ["month", "failure_type", "classification", "state", "recalling_firm"]
+# Default drill-down order of the dashboard
+HIERARCHY = ["failure_type", "classification", "state", "recalling_firm"]
+GRAINS = {"month": 1, "quarter": 3, "year": 12}
+UNKNOWN = "Unknown"
+
+
+def record_key(record):
+    return f"{record.get('event_id')}|{record.get('recall_number')}"
+
+
+def record_cell(record):
+    """Dimension values of a record (as produced by extract_fields)."""
+    date = str(record.get("report_date") or "")
+    month = f"{date[:4]}-{date[4:6]}" if len(date) >= 6 and date[:6].isdigit() else UNKNOWN
+    return (month,) + tuple(record.get(dim) or UNKNOWN for dim in DIMENSIONS[1:])
+
+
+class TrendCube:
+    def __init__(self, values=None, cells=None, counts=None, keys=None, key_cells=None):
+        self.values = values or [[] for _ in DIMENSIONS]
+        self.codes = [{value: i for i, value in enumerate(dim)} for dim in self.values]
+        self.cells = np.asarray(cells if cells is not None else np.empty((0, len(DIMENSIONS))), dtype=np.int32)
+        self.counts = np.asarray(counts if counts is not None else [], dtype=np.int64)
+        self.cell_ids = {tuple(cell): i for i, cell in enumerate(self.cells.tolist())}
+        # Record key -> cell row it is counted in
+        self.record_cells = dict(zip(keys, np.asarray(key_cells).tolist())) if keys is not None else {}
+        self._new_cells = []
+
+    # -- Maintenance --
+
+    def _cell(self, values):
+        coded = []
+        for dim, value in enumerate(values):
+            codes = self.codes[dim]
+            if value not in codes:
+                codes[value] = len(self.values[dim])
+                self.values[dim].append(value)
+            coded.append(codes[value])
+        coded = tuple(coded)
+        if coded not in self.cell_ids:
+            self.cell_ids[coded] = len(self.cell_ids)
+            self._new_cells.append(coded)
+        return self.cell_ids[coded]
+
+    def apply(self, records=(), removed_keys=()):
+        """
+        Counts records (replacing earlier versions of the same key) and drops
+        removed_keys. Work is proportional to the number of records given.
+        Returns the number of records moved.
+        """
+        self._new_cells = []
+        delta = {}
+        moved = 0
+        for key in removed_keys:
+            old = self.record_cells.pop(key, None)
+            if old is not None:
+                delta[old] = delta.get(old, 0) - 1
+                moved += 1
+        for record in records:
+            key = record_key(record)
+            cell = self._cell(record_cell(record))
+            old = self.record_cells.get(key)
+            if old == cell:
+                continue
+            if old is not None:
+                delta[old] = delta.get(old, 0) - 1
+            delta[cell] = delta.get(cell, 0) + 1
+            self.record_cells[key] = cell
+            moved += 1
+
+        if self._new_cells:
+            self.cells = np.concatenate([self.cells, np.asarray(self._new_cells, dtype=np.int32)])
+            self.counts = np.concatenate([self.counts, np.zeros(len(self._new_cells), dtype=np.int64)])
+        if delta:
+            rows = np.fromiter(delta.keys(), dtype=np.int64, count=len(delta))
+            np.add.at(self.counts, rows, np.fromiter(delta.values(), dtype=np.int64, count=len(delta)))
+        return moved
+
+    def save(self, path):
+        # Empty cells are dropped on save, remapping the record -> cell table
+        live = np.flatnonzero(self.counts > 0)
+        remap = np.full(len(self.counts), -1, dtype=np.int32)
+        remap[live] = np.arange(len(live), dtype=np.int32)
+        keys = list(self.record_cells)
+        key_cells = remap[np.fromiter(self.record_cells.values(), dtype=np.int64, count=len(keys))]
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path, cells=self.cells[live], counts=self.counts[live].astype(np.int32),
+            keys=np.array(keys, dtype=str), key_cells=key_cells,
+            **{f"values_{dim}": np.array(values, dtype=str) for dim, values in zip(DIMENSIONS, self.values)},
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            values = [data[f"values_{dim}"].tolist() for dim in DIMENSIONS]
+            return cls(values, data["cells"], data["counts"], data["keys"].tolist(), data["key_cells"])
+
+    # -- Queries --
+
+    def total(self):
+        return int(self.counts.sum())
+
+    def _mask(self, where):
+        mask = self.counts > 0
+        for dim, wanted in (where or {}).items():
+            d = DIMENSIONS.index(dim)
+            wanted = [wanted] if isinstance(wanted, str) else wanted
+            mask &= np.isin(self.cells[:, d], [self.codes[d][v] for v in wanted if v in self.codes[d]])
+        return mask
+
+    def top_values(self, dim, where=None, limit=10):
+        """[(value, count)] of a dimension, largest first."""
+        d = DIMENSIONS.index(dim)
+        mask = self._mask(where)
+        sums = np.bincount(self.cells[mask, d], weights=self.counts[mask], minlength=len(self.values[d]))
+        order = np.flatnonzero(sums)
+        order = order[np.argsort(-sums[order], kind="stable")][:limit]
+        return [(self.values[d][i], int(sums[i])) for i in order]
+
+    def series(self, by=None, where=None, grain="month", limit=10):
+        """
+        Rolls the cube up to counts per period (month, quarter or year),
+        optionally split by one dimension (its top `limit` values, the rest
+        summed as "Other"). Returns a pandas DataFrame indexed by period.
+        """
+        import pandas as pd
+        mask = self._mask(where)
+        months = self.values[0]
+        periods = [_period(month, grain) for month in months]
+        labels = sorted(set(periods) - {UNKNOWN}) + ([UNKNOWN] if UNKNOWN in periods else [])
+        period_of_month = np.array([labels.index(p) for p in periods], dtype=np.int64)
+        rows = period_of_month[self.cells[mask, 0]] if len(months) else np.empty(0, dtype=np.int64)
+        counts = self.counts[mask]
+
+        if by is None:
+            data = {"Recalls": np.bincount(rows, weights=counts, minlength=len(labels))}
+        else:
+            d = DIMENSIONS.index(by)
+            top = [self.codes[d][value] for value, _ in self.top_values(by, where, limit)]
+            column = np.full(len(self.values[d]), len(top), dtype=np.int64)
+            column[top] = np.arange(len(top))
+            cols = column[self.cells[mask, d]]
+            n_cols = len(top) + 1
+            table = np.bincount(rows * n_cols + cols, weights=counts, minlength=len(labels) * n_cols)
+            table = table.reshape(len(labels), n_cols)
+            data = {self.values[d][code]: table[:, i] for i, code in enumerate(top)}
+            if table[:, -1].any():
+                data["Other"] = table[:, -1]
+        return pd.DataFrame(data, index=pd.Index(labels, name=grain)).astype(np.int64)
+
+
+def _period(month, grain):
+    if month == UNKNOWN or grain == "month":
+        return month
+    year, m = month.split("-")
+    return year if grain == "year" else f"{year}-Q{(int(m) - 1) // 3 + 1}"
+
+
+def build_or_update(cube_path, json_path, changeset=None):
+    """
+    Applies a changeset (dict or path) to the saved cube, or builds it from
+    the whole raw corpus. Changesets from an incremental fetch carry their
+    records, so the raw file is only scanned when they do not.
+    """
+    if isinstance(changeset, str):
+        with open(changeset, "r") as f:
+            changeset = json.load(f)
+
+    started = time.monotonic()
+    if changeset is not None and os.path.exists(cube_path):
+        cube = TrendCube.load(cube_path)
+        records = changeset.get("records")
+        if records is None:
+            keys = set(changeset.get("added", [])) | set(changeset.get("changed", []))
+            records = [r for r in iter_records(json_path) if record_key(r) in keys]
+        moved = cube.apply(records, changeset.get("removed", []))
+        print(f"Updated trend cube: {moved} records moved")
+    else:
+        cube = TrendCube()
+        cube.apply(iter_records(json_path))
+    cube.save(cube_path)
+    print(f"Trend cube at {cube_path}: {cube.total()} recalls in {int((cube.counts > 0).sum())} cells "
+          f"({time.monotonic() - started:.1f}s)")
+    return cube
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    JSON_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.jsonl")
+    CHANGESET_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.changeset.json")
+    CUBE_PATH = os.path.join(BASE_DIR, "data", "processed", "trend_cube.npz")
+
+    parser = argparse.ArgumentParser(description="Build or refresh the recall trend cube.")
+    parser.add_argument("--changed-only", action="store_true",
+                        help=f"Apply {os.path.basename(CHANGESET_PATH)} instead of rebuilding")
+    args = parser.parse_args()
+
+    build_or_update(CUBE_PATH, JSON_PATH, CHANGESET_PATH if args.changed_only else None)
@@ -0,0 +1,359 @@
+import os
+import sqlite3
+from functools import lru_cache
+from rdflib import BNode, Literal, URIRef
+from rdflib.plugin import register
+from rdflib.store import Store, VALID_STORE, NO_STORE
+from ntriples import rdf_format
+
+# Embedded, dictionary-encoded SQLite triple store.
+# Every RDF term is stored once in a terms table and triples are rows of three
+# integer IDs, clustered on (s, p, o) with (p, o, s) and (o, s, p) covering
+# indexes, so any triple pattern is answered from a single index range and
+# counts never leave SQLite. Bulk loads run in one transaction and rebuild the
+# secondary indexes once at the end instead of maintaining them row by row.
+# The class implements the rdflib Store interface and is registered as the
+# "SQLiteTriples" plugin, so Graph(store="SQLiteTriples") works as usual.
+
+BATCH_SIZE = 50000
+SQLITE_MAX_VARIABLES = 900
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS triples ("
+    " s INTEGER NOT NULL, p INTEGER NOT NULL, o INTEGER NOT NULL,"
+    " PRIMARY KEY (s, p, o)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS namespaces (prefix TEXT PRIMARY KEY, uri TEXT NOT NULL)",
+)
+INDEXES = {
+    "triples_pos": "CREATE INDEX IF NOT EXISTS triples_pos ON triples (p, o, s)",
+    "triples_osp": "CREATE INDEX IF NOT EXISTS triples_osp ON triples (o, s, p)",
+}
+
+
+def term_key(term):
+    """
+    Encodes a term as "<kind><datatype>\\0<lang>\\0<lexical form>". The lexical
+    form comes last so it may itself contain any character.
+    """
+    if isinstance(term, URIRef):
+        return "U\x00\x00" + str(term)
+    if isinstance(term, BNode):
+        return "B\x00\x00" + str(term)
+    if isinstance(term, Literal):
+        return f"L{term.datatype or ''}\x00{term.language or ''}\x00{term}"
+    raise TypeError(f"Unsupported term type: {type(term).__name__}")
+
+
+@lru_cache(maxsize=200000)
+def decode_term(key):
+    head, lang, value = key.split("\x00", 2)
+    kind = head[0]
+    if kind == "U":
+        return URIRef(value)
+    if kind == "B":
+        return BNode(value)
+    return Literal(value, lang=lang or None, datatype=URIRef(head[1:]) if len(head) > 1 else None)
+
+
+def _path(configuration):
+    """Accepts a plain file path or an SQLAlchemy-style sqlite:/// URL."""
+    if configuration.startswith("sqlite:///"):
+        return configuration[len("sqlite:///"):]
+    return configuration
+
+
+class BulkLoader:
+    """
+    Buffers triples and writes them in batches inside the store's open bulk
+    transaction. Also usable as an rdflib parser sink (triple(s, p, o)).
+    """
+
+    def __init__(self, store, batch_size=BATCH_SIZE):
+        self.store = store
+        self.batch_size = batch_size
+        self.buffer = []
+        self.count = 0
+
+    def add(self, triple):
+        self.buffer.append(triple)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def triple(self, s, p, o):
+        self.add((s, p, o))
+
+    def flush(self):
+        if self.buffer:
+            self.count += self.store._insert_batch(self.buffer)
+            self.buffer = []
+
+
+class SQLiteTripleStore(Store):
+    """
+    rdflib Store over a dictionary-encoded SQLite database. Holds a single
+    (default) graph; pattern matching and counts are done in SQL.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = True
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        self.conn = None
+        self._term_ids = {}
+        super().__init__(configuration, identifier)
+
+    # -- Lifecycle --
+
+    def open(self, configuration, create=False):
+        path = _path(configuration)
+        if not create and not os.path.exists(path):
+            return NO_STORE
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-262144")
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        for statement in INDEXES.values():
+            self.conn.execute(statement)
+        self.conn.commit()
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction=False):
+        if self.conn is not None:
+            if commit_pending_transaction:
+                self.conn.commit()
+            self.conn.close()
+            self.conn = None
+        self._term_ids = {}
+
+    def destroy(self, configuration):
+        path = _path(configuration)
+        self.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+        self._term_ids = {}
+
+    def clear(self):
+        """Drops every triple and term (namespace bindings are kept)."""
+        self.conn.execute("DELETE FROM triples")
+        self.conn.execute("DELETE FROM terms")
+        self.conn.commit()
+        self._term_ids = {}
+
+    # -- Term dictionary --
+
+    def _lookup_ids(self, keys):
+        """Returns {key: id} for the keys already in the terms table."""
+        found = {}
+        keys = [key for key in keys if key not in self._term_ids]
+        for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            chunk = keys[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(self.conn.execute(
+                f"SELECT key, id FROM terms WHERE key IN ({placeholders})", chunk))
+        self._term_ids.update(found)
+        return found
+
+    def _encode(self, terms):
+        """Maps terms to IDs, inserting the terms not seen before."""
+        keys = [term_key(term) for term in terms]
+        unique = list(dict.fromkeys(keys))
+        self._lookup_ids(unique)
+        new = [key for key in unique if key not in self._term_ids]
+        if new:
+            (next_id,) = self.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM terms").fetchone()
+            ids = range(next_id, next_id + len(new))
+            self.conn.executemany("INSERT INTO terms (id, key) VALUES (?, ?)", zip(ids, new))
+            self._term_ids.update(zip(new, ids))
+        return [self._term_ids[key] for key in keys]
+
+    def _term_id(self, term):
+        """ID of an existing term, or None if the store has never seen it."""
+        key = term_key(term)
+        if key not in self._term_ids:
+            self._lookup_ids([key])
+        return self._term_ids.get(key)
+
+    def _insert_batch(self, triples):
+        ids = self._encode([term for triple in triples for term in triple])
+        rows = zip(ids[0::3], ids[1::3], ids[2::3])
+        before = self.conn.total_changes
+        self.conn.executemany("INSERT OR IGNORE INTO triples (s, p, o) VALUES (?, ?, ?)", rows)
+        return self.conn.total_changes - before
+
+    # -- Writes --
+
+    def add(self, triple, context=None, quoted=False):
+        Store.add(self, triple, context, quoted)
+        self._insert_batch([triple])
+
+    def addN(self, quads):
+        loader = BulkLoader(self)
+        for s, p, o, _ in quads:
+            loader.add((s, p, o))
+        loader.flush()
+
+    def remove(self, triple_pattern, context=None):
+        Store.remove(self, triple_pattern, context)
+        where, params = self._where(triple_pattern)
+        if where is None:
+            return
+        self.conn.execute(f"DELETE FROM triples AS t{where}", params)
+
+    def bulk_load(self, triples, batch_size=BATCH_SIZE, defer_indexes=None):
+        """
+        Loads an iterable of triples in one transaction. With defer_indexes
+        (the default for an empty store) the POS/OSP indexes are dropped first
+        and rebuilt once at the end. Returns the number of new triples.
+        """
+        with self.bulk(batch_size, defer_indexes) as loader:
+            for triple in triples:
+                loader.add(triple)
+        return loader.count
+
+    def bulk(self, batch_size=BATCH_SIZE, defer_indexes=None):
+        """Context manager yielding a BulkLoader; commits (or rolls back) on exit."""
+        return _BulkTransaction(self, batch_size, defer_indexes)
+
+    def load_file(self, path, batch_size=BATCH_SIZE):
+        """
+        Bulk loads an RDF file. N-Triples is streamed straight into the loader;
+        other formats are read through the parsed-graph cache.
+        """
+        with self.bulk(batch_size) as loader:
+            if rdf_format(path) == "nt":
+                from rdflib.plugins.parsers.ntriples import W3CNTriplesParser
+                with open(path, "rb") as f:
+                    W3CNTriplesParser(sink=loader).parse(f)
+            else:
+                from graph_cache import load_view
+                for triple in load_view(path):
+                    loader.add(triple)
+        return loader.count
+
+    # -- Reads --
+
+    def _where(self, triple_pattern):
+        """
+        SQL WHERE clause for a pattern. Returns (None, None) if a bound term is
+        not in the dictionary, i.e. nothing can match.
+        """
+        clauses, params = [], []
+        for column, term in zip("spo", triple_pattern):
+            if term is None:
+                continue
+            term_id = self._term_id(term)
+            if term_id is None:
+                return None, None
+            clauses.append(f"t.{column} = ?")
+            params.append(term_id)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def triples(self, triple_pattern, context=None):
+        where, params = self._where(triple_pattern)
+        if where is None:
+            return
+        rows = self.conn.execute(
+            "SELECT ts.key, tp.key, tobj.key FROM triples AS t"
+            " JOIN terms AS ts ON ts.id = t.s"
+            " JOIN terms AS tp ON tp.id = t.p"
+            f" JOIN terms AS tobj ON tobj.id = t.o{where}", params)
+        for s, p, o in rows:
+            yield (decode_term(s), decode_term(p), decode_term(o)), iter(())
+
+    def count(self, triple_pattern=(None, None, None)):
+        """Number of triples matching a pattern, computed in SQL."""
+        where, params = self._where(triple_pattern)
+        if where is None:
+            return 0
+        return self.conn.execute(f"SELECT COUNT(*) FROM triples AS t{where}", params).fetchone()[0]
+
+    def __len__(self, context=None):
+        return self.count()
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    # -- Namespaces --
+
+    def bind(self, prefix, namespace, override=True):
+        if not override:
+            if self.namespace(prefix) is not None or self.prefix(namespace) is not None:
+                return
+        self.conn.execute("DELETE FROM namespaces WHERE uri = ?", (str(namespace),))
+        self.conn.execute("INSERT OR REPLACE INTO namespaces (prefix, uri) VALUES (?, ?)",
+                          (prefix, str(namespace)))
+
+    def namespace(self, prefix):
+        row = self.conn.execute("SELECT uri FROM namespaces WHERE prefix = ?", (prefix,)).fetchone()
+        return URIRef(row[0]) if row else None
+
+    def prefix(self, namespace):
+        row = self.conn.execute("SELECT prefix FROM namespaces WHERE uri = ?", (str(namespace),)).fetchone()
+        return row[0] if row else None
+
+    def namespaces(self):
+        for prefix, uri in self.conn.execute("SELECT prefix, uri FROM namespaces").fetchall():
+            yield prefix, URIRef(uri)
+
+
+class _BulkTransaction:
+    def __init__(self, store, batch_size, defer_indexes):
+        self.store = store
+        self.loader = BulkLoader(store, batch_size)
+        self.defer_indexes = defer_indexes
+
+    def __enter__(self):
+        conn = self.store.conn
+        conn.commit()
+        if self.defer_indexes is None:
+            self.defer_indexes = conn.execute("SELECT 1 FROM triples LIMIT 1").fetchone() is None
+        conn.execute("BEGIN")
+        if self.defer_indexes:
+            for name in INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {name}")
+        return self.loader
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self.store.conn
+        if exc_type is not None:
+            conn.rollback()
+            self.store._term_ids = {}
+            return False
+        self.loader.flush()
+        if self.defer_indexes:
+            for statement in INDEXES.values():
+                conn.execute(statement)
+        conn.commit()
+        conn.execute("ANALYZE")
+        return False
+
+
+register("SQLiteTriples", Store, "triple_store", "SQLiteTripleStore")
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    DB_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_graph.db")
+
+    if os.path.exists(DB_PATH):
+        store = SQLiteTripleStore()
+        store.open(DB_PATH)
+        (terms,) = store.conn.execute("SELECT COUNT(*) FROM terms").fetchone()
+        print(f"{DB_PATH}: {len(store)} triples, {terms} terms")
+        store.close()
+    else:
+        print(f"No triple store at {DB_PATH}")
@@ -1,30 +1,130 @@
 import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pyshacl import validate
-from rdflib import Graph
+from rdflib import Graph, Literal, Namespace, URIRef
+from rdflib.namespace import RDF, RDFS, SH, XSD
+from graph_cache import load_graph
 
-def validate_graph(data_graph_path, shapes_graph_path):
+EX = Namespace("http://example.org/resource/")
+
+# Constraint components the native checker implements. Shapes using anything
+# else (or property paths other than a plain predicate) go through pyshacl.
+NATIVE_PARAMETERS = {SH.path, SH.minCount, SH.maxCount, SH.datatype, SH.message, SH.name, SH.description}
+NATIVE_SHAPE_PARAMETERS = {RDF.type, SH.targetClass, SH.property, SH.name, SH.description, SH.message}
+WORKERS = 1
+
+def compile_shapes(shapes_graph):
     """
-    Validates the data graph against the SHACL shapes.
+    Compiles node shapes made only of minCount/maxCount/datatype property
+    constraints on plain predicates into a list of dicts for the native checker.
+    Returns None if any shape needs the full SHACL engine.
     """
-    if not os.path.exists(data_graph_path):
-        print(f"Data file not found: {data_graph_path}")
-        return False
-        
-    if not os.path.exists(shapes_graph_path):
-        print(f"Shapes file not found: {shapes_graph_path}")
+    compiled = []
+    for shape in set(shapes_graph.subjects(RDF.type, SH.NodeShape)):
+        if set(shapes_graph.predicates(shape, None)) - NATIVE_SHAPE_PARAMETERS:
+            return None
+        properties = []
+        for prop in shapes_graph.objects(shape, SH.property):
+            if set(shapes_graph.predicates(prop, None)) - NATIVE_PARAMETERS:
+                return None
+            path = shapes_graph.value(prop, SH.path)
+            if not isinstance(path, URIRef):
+                return None
+            min_count = shapes_graph.value(prop, SH.minCount)
+            max_count = shapes_graph.value(prop, SH.maxCount)
+            properties.append({
+                "path": path,
+                "min_count": int(min_count) if min_count is not None else None,
+                "max_count": int(max_count) if max_count is not None else None,
+                "datatype": shapes_graph.value(prop, SH.datatype),
+                "message": shapes_graph.value(prop, SH.message),
+            })
+        compiled.append({
+            "shape": shape,
+            "target_classes": list(shapes_graph.objects(shape, SH.targetClass)),
+            "properties": properties,
+        })
+    return compiled
+
+def _subclasses(data_graph, cls):
+    """cls and its rdfs:subClassOf descendants, as seen by pyshacl's rdfs inference."""
+    found = {cls}
+    frontier = [cls]
+    while frontier:
+        for sub in data_graph.subjects(RDFS.subClassOf, frontier.pop()):
+            if sub not in found:
+                found.add(sub)
+                frontier.append(sub)
+    return found
+
+def _datatype_ok(value, datatype):
+    if not isinstance(value, Literal):
         return False
+    actual = value.datatype
+    if actual is None:
+        actual = RDF.langString if value.language else XSD.string
+    return actual == datatype and not getattr(value, "ill_typed", False)
 
-    print(f"Loading data graph: {data_graph_path}")
-    data_graph = Graph()
-    data_graph.parse(data_graph_path, format="turtle")
+def _result(focus, path, component, message, value=None, shape=None):
+    return {
+        "focus_node": str(focus),
+        "path": str(path),
+        "constraint": component,
+        "message": str(message) if message is not None else None,
+        "value": value.n3() if value is not None else None,
+        "shape": str(shape) if shape is not None else None,
+    }
 
-    print(f"Loading shapes graph: {shapes_graph_path}")
-    # Shapes are loaded automatically by pyshacl if passed as string path, 
-    # but loading into Graph ensures parsing is correct first.
-    shapes_graph = Graph()
-    shapes_graph.parse(shapes_graph_path, format="turtle")
+def native_validate(data_graph, compiled, focus_nodes=None):
+    """
+    Checks compiled shapes directly against the graph indexes.
+    Only nodes in focus_nodes are checked when it is given. Returns (focus count, results).
+    """
+    results = []
+    checked = 0
+    for spec in compiled:
+        targets = set()
+        for cls in spec["target_classes"]:
+            for sub in _subclasses(data_graph, cls):
+                targets.update(data_graph.subjects(RDF.type, sub))
+        if focus_nodes is not None:
+            targets &= focus_nodes
+        checked += len(targets)
 
-    print("Running validation...")
+        for focus in targets:
+            for prop in spec["properties"]:
+                values = set(data_graph.objects(focus, prop["path"]))
+                if prop["min_count"] is not None and len(values) < prop["min_count"]:
+                    results.append(_result(focus, prop["path"], "minCount", prop["message"], shape=spec["shape"]))
+                if prop["max_count"] is not None and len(values) > prop["max_count"]:
+                    results.append(_result(focus, prop["path"], "maxCount", prop["message"], shape=spec["shape"]))
+                if prop["datatype"] is not None:
+                    for value in values:
+                        if not _datatype_ok(value, prop["datatype"]):
+                            results.append(_result(focus, prop["path"], "datatype", prop["message"],
+                                                   value, spec["shape"]))
+    return checked, results
+
+def _report_results(results_graph):
+    """Turns a pyshacl results graph into the same dicts as native_validate."""
+    results = []
+    for node in results_graph.subjects(RDF.type, SH.ValidationResult):
+        component = str(results_graph.value(node, SH.sourceConstraintComponent)).split("#")[-1]
+        component = component.replace("ConstraintComponent", "")
+        component = component[:1].lower() + component[1:]
+        results.append(_result(
+            results_graph.value(node, SH.focusNode),
+            results_graph.value(node, SH.resultPath),
+            component,
+            results_graph.value(node, SH.resultMessage),
+            results_graph.value(node, SH.value),
+            results_graph.value(node, SH.sourceShape) if isinstance(results_graph.value(node, SH.sourceShape), URIRef) else None,
+        ))
+    return results
+
+def _pyshacl(data_graph, shapes_graph):
     conforms, results_graph, results_text = validate(
         data_graph,
         shacl_graph=shapes_graph,
@@ -33,18 +133,164 @@ def validate_graph(data_graph_path, shapes_graph_path):
         meta_shacl=False,
         debug=False
     )
+    return conforms, _report_results(results_graph), results_text
+
+def focus_subgraph(data_graph, focus_nodes):
+    """
+    The part of the graph a focus node's validation can see: its own triples,
+    the types of the nodes it points to, and the class hierarchy.
+    """
+    sub = Graph()
+    for focus in focus_nodes:
+        for p, o in data_graph.predicate_objects(focus):
+            sub.add((focus, p, o))
+            if isinstance(o, URIRef):
+                for cls in data_graph.objects(o, RDF.type):
+                    sub.add((o, RDF.type, cls))
+    for triple in data_graph.triples((None, RDFS.subClassOf, None)):
+        sub.add(triple)
+    return sub
+
+def _pyshacl_shard(args):
+    """Worker: validates one serialized shard with pyshacl."""
+    data_nt, shapes_ttl = args
+    data_graph = Graph().parse(data=data_nt, format="nt")
+    shapes_graph = Graph().parse(data=shapes_ttl, format="turtle")
+    _, results, _ = _pyshacl(data_graph, shapes_graph)
+    return results
+
+def sharded_pyshacl(data_graph, shapes_graph, focus_nodes, workers):
+    """Runs pyshacl over focus-node shards in worker processes."""
+    focus_nodes = sorted(focus_nodes)
+    shapes_ttl = shapes_graph.serialize(format="turtle")
+    size = max(1, -(-len(focus_nodes) // workers))
+    shards = [
+        (focus_subgraph(data_graph, focus_nodes[i:i + size]).serialize(format="nt"), shapes_ttl)
+        for i in range(0, len(focus_nodes), size)
+    ]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for shard_results in pool.map(_pyshacl_shard, shards):
+            results.extend(shard_results)
+    return results
 
+def changeset_focus_nodes(changeset):
+    """Focus nodes (event URIs) of the added and changed records in an ingestion changeset."""
+    if isinstance(changeset, str):
+        with open(changeset, "r") as f:
+            changeset = json.load(f)
+    keys = changeset.get("added", []) + changeset.get("changed", [])
+    return {EX[f"event/{key.split('|')[0]}"] for key in keys}
+
+def _result_key(result):
+    return (result["focus_node"], result["path"], result["constraint"], result["value"])
+
+def validate_graph(data_graph_path, shapes_graph_path, changeset=None, engine="auto", workers=WORKERS,
+                   cross_check=False, report_path=None):
+    """
+    Validates the data graph against the SHACL shapes.
+    data_graph_path may also be an already loaded rdflib Graph.
+
+    changeset (a dict or the ingestion changeset file) restricts validation to
+    the focus nodes of added/changed records. engine is "native" (compiled
+    checker for simple cardinality/datatype shapes), "pyshacl" or "auto" (native
+    when the shapes allow it). workers > 1 shards pyshacl by focus node across
+    processes. cross_check also runs pyshacl and fails on any disagreement.
+    A machine-readable report is written to report_path when given.
+    """
+    if not isinstance(data_graph_path, Graph) and not os.path.exists(data_graph_path):
+        print(f"Data file not found: {data_graph_path}")
+        return False
+
+    if not os.path.exists(shapes_graph_path):
+        print(f"Shapes file not found: {shapes_graph_path}")
+        return False
+
+    if isinstance(data_graph_path, Graph):
+        data_graph = data_graph_path
+    else:
+        print(f"Loading data graph: {data_graph_path}")
+        data_graph = load_graph(data_graph_path)
+
+    print(f"Loading shapes graph: {shapes_graph_path}")
+    # Shapes are loaded automatically by pyshacl if passed as string path,
+    # but loading into Graph ensures parsing is correct first.
+    shapes_graph = load_graph(shapes_graph_path, format="turtle")
+
+    focus_nodes = changeset_focus_nodes(changeset) if changeset is not None else None
+    compiled = compile_shapes(shapes_graph) if engine in ("auto", "native") else None
+    if engine == "native" and compiled is None:
+        print("Shapes use constraints the native checker does not support; falling back to pyshacl.")
+
+    print("Running validation...")
+    results_text = None
+    if compiled is not None:
+        used = "native"
+        checked, results = native_validate(data_graph, compiled, focus_nodes)
+    else:
+        used = "pyshacl"
+        if focus_nodes is None and workers <= 1:
+            _, results, results_text = _pyshacl(data_graph, shapes_graph)
+            checked = None
+        else:
+            targets = focus_nodes
+            if targets is None:
+                targets = {s for s in data_graph.subjects(RDF.type, None) if isinstance(s, URIRef)}
+            checked = len(targets)
+            if workers > 1:
+                results = sharded_pyshacl(data_graph, shapes_graph, targets, workers)
+            else:
+                _, results, results_text = _pyshacl(focus_subgraph(data_graph, targets), shapes_graph)
+    conforms = not results
+
+    report = {"conforms": conforms, "engine": used, "focus_nodes": checked, "results": results}
+    if cross_check and used == "native":
+        graph = data_graph if focus_nodes is None else focus_subgraph(data_graph, focus_nodes)
+        _, reference, _ = _pyshacl(graph, shapes_graph)
+        native_keys = sorted(map(_result_key, results))
+        reference_keys = sorted(map(_result_key, reference))
+        report["cross_check"] = native_keys == reference_keys
+        if not report["cross_check"]:
+            print(f"Cross-check FAILED: native found {len(results)} results, pyshacl {len(reference)}")
+            conforms = report["conforms"] = False
+        else:
+            print("Cross-check OK: native checker agrees with pyshacl.")
+
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Validation report written to {report_path}")
+
+    scope = f"{checked} focus nodes" if checked is not None else "full graph"
     if conforms:
-        print("Validation SUCCESS: Data conforms to SHACL shapes.")
+        print(f"Validation SUCCESS: Data conforms to SHACL shapes ({used}, {scope}).")
     else:
-        print("Validation FAILED:")
-        print(results_text)
-    
+        print(f"Validation FAILED ({used}, {scope}):")
+        if results_text:
+            print(results_text)
+        else:
+            for result in results[:50]:
+                print(f"  {result['focus_node']} {result['path']} {result['constraint']}: {result['message']}")
+            if len(results) > 50:
+                print(f"  ... {len(results) - 50} more")
+
     return conforms
 
 if __name__ == "__main__":
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    DATA_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.ttl")
+    DATA_PATH = os.path.join(BASE_DIR, "data", "processed", "fda_knowledge_graph.nt")
     SHAPES_PATH = os.path.join(BASE_DIR, "data", "shapes", "fda_shapes.ttl")
+    CHANGESET_PATH = os.path.join(BASE_DIR, "data", "raw", "fda_quality_events.changeset.json")
+
+    parser = argparse.ArgumentParser(description="Validate the knowledge graph against the SHACL shapes.")
+    parser.add_argument("--changed-only", action="store_true",
+                        help=f"Only validate records in {os.path.basename(CHANGESET_PATH)}")
+    parser.add_argument("--engine", choices=["auto", "native", "pyshacl"], default="auto")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Processes for sharded pyshacl runs")
+    parser.add_argument("--cross-check", action="store_true", help="Compare the native checker with pyshacl")
+    parser.add_argument("--report", help="Write a JSON validation report to this path")
+    args = parser.parse_args()
 
-    validate_graph(DATA_PATH, SHAPES_PATH)
+    validate_graph(DATA_PATH, SHAPES_PATH, changeset=CHANGESET_PATH if args.changed_only else None,
+                   engine=args.engine, workers=args.workers, cross_check=args.cross_check,
+                   report_path=args.report)